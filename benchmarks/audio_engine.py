@@ -0,0 +1,107 @@
+"""
+Wall time and peak memory of the audio edits as the input gets longer, streaming ffmpeg
+engine against pydub.
+
+Generates stereo 44.1 kHz WAV and MP3 test files of each length with ffmpeg's lavfi
+sources (a tone over noise), then runs each audio operation in a fresh interpreter per
+case. The streaming engine's peak memory should stay flat; pydub's grows by about 10 MB per
+minute of decoded audio.
+
+    python benchmarks/audio_engine.py --minutes 1 10 60 --engines ffmpeg pydub
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHILD = """
+import sys, json, time, resource
+sys.path.insert(0, {root!r})
+from utils.conversions import run_conversion
+start = time.perf_counter()
+run_conversion({conversion!r}, {input!r}, {output!r}, {options!r})
+# ffmpeg runs as a child process: its peak counts too
+rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+print(json.dumps({{'seconds': time.perf_counter() - start,
+                  'rss_mb': rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)}}))
+"""
+
+
+def cases(work, seconds):
+    mp3 = os.path.join(work, 'input.mp3')
+    return [
+        ('wav_to_mp3', 'input.wav', 'output.mp3', {}),
+        ('mp3_to_wav', 'input.mp3', 'output.wav', {}),
+        ('trim_audio', 'input.mp3', 'trimmed.mp3', {'start_time': seconds / 4, 'end_time': seconds * 3 / 4}),
+        ('change_speed', 'input.mp3', 'faster.mp3', {'speed_factor': 1.5}),
+        ('merge_audio_files', f'input.mp3;{mp3}', 'merged.mp3', {}),
+        ('remove_noise', 'input.wav', 'denoised.wav', {'noise_reduction_amount': 20}),
+    ]
+
+
+def make_fixtures(work, seconds):
+    from converters.ffmpeg_engine import ffmpeg_binary
+
+    ffmpeg = ffmpeg_binary()
+    if not ffmpeg:
+        sys.exit("This benchmark needs ffmpeg on PATH (or imageio-ffmpeg installed).")
+    wav = os.path.join(work, 'input.wav')
+    subprocess.run([ffmpeg, '-v', 'error', '-y',
+                    '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+                    '-f', 'lavfi', '-i', f'anoisesrc=duration={seconds}:amplitude=0.02',
+                    '-filter_complex', '[0][1]amix=inputs=2,aformat=channel_layouts=stereo',
+                    '-ar', '44100', wav], check=True)
+    subprocess.run([ffmpeg, '-v', 'error', '-y', '-i', wav, '-c:a', 'libmp3lame', '-q:a', '2',
+                    os.path.join(work, 'input.mp3')], check=True)
+
+
+def measure(conversion, input_path, output_path, options):
+    code = CHILD.format(root=ROOT, conversion=conversion, input=input_path, output=output_path, options=options)
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else f'exit code {result.returncode}'}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    if sys.platform == 'win32':
+        sys.exit("This benchmark reads peak RSS with the resource module, which Windows does not have.")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--minutes', type=float, nargs='+', default=[1, 5, 20], help="Lengths of the test files")
+    parser.add_argument('--engines', nargs='+', default=['ffmpeg', 'pydub'])
+    parser.add_argument('--json', dest='json_path', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'operation':<19}{'engine':<8}{'minutes':>8}{'seconds':>10}{'peak RSS MB':>13}")
+    for minutes in args.minutes:
+        seconds = int(minutes * 60)
+        with tempfile.TemporaryDirectory() as work:
+            make_fixtures(work, seconds)
+            for conversion, source, target, options in cases(work, seconds):
+                input_path = ';'.join(os.path.join(work, path) for path in source.split(';'))
+                for engine in args.engines:
+                    run_options = dict(options, engine='pydub') if engine == 'pydub' else options
+                    name, ext = os.path.splitext(target)
+                    result = measure(conversion, input_path, os.path.join(work, f"{name}-{engine}{ext}"), run_options)
+                    result.update(conversion=conversion, engine=engine, minutes=minutes)
+                    results.append(result)
+                    if 'error' in result:
+                        print(f"{conversion:<19}{engine:<8}{minutes:>8g}  failed: {result['error']}")
+                    else:
+                        print(f"{conversion:<19}{engine:<8}{minutes:>8g}{result['seconds']:>10.2f}"
+                              f"{result['rss_mb']:>13.1f}")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'time': time.time(), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Wall time and peak memory of the video edits, ffmpeg engine against moviepy.
+
+Generates a test clip with ffmpeg's lavfi sources (H.264 + AAC, a keyframe every two
+seconds), then runs each video operation twice in a fresh interpreter: once with the
+default ffmpeg engine and once with engine=moviepy. The trim starts on a keyframe, so the
+ffmpeg engine stream copies it.
+
+    python benchmarks/ffmpeg_engine.py --seconds 60 --size 1920x1080
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHILD = """
+import sys, json, time, resource
+sys.path.insert(0, {root!r})
+from utils.conversions import run_conversion
+start = time.perf_counter()
+run_conversion({conversion!r}, {input!r}, {output!r}, {options!r})
+# ffmpeg runs as a child process: its peak counts too
+rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+print(json.dumps({{'seconds': time.perf_counter() - start,
+                  'rss_mb': rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)}}))
+"""
+
+
+def cases(work, seconds):
+    middle = 2 * (seconds // 4)  # On a keyframe (one every 2 seconds)
+    return [
+        ('trim_video', 'clip.mp4', 'trimmed.mp4', {'start_time': middle, 'end_time': seconds}),
+        ('remove_sound', 'clip.mp4', 'silent.mp4', {}),
+        ('change_resolution', 'clip.mp4', 'small.mp4', {'new_resolution': (640, 360)}),
+        ('add_audio', 'clip.mp4', 'dubbed.mp4', {'audio_path': os.path.join(work, 'tone.mp3')}),
+        ('mp4_to_mp3', 'clip.mp4', 'audio.mp3', {}),
+        ('mp4_to_avi', 'clip.mp4', 'clip.avi', {}),
+        ('avi_to_mp4', 'clip.avi', 'remuxed.mp4', {}),
+    ]
+
+
+def make_fixtures(work, seconds, size):
+    from converters.ffmpeg_engine import ffmpeg_binary
+
+    ffmpeg = ffmpeg_binary()
+    if not ffmpeg:
+        sys.exit("This benchmark needs ffmpeg on PATH (or imageio-ffmpeg installed).")
+    subprocess.run([ffmpeg, '-v', 'error', '-y',
+                    '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate=30:duration={seconds}',
+                    '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+                    '-c:v', 'libx264', '-preset', 'veryfast', '-g', '60', '-pix_fmt', 'yuv420p',
+                    '-c:a', 'aac', os.path.join(work, 'clip.mp4')], check=True)
+    subprocess.run([ffmpeg, '-v', 'error', '-y', '-f', 'lavfi', '-i', f'sine=frequency=220:duration={seconds}',
+                    '-c:a', 'libmp3lame', os.path.join(work, 'tone.mp3')], check=True)
+
+
+def measure(conversion, input_path, output_path, options):
+    code = CHILD.format(root=ROOT, conversion=conversion, input=input_path, output=output_path, options=options)
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else f'exit code {result.returncode}'}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    if sys.platform == 'win32':
+        sys.exit("This benchmark reads peak RSS with the resource module, which Windows does not have.")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=int, default=30, help="Length of the test clip")
+    parser.add_argument('--size', default='1280x720', help="Frame size of the test clip")
+    parser.add_argument('--engines', nargs='+', default=['ffmpeg', 'moviepy'])
+    parser.add_argument('--json', dest='json_path', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'operation':<19}{'engine':<9}{'seconds':>10}{'peak RSS MB':>13}")
+    with tempfile.TemporaryDirectory() as work:
+        make_fixtures(work, args.seconds, args.size)
+        for conversion, source, target, options in cases(work, args.seconds):
+            for engine in args.engines:
+                input_path = os.path.join(work, source)
+                if not os.path.exists(input_path):
+                    continue
+                run_options = dict(options, engine='moviepy') if engine == 'moviepy' else options
+                output_path = os.path.join(work, target)
+                if engine == 'moviepy':
+                    name, ext = os.path.splitext(target)
+                    output_path = os.path.join(work, f"{name}-moviepy{ext}")
+                result = measure(conversion, input_path, output_path, run_options)
+                result.update(conversion=conversion, engine=engine)
+                results.append(result)
+                if 'error' in result:
+                    print(f"{conversion:<19}{engine:<9}  failed: {result['error']}")
+                else:
+                    print(f"{conversion:<19}{engine:<9}{result['seconds']:>10.2f}{result['rss_mb']:>13.1f}")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'seconds': args.seconds, 'size': args.size, 'time': time.time(), 'results': results}, f,
+                      indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Encode time, output size and peak memory of mp4_to_gif as clips get longer.
+
+Generates test clips of each length with ffmpeg's lavfi sources and converts them to GIF
+(and animated WebP) in a fresh interpreter per case. Peak memory of the ffmpeg engine
+should stay flat as the clip grows; with engine=moviepy it grows with the frame count.
+
+    python benchmarks/gif_engine.py --seconds 10 60 300 --max-width 480 --engines ffmpeg moviepy
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHILD = """
+import sys, json, time, resource
+sys.path.insert(0, {root!r})
+from utils.conversions import run_conversion
+start = time.perf_counter()
+run_conversion('mp4_to_gif', {input!r}, {output!r}, {options!r})
+# ffmpeg runs as a child process: its peak counts too
+rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+print(json.dumps({{'seconds': time.perf_counter() - start,
+                  'rss_mb': rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)}}))
+"""
+
+
+def make_clip(path, seconds, size):
+    from converters.ffmpeg_engine import ffmpeg_binary
+
+    ffmpeg = ffmpeg_binary()
+    if not ffmpeg:
+        sys.exit("This benchmark needs ffmpeg on PATH (or imageio-ffmpeg installed).")
+    subprocess.run([ffmpeg, '-v', 'error', '-y',
+                    '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate=30:duration={seconds}',
+                    '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', path], check=True)
+
+
+def measure(input_path, output_path, options):
+    code = CHILD.format(root=ROOT, input=input_path, output=output_path, options=options)
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else f'exit code {result.returncode}'}
+    result = json.loads(result.stdout.strip().splitlines()[-1])
+    result['output_mb'] = os.path.getsize(output_path) / (1024 * 1024)
+    return result
+
+
+def main():
+    if sys.platform == 'win32':
+        sys.exit("This benchmark reads peak RSS with the resource module, which Windows does not have.")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=int, nargs='+', default=[10, 30, 90], help="Clip lengths")
+    parser.add_argument('--size', default='1280x720', help="Frame size of the test clips")
+    parser.add_argument('--max-width', type=int, default=480)
+    parser.add_argument('--fps', type=float, default=12)
+    parser.add_argument('--engines', nargs='+', default=['ffmpeg', 'webp', 'moviepy'])
+    parser.add_argument('--json', dest='json_path', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    engines = {
+        'ffmpeg': ({'fps': args.fps, 'max_width': args.max_width}, '.gif'),
+        'webp': ({'fps': args.fps, 'max_width': args.max_width, 'format': 'webp'}, '.webp'),
+        'moviepy': ({'engine': 'moviepy'}, '.gif'),
+    }
+    results = []
+    print(f"{'engine':<9}{'clip s':>8}{'seconds':>10}{'output MB':>11}{'peak RSS MB':>13}")
+    with tempfile.TemporaryDirectory() as work:
+        for seconds in args.seconds:
+            clip = os.path.join(work, f'clip{seconds}.mp4')
+            make_clip(clip, seconds, args.size)
+            for engine in args.engines:
+                options, ext = engines[engine]
+                result = measure(clip, os.path.join(work, f'clip{seconds}-{engine}{ext}'), options)
+                result.update(engine=engine, clip_seconds=seconds)
+                results.append(result)
+                if 'error' in result:
+                    print(f"{engine:<9}{seconds:>8}  failed: {result['error']}")
+                else:
+                    print(f"{engine:<9}{seconds:>8}{result['seconds']:>10.2f}{result['output_mb']:>11.2f}"
+                          f"{result['rss_mb']:>13.1f}")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'size': args.size, 'max_width': args.max_width, 'fps': args.fps, 'time': time.time(),
+                       'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
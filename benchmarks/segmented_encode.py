@@ -0,0 +1,97 @@
+"""
+Speedup of segmented (parallel) video encoding over a single ffmpeg encode.
+
+Generates a test clip with ffmpeg's lavfi sources (H.264 + AAC, a keyframe every two
+seconds), then runs each re-encoding conversion once as a single encode and once for every
+segment count given, in a fresh interpreter each time. Speedups are relative to the
+single encode; the gain depends on how many cores the machine has.
+
+    python benchmarks/segmented_encode.py --seconds 300 --size 1920x1080 --segments 4 8 16
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHILD = """
+import sys, json, time
+sys.path.insert(0, {root!r})
+from utils.conversions import run_conversion
+start = time.perf_counter()
+run_conversion({conversion!r}, {input!r}, {output!r}, {options!r})
+print(json.dumps({{'seconds': time.perf_counter() - start}}))
+"""
+
+CASES = [
+    ('change_resolution', 'clip.mp4', 'small.mp4', {'new_resolution': (640, 360)}),
+    ('mp4_to_avi', 'clip.mp4', 'clip.avi', {}),
+    ('gif_to_mp4', 'clip.gif', 'from_gif.mp4', {}),
+]
+
+
+def make_fixtures(work, seconds, size):
+    from converters.ffmpeg_engine import ffmpeg_binary
+
+    ffmpeg = ffmpeg_binary()
+    if not ffmpeg:
+        sys.exit("This benchmark needs ffmpeg on PATH (or imageio-ffmpeg installed).")
+    subprocess.run([ffmpeg, '-v', 'error', '-y',
+                    '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate=30:duration={seconds}',
+                    '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+                    '-c:v', 'libx264', '-preset', 'veryfast', '-g', '60', '-pix_fmt', 'yuv420p',
+                    '-c:a', 'aac', os.path.join(work, 'clip.mp4')], check=True)
+    subprocess.run([ffmpeg, '-v', 'error', '-y',
+                    '-f', 'lavfi', '-i', f'testsrc=size=480x270:rate=15:duration={seconds}',
+                    os.path.join(work, 'clip.gif')], check=True)
+
+
+def measure(conversion, input_path, output_path, options):
+    code = CHILD.format(root=ROOT, conversion=conversion, input=input_path, output=output_path, options=options)
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else f'exit code {result.returncode}'}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=int, default=120, help="Length of the test clips")
+    parser.add_argument('--size', default='1280x720', help="Frame size of the MP4 test clip")
+    parser.add_argument('--segments', type=int, nargs='+', default=[os.cpu_count() or 1])
+    parser.add_argument('--json', dest='json_path', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'conversion':<19}{'segments':>9}{'seconds':>10}{'speedup':>9}")
+    with tempfile.TemporaryDirectory() as work:
+        make_fixtures(work, args.seconds, args.size)
+        for conversion, source, target, options in CASES:
+            baseline = None
+            for segments in [1] + [n for n in args.segments if n > 1]:
+                run_options = dict(options, segments=segments, workers=segments) if segments > 1 else options
+                name, ext = os.path.splitext(target)
+                result = measure(conversion, os.path.join(work, source),
+                                 os.path.join(work, f"{name}-{segments}{ext}"), run_options)
+                result.update(conversion=conversion, segments=segments)
+                results.append(result)
+                if 'error' in result:
+                    print(f"{conversion:<19}{segments:>9}  failed: {result['error']}")
+                    continue
+                baseline = baseline or result['seconds']
+                result['speedup'] = baseline / result['seconds']
+                print(f"{conversion:<19}{segments:>9}{result['seconds']:>10.2f}{result['speedup']:>8.2f}x")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'seconds': args.seconds, 'size': args.size, 'cpus': os.cpu_count(), 'time': time.time(),
+                       'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
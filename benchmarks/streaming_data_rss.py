@@ -0,0 +1,94 @@
+"""
+Peak memory of the data conversions as the input grows.
+
+Generates CSV inputs of increasing size, then runs csv_to_json, json_to_csv and the other
+data conversions on them, each in a fresh interpreter so its peak RSS is measured on its
+own. With --stream the StreamingDataConverter variant should stay flat; without it the
+in-memory MiscConverter grows with the input.
+
+    python benchmarks/streaming_data_rss.py --rows 100000 1000000 5000000 --stream
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import sys, json, time, resource
+sys.path.insert(0, {root!r})
+from utils.conversions import run_conversion
+start = time.perf_counter()
+run_conversion({conversion!r}, {input!r}, {output!r}, {options!r})
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'seconds': time.perf_counter() - start,
+                  'rss_mb': rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)}}))
+"""
+
+# Each step converts the output of an earlier one, so a single generated CSV feeds them all
+STEPS = [
+    ('csv_to_json', 'input.csv', 'records.json'),
+    ('json_to_csv', 'records.json', 'roundtrip.csv'),
+    ('json_to_xml', 'records.json', 'records.xml'),
+    ('xml_to_json', 'records.xml', 'from_xml.json'),
+    ('json_to_yaml', 'records.json', 'records.yaml'),
+]
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'timestamp', 'user', 'event', 'value', 'message'])
+        for i in range(rows):
+            writer.writerow([i, 1700000000 + i, f'user{i % 9973}', ('view', 'click', 'buy')[i % 3],
+                             i * 0.37, f'record {i} with some free text, quoted "like this"'])
+
+
+def measure(conversion, input_path, output_path, options):
+    code = CHILD.format(root=ROOT, conversion=conversion, input=input_path, output=output_path, options=options)
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        return {'error': result.stderr.strip().splitlines()[-1]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    if sys.platform == 'win32':
+        sys.exit("This benchmark reads peak RSS with the resource module, which Windows does not have.")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--stream', action='store_true', help="Use the streaming variant (stream=True)")
+    parser.add_argument('--json', dest='json_path', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    options = {'stream': True} if args.stream else {}
+    results = []
+    print(f"{'conversion':<14}{'rows':>10}{'input MB':>10}{'seconds':>10}{'peak RSS MB':>13}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as work:
+            write_csv(os.path.join(work, 'input.csv'), rows)
+            for conversion, source, target in STEPS:
+                input_path = os.path.join(work, source)
+                if not os.path.exists(input_path):
+                    continue
+                size_mb = os.path.getsize(input_path) / (1024 * 1024)
+                result = measure(conversion, input_path, os.path.join(work, target), options)
+                result.update(conversion=conversion, rows=rows, input_mb=size_mb)
+                results.append(result)
+                if 'error' in result:
+                    print(f"{conversion:<14}{rows:>10}{size_mb:>10.1f}  failed: {result['error']}")
+                else:
+                    print(f"{conversion:<14}{rows:>10}{size_mb:>10.1f}{result['seconds']:>10.2f}"
+                          f"{result['rss_mb']:>13.1f}")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'stream': args.stream, 'time': time.time(), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
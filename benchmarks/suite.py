@@ -0,0 +1,352 @@
+"""
+Benchmark suite covering every conversion and editing type in the registry.
+
+Generates deterministic synthetic inputs (documents, spreadsheets, PDFs, images, audio,
+video and data files) at each size, then runs every conversion once per size through
+run_job, the dispatch ConversionThread and the batch workers use, in a fresh interpreter
+per case. Wall time, CPU time (including ffmpeg and other child processes), peak RSS and
+output size are recorded.
+
+Results can be written as JSON and compared against a stored baseline: a case is flagged
+when its wall time, CPU time or peak memory grew by more than --tolerance, and the exit
+status is 1 if anything was flagged.
+
+    python benchmarks/suite.py --sizes small medium --json results.json --baseline baseline.json
+    python benchmarks/suite.py --only pdf_to_word image_pipeline --save-baseline baseline.json
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHILD = """
+import sys, json, time, resource
+sys.path.insert(0, {root!r})
+from utils.batch_processor import BatchJob, run_job
+start = time.perf_counter()
+result = run_job(BatchJob({conversion!r}, {input!r}, {output!r}, {options!r}))
+# Converters that shell out (ffmpeg, LibreOffice) do their work in child processes: count those too
+usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+print(json.dumps({{'seconds': time.perf_counter() - start, 'error': result.error,
+                  'cpu_seconds': sum(u.ru_utime + u.ru_stime for u in usage),
+                  'rss_mb': max(u.ru_maxrss for u in usage) / (1024 * 1024 if sys.platform == 'darwin' else 1024)}}))
+"""
+
+# Each size multiplies the amount of content in the generated inputs
+SIZES = {'small': 1, 'medium': 4, 'large': 16}
+SEED = 20240601
+
+# Metrics compared against the baseline, with the smallest change worth flagging (noise floor)
+COMPARED = {'seconds': 0.1, 'cpu_seconds': 0.1, 'rss_mb': 5.0}
+
+# Options for the types that need some; inputs are generated per extension (see make_fixture)
+OPTIONS = {
+    'trim_video': {'start_time': 1, 'end_time': 4},
+    'add_audio': {'audio_path': '{mp3}'},
+    'change_resolution': {'new_resolution': (320, 180)},
+    'add_subtitles': {'srt_path': '{srt}'},
+    'extract_frames': {'fps': 1},
+    'trim_audio': {'start_time': 1, 'end_time': 6},
+    'remove_noise': {'noise_reduction_amount': 20},
+    'change_speed': {'speed_factor': 1.5},
+    'resize_image': {'size': (320, 240)},
+    'compress_image': {'quality': 60},
+    'rotate_image': {'degrees': 90},
+    'flip_image': {'direction': 'horizontal'},
+    'add_watermark': {'watermark_text': 'Benchmark', 'position': (10, 10), 'font_size': 24},
+    'image_pipeline': {'steps': 'resize_image size=320x240 | convert_to_grayscale | png_to_webp'},
+    'video_pipeline': {'steps': 'trim_video start_time=1 end_time=4 | change_resolution new_resolution=320x180'},
+}
+# Types whose input is a ';'-separated list: how many copies of the fixture to pass
+MULTI_INPUT = {'images_to_pdf': 8, 'merge_videos': 2, 'merge_audio_files': 3}
+# Types that write a directory of files rather than one file
+DIRECTORY_OUTPUT = {'pdf_to_images', 'extract_frames'}
+
+WORDS = ('alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima mike november '
+         'oscar papa quebec romeo sierra tango uniform victor whiskey xray yankee zulu').split()
+
+
+def _sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def _records(scale):
+    rng = random.Random(SEED)
+    for i in range(2000 * scale):
+        yield {'id': i, 'user': f'user{rng.randrange(500)}', 'event': rng.choice(('view', 'click', 'buy')),
+               'value': round(rng.random() * 1000, 3), 'message': _sentence(rng, 6)}
+
+
+def _ffmpeg(*args):
+    from converters.ffmpeg_engine import ffmpeg_binary
+
+    ffmpeg = ffmpeg_binary()
+    if not ffmpeg:
+        raise RuntimeError("needs ffmpeg on PATH (or imageio-ffmpeg installed)")
+    subprocess.run([ffmpeg, '-v', 'error', '-y', *args], check=True)
+
+
+def _image(path, scale):
+    from PIL import Image, ImageDraw
+
+    side = int(480 * scale ** 0.5)
+    red = Image.linear_gradient('L').resize((side, side))
+    green = Image.radial_gradient('L').resize((side, side))
+    image = Image.merge('RGB', (red, green, red.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    draw = ImageDraw.Draw(image)
+    rng = random.Random(SEED)
+    for _ in range(40):
+        x, y = rng.randrange(side), rng.randrange(side)
+        draw.rectangle((x, y, x + side // 10, y + side // 12), fill=tuple(rng.randrange(256) for _ in range(3)))
+    if path.endswith('.gif'):
+        image = image.convert('P')
+    image.save(path)
+
+
+def _pdf(path, scale):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    rng = random.Random(SEED)
+    pdf = canvas.Canvas(path, pagesize=A4)
+    for page in range(2 * scale):
+        pdf.setFont('Helvetica-Bold', 16)
+        pdf.drawString(72, 790, f'Section {page + 1}')
+        pdf.setFont('Helvetica', 10)
+        for line in range(50):
+            pdf.drawString(72, 760 - line * 13, _sentence(rng, 11))
+        pdf.showPage()
+    pdf.save()
+
+
+def _docx(path, scale):
+    from docx import Document
+
+    rng = random.Random(SEED)
+    document = Document()
+    for section in range(5 * scale):
+        document.add_heading(f'Section {section + 1}', level=1)
+        for _ in range(8):
+            document.add_paragraph(' '.join(_sentence(rng) for _ in range(4)))
+    table = document.add_table(rows=1, cols=4)
+    for row in list(_records(1))[:20 * scale]:
+        cells = table.add_row().cells
+        for cell, key in zip(cells, ('id', 'user', 'event', 'value')):
+            cell.text = str(row[key])
+    document.save(path)
+
+
+def _xlsx(path, scale):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for number in range(2):
+        sheet = workbook.create_sheet(f'Sheet{number + 1}')
+        sheet.append(['id', 'user', 'event', 'value', 'message'])
+        for row in _records(scale // 2 or 1):
+            sheet.append(list(row.values()))
+    workbook.save(path)
+
+
+def _data(path, ext, scale):
+    import xml.etree.ElementTree as ElementTree
+
+    records = list(_records(scale))
+    if ext == '.csv':
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(records[0]))
+            writer.writeheader()
+            writer.writerows(records)
+    elif ext == '.json':
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(records, f)
+    elif ext == '.yaml':
+        # Flat records of plain scalars, so JSON-style flow mappings are valid YAML without PyYAML
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(f'- {json.dumps(record)}\n' for record in records)
+    elif ext == '.xml':
+        root = ElementTree.Element('records')
+        for record in records:
+            element = ElementTree.SubElement(root, 'record')
+            for key, value in record.items():
+                ElementTree.SubElement(element, key).text = str(value)
+        ElementTree.ElementTree(root).write(path, encoding='utf-8', xml_declaration=True)
+    else:
+        rng = random.Random(SEED)
+        sections = [(f'Section {n + 1}', [_sentence(rng, 20) for _ in range(6)]) for n in range(20 * scale)]
+        with open(path, 'w', encoding='utf-8') as f:
+            for title, paragraphs in sections:
+                if ext == '.html':
+                    f.write(f'<h2>{title}</h2>\n' + ''.join(f'<p>{p} <b>{WORDS[0]}</b></p>\n' for p in paragraphs))
+                elif ext == '.md':
+                    f.write(f'## {title}\n\n' + ''.join(f'{p} **{WORDS[0]}**\n\n' for p in paragraphs))
+                else:
+                    f.write(f'{title}\n\n' + '\n\n'.join(paragraphs) + '\n\n')
+
+
+def _audio(path, scale):
+    seconds = 10 * scale
+    _ffmpeg('-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+            '-f', 'lavfi', '-i', f'anoisesrc=duration={seconds}:amplitude=0.02:seed=1',
+            '-filter_complex', '[0][1]amix=inputs=2,aformat=channel_layouts=stereo', '-ar', '44100', path)
+
+
+def _video(path, scale):
+    seconds = 5 * scale
+    if path.endswith('.gif'):
+        _ffmpeg('-f', 'lavfi', '-i', f'testsrc=size=320x180:rate=10:duration={seconds}', path)
+        return
+    _ffmpeg('-f', 'lavfi', '-i', f'testsrc2=size=640x360:rate=30:duration={seconds}',
+            '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}', '-shortest', '-g', '60', path)
+
+
+def _srt(path, scale):
+    with open(path, 'w', encoding='utf-8') as f:
+        for n in range(5 * scale):
+            f.write(f'{n + 1}\n00:00:{n:02d},000 --> 00:00:{n:02d},900\nSubtitle line {n + 1}\n\n')
+
+
+FIXTURES = {
+    '.docx': _docx, '.xlsx': _xlsx, '.pdf': _pdf, '.srt': _srt,
+    '.jpg': _image, '.png': _image, '.bmp': _image, '.webp': _image, '.gif': _image, '.tiff': _image,
+    '.mp3': _audio, '.wav': _audio, '.flac': _audio, '.aac': _audio, '.ogg': _audio, '.m4a': _audio,
+    '.mp4': _video, '.avi': _video, '.mov': _video, '.mkv': _video, '.webm': _video,
+}
+
+
+def make_fixture(work, ext, scale, video=False):
+    """Path of the generated input with this extension, generating it on first use."""
+    path = os.path.join(work, f"input{'-video' if video else ''}{ext}")
+    if not os.path.exists(path):
+        if video:
+            _video(path, scale)
+        elif ext in FIXTURES:
+            FIXTURES[ext](path, scale)
+        else:
+            _data(path, ext, scale)
+    return path
+
+
+def _output_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(directory, name))
+                   for directory, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def run_case(work, conversion_type, scale):
+    from utils.conversions import get_conversion, output_path_for
+
+    conversion = get_conversion(conversion_type)
+    ext = conversion.input_exts[0]
+    options = dict(OPTIONS.get(conversion_type, {}))
+    try:
+        # gif_to_mp4 takes an animation, not the still images the other .gif inputs are
+        input_path = make_fixture(work, ext, scale, video=conversion_type == 'gif_to_mp4')
+        for key, value in options.items():
+            if value in ('{mp3}', '{srt}'):
+                options[key] = make_fixture(work, '.' + value.strip('{}'), scale)
+    except Exception as e:
+        return {'error': f"could not generate {ext} input: {str(e) or e.__class__.__name__}"}
+    bytes_in = os.path.getsize(input_path) * MULTI_INPUT.get(conversion_type, 1)
+    if conversion_type in MULTI_INPUT:
+        input_path = ';'.join([input_path] * MULTI_INPUT[conversion_type])
+
+    output_dir = os.path.join(work, 'out', conversion_type)
+    os.makedirs(output_dir, exist_ok=True)
+    if conversion_type in DIRECTORY_OUTPUT:
+        output_path = os.path.join(output_dir, 'frames')
+    else:
+        output_path = output_path_for(conversion_type, input_path.split(';')[0], output_dir, options)
+
+    code = CHILD.format(root=ROOT, conversion=conversion_type, input=input_path, output=output_path, options=options)
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        return {'error': lines[-1] if lines else f'exit code {result.returncode}'}
+    measured = json.loads(result.stdout.strip().splitlines()[-1])
+    if not measured['error']:
+        del measured['error']
+    measured.update(input_mb=bytes_in / (1024 * 1024), output_mb=_output_size(output_path) / (1024 * 1024))
+    return measured
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against a baseline, as (case, metric, baseline value, new value) tuples."""
+    previous = {(r['conversion'], r['size']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        old = previous.get((result['conversion'], result['size']))
+        if not old or 'error' in old:
+            continue
+        if 'error' in result:
+            regressions.append((f"{result['conversion']}/{result['size']}", 'error', None, result['error']))
+            continue
+        for metric, floor in COMPARED.items():
+            if metric in old and result[metric] > old[metric] * (1 + tolerance) and result[metric] - old[metric] > floor:
+                regressions.append((f"{result['conversion']}/{result['size']}", metric, old[metric], result[metric]))
+    return regressions
+
+
+def main():
+    if sys.platform == 'win32':
+        sys.exit("This benchmark reads CPU time and peak RSS with the resource module, which Windows does not have.")
+    from utils.conversions import CONVERSIONS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['small'])
+    parser.add_argument('--only', nargs='+', metavar='TYPE', help="Run only these conversion/editing types")
+    parser.add_argument('--json', dest='json_path', help="Write the results to this file")
+    parser.add_argument('--baseline', help="Compare against results saved earlier with --json or --save-baseline")
+    parser.add_argument('--save-baseline', help="Write the results as the new baseline to this file")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Relative increase flagged as a regression (default 0.25)")
+    args = parser.parse_args()
+
+    types = args.only or list(CONVERSIONS)
+    unknown = [name for name in types if name not in CONVERSIONS]
+    if unknown:
+        parser.error(f"unknown type(s): {', '.join(unknown)}")
+
+    results = []
+    print(f"{'type':<26}{'size':<8}{'seconds':>9}{'cpu s':>9}{'peak RSS MB':>13}{'in MB':>9}{'out MB':>9}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as work:
+            for conversion_type in types:
+                result = run_case(work, conversion_type, SIZES[size])
+                result.update(conversion=conversion_type, size=size)
+                results.append(result)
+                if 'error' in result:
+                    print(f"{conversion_type:<26}{size:<8}  failed: {result['error']}")
+                else:
+                    print(f"{conversion_type:<26}{size:<8}{result['seconds']:>9.2f}{result['cpu_seconds']:>9.2f}"
+                          f"{result['rss_mb']:>13.1f}{result['input_mb']:>9.2f}{result['output_mb']:>9.2f}")
+
+    report = {'time': time.time(), 'python': sys.version.split()[0], 'cpus': os.cpu_count(), 'results': results}
+    for path in (args.json_path, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for case, metric, old, new in regressions:
+            if metric == 'error':
+                print(f"REGRESSION {case}: now fails ({new})")
+            else:
+                print(f"REGRESSION {case}: {metric} {old:.2f} -> {new:.2f} ({(new / old - 1) * 100:+.0f}%)")
+        print(f"{len(regressions)} regression(s) against {args.baseline}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
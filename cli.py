@@ -0,0 +1,266 @@
+import os
+import re
+import sys
+import json
+import argparse
+import logging
+from utils.conversions import CONVERSIONS, accepts, is_image_conversion, output_path_for, required_options
+
+# Nothing in here (or in the modules it imports) may import PyQt5, so the CLI keeps working
+# on headless servers without Qt or a display.
+
+
+def parse_option(text):
+    """Parse a KEY=VALUE option. Values are read as JSON when possible, 'WxH' as an int tuple."""
+    if '=' not in text:
+        raise argparse.ArgumentTypeError(f"Options must look like KEY=VALUE, got '{text}'")
+    key, value = text.split('=', 1)
+    if re.fullmatch(r'\d+x\d+', value):
+        return key, tuple(map(int, value.split('x')))
+    try:
+        value = json.loads(value)
+    except ValueError:
+        return key, value
+    return key, tuple(value) if isinstance(value, list) else value
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m cli',
+        description='Convert or edit files without starting the GUI.')
+    parser.add_argument('--type', dest='conversion_type',
+                        help='Conversion or editing type, e.g. pdf_to_word or trim_video')
+    parser.add_argument('--recipe', help='YAML/JSON recipe of chained steps to run instead of a single --type')
+    parser.add_argument('--in', required=True, dest='input_path',
+                        help="Input file or directory (use ';' to join files for merges and images_to_pdf)")
+    parser.add_argument('--out', required=True, dest='output_path',
+                        help='Output directory (or output file for images_to_pdf)')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Number of files to convert in parallel (default: CPU count)')
+    parser.add_argument('--option', '-o', action='append', type=parse_option, default=[],
+                        metavar='KEY=VALUE', help='Option for the conversion, e.g. -o start_time=1.5')
+    parser.add_argument('--cache', action='store_true',
+                        help='Reuse outputs of earlier runs with identical input content and options')
+    parser.add_argument('--cache-dir', default=None, help='Result cache directory (implies --cache)')
+    parser.add_argument('--cache-max-mb', type=int, default=None,
+                        help='Size limit of the result cache in MB (implies --cache)')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and convert files as they are added to or modified in the --in '
+                             'directory (with --journal, files already there are converted too unless done before)')
+    parser.add_argument('--journal', nargs='?', const=True, default=None, metavar='FILE.sqlite',
+                        help='Journal directory batches so a rerun skips inputs that finished unchanged and retries '
+                             'the rest (default file: ~/.cache/universal-file-converter/journal.sqlite)')
+    parser.add_argument('--metrics', nargs='?', const=True, default=None, metavar='FILE.jsonl',
+                        help='Append a JSON record per job (default file: ~/.cache/universal-file-converter/'
+                             'metrics/jobs.jsonl)')
+    parser.add_argument('--metrics-textfile', default=None, metavar='FILE.prom',
+                        help='Keep per-conversion totals in this Prometheus text file (implies --metrics)')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Serve the Prometheus metrics on http://127.0.0.1:PORT/metrics while running '
+                             '(implies --metrics)')
+    parser.add_argument('--profile', choices=['cprofile', 'tracemalloc'], default=None,
+                        help='Profile the jobs chosen by --profile-match (written next to the metrics)')
+    parser.add_argument('--profile-match', default='*', metavar='GLOB',
+                        help='Conversion type or input file name of the jobs to profile (default: all)')
+    daemon = parser.add_mutually_exclusive_group()
+    daemon.add_argument('--daemon', action='store_true',
+                        help='Run jobs on the conversion daemon, starting it if needed (python -m utils.daemon). '
+                             'A running daemon is used by default')
+    daemon.add_argument('--no-daemon', action='store_true', help='Convert in this process even if a daemon runs')
+    parser.add_argument('--quiet', '-q', action='store_true', help='Only print errors and the summary')
+    return parser
+
+
+def make_cache(args):
+    if not (args.cache or args.cache_dir or args.cache_max_mb):
+        return None
+    from utils.result_cache import ResultCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+    max_bytes = args.cache_max_mb * 1024 * 1024 if args.cache_max_mb else DEFAULT_MAX_BYTES
+    return ResultCache(args.cache_dir or DEFAULT_CACHE_DIR, max_bytes)
+
+
+def make_journal(args):
+    if not args.journal:
+        return None
+    from utils.journal import BatchJournal, DEFAULT_JOURNAL_PATH
+    return BatchJournal(args.journal if isinstance(args.journal, str) else DEFAULT_JOURNAL_PATH)
+
+
+def make_metrics(args):
+    if not (args.metrics or args.metrics_textfile or args.metrics_port or args.profile):
+        return None
+    from utils.metrics import MetricsRecorder, DEFAULT_JSONL_PATH
+    metrics = MetricsRecorder(args.metrics if isinstance(args.metrics, str) else DEFAULT_JSONL_PATH,
+                              args.metrics_textfile)
+    if args.metrics_port:
+        host, port = metrics.serve(args.metrics_port)
+        logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return metrics
+
+
+def make_profiler(args):
+    if not args.profile:
+        return None
+    from utils.metrics import JobProfiler
+    return JobProfiler(args.profile, args.profile_match)
+
+
+def connect_daemon(args):
+    # Profiled jobs have to run here, where the profiler is
+    if args.no_daemon or args.profile:
+        return None
+    from utils.daemon import DaemonClient
+    return DaemonClient.connect(autostart=args.daemon)
+
+
+def print_cache_stats(cache):
+    if cache:
+        stats = cache.stats()
+        print(f"Cache: {stats['hits']} hit(s), {stats['misses']} miss(es), "
+              f"{stats['entries']} entries, {stats['bytes'] / (1024 * 1024):.1f} MB")
+
+
+def run_single(args, options, cache=None, metrics=None, profiler=None, daemon=None):
+    from utils.batch_processor import BatchJob, run_job
+
+    if args.conversion_type == 'images_to_pdf' or os.path.splitext(args.output_path)[1]:
+        output_file = args.output_path  # Output is already a full path
+    else:
+        os.makedirs(args.output_path, exist_ok=True)
+        output_file = output_path_for(args.conversion_type, args.input_path.split(';')[0], args.output_path, options)
+
+    job = BatchJob(args.conversion_type, args.input_path, output_file, options)
+    result = daemon.run_job(job, cache) if daemon else run_job(job, cache, profiler=profiler, exclusive=True)
+    if metrics:
+        metrics.record(result.metrics)
+    if result.error:
+        print(f"{args.input_path}: Error: {result.error}", file=sys.stderr)
+        return 1
+    if not args.quiet:
+        print(f"{args.input_path} -> {output_file} ({result.elapsed:.2f}s{', cached' if result.cached else ''})")
+    return 0
+
+
+def run_batch(args, options, cache=None, metrics=None, profiler=None, daemon=None):
+    from utils.batch_processor import BatchProcessor, BatchJob
+    from utils.file_handler import FileHandler
+
+    os.makedirs(args.output_path, exist_ok=True)
+    watcher = None
+    if args.watch:
+        from utils.watcher import FolderWatcher, watch_jobs
+        # Files already there are only worth queueing when the journal can skip the finished ones
+        watcher = FolderWatcher(args.input_path, include_existing=bool(args.journal))
+        jobs = watch_jobs(watcher, args.conversion_type, args.output_path, options)
+        logging.info(f"Watching {args.input_path} ({'inotify' if watcher.using_inotify else 'polling'}), "
+                     f"press Ctrl+C to stop")
+    else:
+        jobs = (BatchJob(args.conversion_type, file,
+                         output_path_for(args.conversion_type, file, args.output_path, options), options)
+                for file in FileHandler.list_files_in_directory(args.input_path)
+                if accepts(args.conversion_type, file))
+
+    def report(result):
+        if result.error:
+            print(f"{result.job.input_path}: Error: {result.error}", file=sys.stderr)
+        elif result.skipped:
+            if not args.quiet:
+                print(f"{result.job.input_path}: unchanged since the last run, skipped")
+        elif not args.quiet:
+            print(f"{result.job.input_path} -> {result.job.output_path} "
+                  f"({result.elapsed:.2f}s{', cached' if result.cached else ''})")
+
+    unit = 'images' if is_image_conversion(args.conversion_type) else 'files'
+    processor = BatchProcessor(max_workers=args.jobs, cache=cache, unit=unit, metrics=metrics, profiler=profiler,
+                               daemon=daemon, journal=make_journal(args))
+    try:
+        summary = processor.run(jobs, report)
+    except KeyboardInterrupt:
+        processor.cancel()
+        summary = processor.summary()
+    finally:
+        if watcher:
+            watcher.close()
+    print(summary)
+    return 1 if processor.files_failed else 0
+
+
+def run_recipe_files(args, cache=None, metrics=None):
+    from utils.recipes import Recipe, run_recipe
+
+    try:
+        recipe = Recipe.load(args.recipe)
+    except (OSError, ValueError) as e:
+        print(f"{args.recipe}: {e}", file=sys.stderr)
+        return 2
+    if os.path.isdir(args.input_path):
+        from utils.file_handler import FileHandler
+        exts = recipe.input_exts()
+        inputs = [file for file in FileHandler.list_files_in_directory(args.input_path)
+                  if not exts or os.path.splitext(file)[1].lower() in exts]
+    else:
+        inputs = [args.input_path]
+
+    def report(stage, result):
+        if metrics:
+            metrics.record(result.metrics)
+        if not args.quiet and not result.error:
+            print(f"  {stage.id} ({stage.conversion_type}): {result.elapsed:.2f}s"
+                  f"{', cached' if result.cached else ''}")
+
+    failed = 0
+    for input_path in inputs:
+        try:
+            outputs = run_recipe(recipe, input_path, args.output_path, args.jobs, cache, on_stage=report)
+        except KeyboardInterrupt:
+            print("Recipe cancelled", file=sys.stderr)
+            return 1
+        except Exception as e:
+            failed += 1
+            print(f"{input_path}: Error: {e}", file=sys.stderr)
+            continue
+        if not args.quiet:
+            print(f"{input_path} -> {', '.join(outputs.values())}")
+    print(f"Recipe finished: {len(inputs)} input(s), {failed} failed")
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.recipe:
+        if args.conversion_type:
+            parser.error("use either --type or --recipe, not both")
+        logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO,
+                            format='%(asctime)s - %(levelname)s - %(message)s')
+        cache = make_cache(args)
+        status = run_recipe_files(args, cache, make_metrics(args))
+        print_cache_stats(cache)
+        return status
+    if not args.conversion_type:
+        parser.error("one of --type or --recipe is required")
+    if args.conversion_type not in CONVERSIONS:
+        parser.error(f"unknown --type '{args.conversion_type}', choose from: {', '.join(CONVERSIONS)}")
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    options = dict(args.option)
+    missing = [name for name in required_options(args.conversion_type) if name not in options]
+    if missing:
+        parser.error(f"{args.conversion_type} needs: " + ', '.join(f'-o {name}=...' for name in missing))
+    if args.watch and not os.path.isdir(args.input_path):
+        parser.error("--watch needs a directory for --in")
+    if args.watch and os.path.realpath(args.input_path) == os.path.realpath(args.output_path):
+        parser.error("--watch needs an --out directory other than the watched one")
+    cache = make_cache(args)
+    metrics = make_metrics(args)
+    daemon = connect_daemon(args)
+    if os.path.isdir(args.input_path):
+        status = run_batch(args, options, cache, metrics, make_profiler(args), daemon)
+    else:
+        status = run_single(args, options, cache, metrics, make_profiler(args), daemon)
+    print_cache_stats(cache)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
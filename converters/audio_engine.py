@@ -0,0 +1,380 @@
+import os
+import shutil
+import tempfile
+import subprocess
+from converters.ffmpeg_engine import GLOBAL_ARGS, ffmpeg_binary, probe, run_ffmpeg
+
+# Encoder settings per output format
+AUDIO_ENCODERS = {
+    '.mp3': {'acodec': 'libmp3lame', 'qscale:a': 2},
+    '.wav': {'acodec': 'pcm_s16le'},
+    '.flac': {'acodec': 'flac'},
+    '.aac': {'acodec': 'aac', 'audio_bitrate': '192k'},
+    '.m4a': {'acodec': 'aac', 'audio_bitrate': '192k'},
+    '.ogg': {'acodec': 'libvorbis', 'qscale:a': 5},
+}
+
+# Codecs each format holds as-is, so merging files of that codec needs no decoding
+AUDIO_CONTAINER_CODECS = {
+    '.mp3': {'mp3'},
+    '.wav': {'pcm_s16le', 'pcm_s24le', 'pcm_s32le', 'pcm_f32le', 'pcm_u8'},
+    '.flac': {'flac'},
+    '.aac': {'aac'},
+    '.m4a': {'aac', 'alac'},
+    '.ogg': {'vorbis', 'opus', 'flac'},
+}
+
+# Samples per channel decoded, processed and encoded at a time when audio goes through Python
+BLOCK_FRAMES = 65536
+
+# Spectral gating: STFT size and hop, how much of the start the noise profile is taken from,
+# which share of its quietest frames count as noise, and how far above it the gate opens
+N_FFT = 2048
+HOP = 512
+NOISE_PROFILE_SECONDS = 10
+NOISE_QUANTILE = 0.2
+THRESHOLD_STDS = 1.5
+MASK_SMOOTHING_BINS = 5
+
+
+def _encoder_args(output_path):
+    return dict(AUDIO_ENCODERS.get(os.path.splitext(output_path)[1].lower(), {}))
+
+
+def _format(info, input_path):
+    """(sample rate, channels) of the first audio stream. Channels are never guessed: mono must stay mono."""
+    if not info.get('channels'):
+        raise RuntimeError(f"Cannot read the audio channels of {os.path.basename(input_path)}")
+    return info.get('sample_rate') or 44100, info['channels']
+
+
+def _pcm_decoder(ffmpeg_path, input_path, rate, channels, duration=None):
+    import ffmpeg
+
+    source = ffmpeg.input(input_path, t=duration) if duration else ffmpeg.input(input_path)
+    return ffmpeg.output(source['a:0'], 'pipe:1', format='f32le', ac=channels, ar=rate) \
+        .global_args('-nostdin', '-loglevel', 'error').compile(cmd=ffmpeg_path)
+
+
+def _pcm_encoder(ffmpeg_path, output_path, rate, channels):
+    import ffmpeg
+
+    return ffmpeg.input('pipe:0', format='f32le', ac=channels, ar=rate) \
+        .output(output_path, **_encoder_args(output_path)) \
+        .global_args('-nostdin', '-loglevel', 'error').compile(cmd=ffmpeg_path, overwrite_output=True)
+
+
+def _check(process, errors, what):
+    if process.wait() != 0:
+        errors.seek(0)
+        message = errors.read().decode('utf-8', 'replace').strip().splitlines()
+        detail = message[-1] if message else f'exit code {process.returncode}'
+        raise RuntimeError(f"ffmpeg {what} failed: {detail}")
+
+
+def read_pcm(ffmpeg_path, input_path, rate, channels, duration=None):
+    """Decode (the first `duration` seconds of) a file to a float32 array of shape (channels, samples)."""
+    import numpy as np
+
+    result = subprocess.run(_pcm_decoder(ffmpeg_path, input_path, rate, channels, duration),
+                            capture_output=True, stdin=subprocess.DEVNULL)
+    if result.returncode != 0:
+        message = result.stderr.decode('utf-8', 'replace').strip().splitlines()
+        detail = message[-1] if message else f'exit code {result.returncode}'
+        raise RuntimeError(f"ffmpeg decoding failed: {detail}")
+    return np.frombuffer(result.stdout, np.float32).reshape(-1, channels).T
+
+
+def stream_pcm(ffmpeg_path, input_path, output_path, rate, channels, process, finish=None, duration=None,
+               progress=None):
+    """
+    Decode `input_path` to float32 PCM, pass it through `process(block)` BLOCK_FRAMES samples
+    at a time and encode whatever it returns into `output_path`; `finish()` returns the last
+    output once the input has ended. Blocks are (channels, samples) arrays. Decoder and
+    encoder are ffmpeg processes connected by pipes, so only a couple of blocks are in memory.
+    """
+    import numpy as np
+
+    total = int(duration * rate) if duration else None
+    block_bytes = BLOCK_FRAMES * channels * 4
+    with tempfile.TemporaryFile() as decode_errors, tempfile.TemporaryFile() as encode_errors:
+        decoder = subprocess.Popen(_pcm_decoder(ffmpeg_path, input_path, rate, channels), stdout=subprocess.PIPE,
+                                   stderr=decode_errors, stdin=subprocess.DEVNULL)
+        encoder = subprocess.Popen(_pcm_encoder(ffmpeg_path, output_path, rate, channels), stdin=subprocess.PIPE,
+                                   stdout=subprocess.DEVNULL, stderr=encode_errors)
+        encoder_exited = False
+        try:
+            done = 0
+            while True:
+                data = decoder.stdout.read(block_bytes)
+                if not data:
+                    break
+                block = np.frombuffer(data, np.float32).reshape(-1, channels).T
+                encoder.stdin.write(np.ascontiguousarray(process(block).T, np.float32).tobytes())
+                done += block.shape[1]
+                if progress:
+                    progress.update(done, total)
+            if finish:
+                encoder.stdin.write(np.ascontiguousarray(finish().T, np.float32).tobytes())
+            encoder.stdin.close()
+        except BrokenPipeError:
+            # The encoder exited early: its error is reported below, not that of the decoder killed here
+            encoder_exited = True
+            decoder.kill()
+            decoder.wait()
+            try:
+                encoder.stdin.close()
+            except BrokenPipeError:
+                pass
+        except BaseException:
+            for process_ in (decoder, encoder):
+                process_.kill()
+                process_.wait()
+            raise
+        finally:
+            decoder.stdout.close()
+        if encoder_exited:
+            _check(encoder, encode_errors, 'encoding')
+            raise RuntimeError("ffmpeg encoding failed: the encoder exited before the end of the input")
+        _check(decoder, decode_errors, 'decoding')
+        _check(encoder, encode_errors, 'encoding')
+    if progress:
+        progress.update(1, 1)
+
+
+class SpectralGate:
+    """
+    Spectral gating noise reduction over a stream of (channels, samples) float32 blocks.
+
+    The noise profile is the per-frequency level (mean and spread in dB) of the quietest
+    frames of `noise`. Time-frequency bins that stay under it by less than THRESHOLD_STDS
+    deviations are attenuated by `reduction_db`. Each block's STFT, mask and inverse are
+    computed as whole arrays with NumPy, and the window overlap is carried from one block
+    to the next, so the output is the same as processing the file in one piece.
+    """
+
+    def __init__(self, noise, reduction_db, n_fft=N_FFT, hop=HOP):
+        import numpy as np
+
+        self.n_fft = n_fft
+        self.hop = hop
+        self.window = np.hanning(n_fft + 1)[:-1].astype(np.float32)
+        # Overlap-add of analysis x synthesis windows sums to this constant
+        self.norm = float((self.window ** 2).sum() / hop)
+        self.floor = 10 ** (-abs(float(reduction_db)) / 20)
+        channels = noise.shape[0]
+        self.threshold = self._threshold(noise)
+        self.pending = np.zeros((channels, n_fft - hop), np.float32)  # Leading padding, dropped below
+        self.overlap = np.zeros((channels, n_fft - hop), np.float32)
+        self.skip = n_fft - hop
+        self.samples_in = 0
+        self.samples_out = 0
+
+    def _spectrum(self, samples):
+        import numpy as np
+
+        frames = np.lib.stride_tricks.sliding_window_view(samples, self.n_fft, axis=-1)[:, ::self.hop]
+        return np.fft.rfft(frames * self.window, axis=-1)
+
+    def _threshold(self, noise):
+        import numpy as np
+
+        if noise.shape[1] < self.n_fft:
+            noise = np.pad(noise, ((0, 0), (0, self.n_fft - noise.shape[1])))
+        level = 20 * np.log10(np.abs(self._spectrum(noise)) + 1e-10)  # (channels, frames, bins)
+        loudness = level.mean(axis=(0, 2))
+        quiet = level[:, loudness <= np.quantile(loudness, NOISE_QUANTILE)]
+        return quiet.mean(axis=1) + THRESHOLD_STDS * quiet.std(axis=1)  # (channels, bins)
+
+    def _smooth(self, mask):
+        import numpy as np
+
+        # Moving average across neighbouring frequencies, so isolated bins do not flicker
+        width = MASK_SMOOTHING_BINS
+        padded = np.pad(mask, ((0, 0), (0, 0), (width // 2, width // 2)), mode='edge')
+        summed = np.cumsum(padded, axis=-1)
+        summed = np.concatenate([np.zeros(summed.shape[:2] + (1,), summed.dtype), summed], axis=-1)
+        return (summed[..., width:] - summed[..., :-width]) / width
+
+    def process(self, block, padding=False):
+        import numpy as np
+
+        if not padding:
+            self.samples_in += block.shape[1]
+        samples = np.concatenate([self.pending, block], axis=1)
+        count = (samples.shape[1] - self.n_fft) // self.hop + 1 if samples.shape[1] >= self.n_fft else 0
+        if count <= 0:
+            self.pending = samples
+            return samples[:, :0]
+        spectrum = self._spectrum(samples[:, :(count - 1) * self.hop + self.n_fft])
+        level = 20 * np.log10(np.abs(spectrum) + 1e-10)
+        mask = self._smooth(np.where(level > self.threshold[:, None, :], 1.0, self.floor).astype(np.float32))
+        frames = np.fft.irfft(spectrum * mask, n=self.n_fft, axis=-1).astype(np.float32) * (self.window / self.norm)
+
+        # Overlap-add: frame f covers hop-sized pieces f .. f + n_fft/hop - 1
+        pieces = self.n_fft // self.hop
+        frames = frames.reshape(frames.shape[0], count, pieces, self.hop)
+        output = np.zeros((frames.shape[0], count + pieces - 1, self.hop), np.float32)
+        for piece in range(pieces):
+            output[:, piece:piece + count] += frames[:, :, piece]
+        output = output.reshape(frames.shape[0], -1)
+        output[:, :self.n_fft - self.hop] += self.overlap
+
+        self.overlap = output[:, count * self.hop:]
+        self.pending = samples[:, count * self.hop:]
+        ready = output[:, :count * self.hop]
+        if self.skip:
+            cut = min(self.skip, ready.shape[1])
+            ready = ready[:, cut:]
+            self.skip -= cut
+        ready = ready[:, :max(0, self.samples_in - self.samples_out)]
+        self.samples_out += ready.shape[1]
+        return ready
+
+    def finish(self):
+        import numpy as np
+
+        # Zeros push the last real samples through full frames; the padding itself is not returned
+        return self.process(np.zeros((self.pending.shape[0], self.n_fft), np.float32), padding=True)
+
+
+def _atempo_chain(stream, factor):
+    # atempo keeps the pitch; older ffmpeg builds only take factors between 0.5 and 2 per filter
+    while factor > 2.0:
+        stream = stream.filter('atempo', 2.0)
+        factor /= 2.0
+    while factor < 0.5:
+        stream = stream.filter('atempo', 0.5)
+        factor /= 0.5
+    return stream.filter('atempo', factor)
+
+
+class AudioEngine:
+    """
+    Audio edits and conversions that stream through ffmpeg instead of decoding the whole
+    file into memory with pydub.
+
+    Conversions, trims and speed changes run as one ffmpeg command, which decodes, filters
+    and encodes a frame at a time. remove_noise decodes to PCM and gates it in NumPy one
+    block at a time (see SpectralGate), piping the result into an encoder. merge_audio_files
+    joins files without decoding when they share codec, sample rate and channels. The pydub
+    implementations stay available as the `engine=pydub` variant, and are used when no
+    ffmpeg binary is found.
+    """
+
+    @staticmethod
+    def _run(input_path, output_path, stream_for, duration=None, progress=None, input_args=None):
+        import ffmpeg
+
+        ffmpeg_path = ffmpeg_binary()
+        source = ffmpeg.input(input_path, **(input_args or {}))
+        command = ffmpeg.output(stream_for(source['a:0']), output_path, vn=None, **_encoder_args(output_path)) \
+            .global_args(*GLOBAL_ARGS).compile(cmd=ffmpeg_path, overwrite_output=True)
+        run_ffmpeg(command, duration, progress)
+
+    @staticmethod
+    def _fallback(conversion_type, input_path, output_path, options, progress):
+        from utils.conversions import run_conversion
+        return run_conversion(conversion_type, input_path, output_path, dict(options, engine='pydub'), progress)
+
+    @staticmethod
+    def convert(conversion_type, input_path, output_path, progress=None):
+        if not ffmpeg_binary():
+            return AudioEngine._fallback(conversion_type, input_path, output_path, {}, progress)
+        duration = (probe(input_path) or {}).get('duration')
+        AudioEngine._run(input_path, output_path, lambda audio: audio, duration, progress)
+
+    @staticmethod
+    def mp3_to_wav(input_path, output_path, progress=None):
+        AudioEngine.convert('mp3_to_wav', input_path, output_path, progress)
+
+    @staticmethod
+    def wav_to_mp3(input_path, output_path, progress=None):
+        AudioEngine.convert('wav_to_mp3', input_path, output_path, progress)
+
+    @staticmethod
+    def flac_to_mp3(input_path, output_path, progress=None):
+        AudioEngine.convert('flac_to_mp3', input_path, output_path, progress)
+
+    @staticmethod
+    def mp3_to_flac(input_path, output_path, progress=None):
+        AudioEngine.convert('mp3_to_flac', input_path, output_path, progress)
+
+    @staticmethod
+    def aac_to_mp3(input_path, output_path, progress=None):
+        AudioEngine.convert('aac_to_mp3', input_path, output_path, progress)
+
+    @staticmethod
+    def mp3_to_aac(input_path, output_path, progress=None):
+        AudioEngine.convert('mp3_to_aac', input_path, output_path, progress)
+
+    @staticmethod
+    def trim_audio(input_path, output_path, start_time, end_time, progress=None):
+        options = {'start_time': start_time, 'end_time': end_time}
+        if not ffmpeg_binary():
+            return AudioEngine._fallback('trim_audio', input_path, output_path, options, progress)
+        start_time, end_time = float(start_time), float(end_time)
+        if end_time <= start_time:
+            raise ValueError(f"Trim end ({end_time}) must be after its start ({start_time})")
+        # ffmpeg seeks to the packet before the start and drops the decoded samples up to it
+        AudioEngine._run(input_path, output_path, lambda audio: audio, end_time - start_time, progress,
+                         {'ss': start_time, 't': end_time - start_time})
+
+    @staticmethod
+    def change_speed(input_path, output_path, speed_factor, progress=None):
+        if not ffmpeg_binary():
+            return AudioEngine._fallback('change_speed', input_path, output_path,
+                                         {'speed_factor': speed_factor}, progress)
+        factor = float(speed_factor)
+        if factor <= 0:
+            raise ValueError(f"Speed factor must be positive, got {speed_factor}")
+        duration = (probe(input_path) or {}).get('duration')
+        AudioEngine._run(input_path, output_path, lambda audio: _atempo_chain(audio, factor),
+                         duration / factor if duration else None, progress)
+
+    @staticmethod
+    def remove_noise(input_path, output_path, noise_reduction_amount, progress=None):
+        """`noise_reduction_amount` is how many dB the gated noise is turned down by."""
+        ffmpeg_path = ffmpeg_binary()
+        info = probe(input_path) if ffmpeg_path else None
+        if info is None:
+            # No ffmpeg, or no ffprobe to read the audio format with
+            return AudioEngine._fallback('remove_noise', input_path, output_path,
+                                         {'noise_reduction_amount': noise_reduction_amount}, progress)
+        rate, channels = _format(info, input_path)
+        noise = read_pcm(ffmpeg_path, input_path, rate, channels, NOISE_PROFILE_SECONDS)
+        gate = SpectralGate(noise, noise_reduction_amount)
+        stream_pcm(ffmpeg_path, input_path, output_path, rate, channels, gate.process, gate.finish,
+                   info.get('duration'), progress)
+
+    @staticmethod
+    def merge_audio_files(input_paths, output_path, progress=None):
+        ffmpeg_path = ffmpeg_binary()
+        if not ffmpeg_path:
+            return AudioEngine._fallback('merge_audio_files', ';'.join(input_paths), output_path, {}, progress)
+        import ffmpeg
+
+        infos = [probe(path) or {} for path in input_paths]
+        duration = sum(info.get('duration') or 0 for info in infos) or None
+        formats = {(info.get('audio'), info.get('sample_rate'), info.get('channels')) for info in infos}
+        codec = next(iter(formats))[0] if len(formats) == 1 else None
+        ext = os.path.splitext(output_path)[1].lower()
+        if codec and codec in AUDIO_CONTAINER_CODECS.get(ext, ()):
+            # Same codec and format throughout: join the packets as they are
+            work = tempfile.mkdtemp(prefix='merge-')
+            try:
+                list_path = os.path.join(work, 'inputs.txt')
+                with open(list_path, 'w', encoding='utf-8') as f:
+                    for path in input_paths:
+                        f.write("file '" + os.path.abspath(path).replace("'", "'\\''") + "'\n")
+                command = ffmpeg.input(list_path, f='concat', safe=0).output(output_path, acodec='copy', vn=None) \
+                    .global_args(*GLOBAL_ARGS).compile(cmd=ffmpeg_path, overwrite_output=True)
+                run_ffmpeg(command, duration, progress)
+            finally:
+                shutil.rmtree(work, ignore_errors=True)
+            return
+        # Mixed inputs: the concat filter resamples them to one format as it goes
+        joined = ffmpeg.concat(*[ffmpeg.input(path)['a:0'] for path in input_paths], v=0, a=1)
+        command = ffmpeg.output(joined, output_path, **_encoder_args(output_path)) \
+            .global_args(*GLOBAL_ARGS).compile(cmd=ffmpeg_path, overwrite_output=True)
+        run_ffmpeg(command, duration, progress)
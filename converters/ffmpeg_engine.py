@@ -0,0 +1,494 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.conversions import parse_steps
+from utils.progress import ConversionCancelled
+from utils.batch_processor import default_workers
+
+# Codecs each container can hold as-is, so a remux or edit can stream copy instead of encoding
+CONTAINER_CODECS = {
+    '.mp4': ({'h264', 'hevc', 'mpeg4', 'av1'}, {'aac', 'mp3', 'ac3', 'eac3', 'alac', 'opus'}),
+    '.mov': ({'h264', 'hevc', 'mpeg4', 'prores', 'mjpeg'}, {'aac', 'mp3', 'ac3', 'alac', 'pcm_s16le'}),
+    '.avi': ({'mpeg4', 'mjpeg', 'msmpeg4v3'}, {'mp3', 'ac3', 'pcm_s16le'}),
+    '.mkv': (None, None),  # Matroska takes anything
+    '.webm': ({'vp8', 'vp9', 'av1'}, {'vorbis', 'opus'}),
+    '.mp3': (set(), {'mp3'}),
+}
+
+# Encoders used when a stream has to be re-encoded for a container
+ENCODERS = {
+    '.mp4': ({'vcodec': 'libx264', 'preset': 'medium', 'crf': 18, 'pix_fmt': 'yuv420p'},
+             {'acodec': 'aac', 'audio_bitrate': '192k'}),
+    '.mov': ({'vcodec': 'libx264', 'preset': 'medium', 'crf': 18, 'pix_fmt': 'yuv420p'},
+             {'acodec': 'aac', 'audio_bitrate': '192k'}),
+    '.mkv': ({'vcodec': 'libx264', 'preset': 'medium', 'crf': 18}, {'acodec': 'aac', 'audio_bitrate': '192k'}),
+    '.avi': ({'vcodec': 'mpeg4', 'qscale:v': 3}, {'acodec': 'libmp3lame', 'qscale:a': 2}),
+    '.webm': ({'vcodec': 'libvpx-vp9', 'crf': 32, 'b:v': 0}, {'acodec': 'libopus', 'audio_bitrate': '128k'}),
+    '.mp3': ({}, {'acodec': 'libmp3lame', 'qscale:a': 2}),
+}
+
+# Operations the engine can compile, with the output extension a step forces (None: keep)
+OPERATIONS = {
+    'trim_video': None,
+    'remove_sound': None,
+    'change_resolution': None,
+    'add_audio': None,
+    'add_subtitles': None,
+    'avi_to_mp4': '.mp4',
+    'mp4_to_avi': '.avi',
+    'mp4_to_mp3': '.mp3',
+    'gif_to_mp4': '.mp4',
+}
+
+GLOBAL_ARGS = ('-nostdin', '-loglevel', 'error', '-progress', 'pipe:1', '-nostats')
+
+# Keyframes closer than this (seconds) to a trim start count as aligned for stream copy
+KEYFRAME_TOLERANCE = 0.002
+
+# Segments of a segmented encode are at least this long (seconds); shorter inputs get fewer
+MIN_SEGMENT_SECONDS = 2.0
+
+
+def ffmpeg_binary():
+    """The ffmpeg executable: the one on PATH, else the copy bundled with imageio-ffmpeg (moviepy)."""
+    binary = shutil.which('ffmpeg')
+    if binary:
+        return binary
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return None
+
+
+def ffprobe_binary():
+    binary = shutil.which('ffprobe')
+    if binary:
+        return binary
+    ffmpeg = ffmpeg_binary()
+    if ffmpeg:
+        sibling = os.path.join(os.path.dirname(ffmpeg), 'ffprobe' + os.path.splitext(ffmpeg)[1])
+        if os.path.isfile(sibling):
+            return sibling
+    return None
+
+
+def probe(path):
+    """
+    Stream and format info of a media file: duration, video and audio codec names, frame rate,
+    size and audio format, or None when ffprobe is not available.
+    """
+    ffprobe = ffprobe_binary()
+    if not ffprobe:
+        return None
+    import ffmpeg
+    info = ffmpeg.probe(path, cmd=ffprobe)
+    video = next((s for s in info['streams'] if s['codec_type'] == 'video'
+                  and not s.get('disposition', {}).get('attached_pic')), None)
+    audio = next((s for s in info['streams'] if s['codec_type'] == 'audio'), None)
+    fps = None
+    if video and video.get('avg_frame_rate', '0/0') != '0/0':
+        num, den = video['avg_frame_rate'].split('/')
+        fps = float(num) / float(den) if float(den) else None
+    return {
+        'duration': float(info['format'].get('duration') or 0) or None,
+        'video': video['codec_name'] if video else None,
+        'audio': audio['codec_name'] if audio else None,
+        'fps': fps,
+        'width': int(video['width']) if video else None,
+        'height': int(video['height']) if video else None,
+        'sample_rate': int(audio['sample_rate']) if audio and audio.get('sample_rate') else None,
+        'channels': int(audio['channels']) if audio and audio.get('channels') else None,
+    }
+
+
+def keyframe_times(path, start=None, end=None):
+    """Presentation times of video keyframes, read from packet flags (no decoding)."""
+    ffprobe = ffprobe_binary()
+    if not ffprobe:
+        return None
+    command = [ffprobe, '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags',
+               '-of', 'json']
+    if start is not None or end is not None:
+        command += ['-read_intervals', f"{max(0.0, (start or 0) - 5)}%{'' if end is None else end + 5}"]
+    output = subprocess.run(command + [path], capture_output=True, check=True).stdout
+    packets = json.loads(output or b'{}').get('packets', [])
+    return sorted(float(p['pts_time']) for p in packets if 'K' in p.get('flags', '') and 'pts_time' in p)
+
+
+def is_keyframe_aligned(path, start):
+    if not start:
+        return True
+    times = keyframe_times(path, start, start)
+    return bool(times) and any(abs(t - start) <= KEYFRAME_TOLERANCE for t in times)
+
+
+def segment_bounds(path, start, duration, count):
+    """
+    Split `duration` seconds from `start` into at most `count` (start, length) pieces that each
+    begin on a video keyframe, so every piece can be decoded on its own. Cut points are the
+    keyframes nearest to even divisions; only the packets around each cut are read.
+    """
+    end = start + duration
+    cuts = [start]
+    for index in range(1, count):
+        target = start + duration * index / count
+        candidates = [t for t in keyframe_times(path, target, target) or ()
+                      if cuts[-1] + MIN_SEGMENT_SECONDS <= t <= end - MIN_SEGMENT_SECONDS]
+        if candidates:
+            cuts.append(min(candidates, key=lambda t: abs(t - target)))
+    return [(cut, following - cut) for cut, following in zip(cuts, cuts[1:] + [end])]
+
+
+def _can_hold(ext, video=None, audio=None):
+    video_codecs, audio_codecs = CONTAINER_CODECS.get(ext, (set(), set()))
+    if video and video_codecs is not None and video not in video_codecs:
+        return False
+    if audio and audio_codecs is not None and audio not in audio_codecs:
+        return False
+    return True
+
+
+class _Plan:
+    """What a chain of steps does to the input, folded into one ffmpeg invocation."""
+
+    def __init__(self):
+        self.start = 0.0          # Seek into the input (sum of trims)
+        self.duration = None      # Length to keep, None for everything after start
+        self.video_filters = []   # (filter name, args, kwargs) applied in order
+        self.audio = 'input'      # 'input', None (removed) or [path, seek into that file]
+        self.video = True         # False once the chain extracted audio only
+
+    def trim(self, start_time, end_time):
+        start_time, end_time = float(start_time), float(end_time)
+        if end_time <= start_time:
+            raise ValueError(f"Trim end ({end_time}) must be after its start ({start_time})")
+        if self.duration is not None:
+            end_time = min(end_time, self.duration)
+        self.start += start_time
+        self.duration = end_time - start_time
+        if self.video_filters:
+            # Filters added before this trim (e.g. subtitles) expect timestamps from before the cut
+            self.video_filters = ([('setpts', (f'PTS+{start_time}/TB',), {})] + self.video_filters +
+                                  [('setpts', ('PTS-STARTPTS',), {})])
+        if isinstance(self.audio, list):
+            self.audio[1] += start_time
+
+
+def compile_plan(steps):
+    plan = _Plan()
+    for name, options in parse_steps(steps):
+        if name not in OPERATIONS:
+            raise ValueError(f"Unsupported video pipeline step: {name}")
+        if not plan.video:
+            raise ValueError(f"'{name}' cannot follow mp4_to_mp3, which leaves only audio")
+        if name == 'trim_video':
+            plan.trim(options['start_time'], options['end_time'])
+        elif name == 'remove_sound':
+            plan.audio = None
+        elif name == 'change_resolution':
+            width, height = options['new_resolution']
+            plan.video_filters.append(('scale', (int(width), int(height)), {}))
+        elif name == 'add_audio':
+            plan.audio = [options['audio_path'], 0.0]
+        elif name == 'add_subtitles':
+            plan.video_filters.append(('subtitles', (options['srt_path'],), {}))
+        elif name == 'gif_to_mp4':
+            # yuv420p H.264 needs even dimensions, which GIFs often do not have
+            plan.video_filters.append(('scale', ('trunc(iw/2)*2', 'trunc(ih/2)*2'), {}))
+        elif name == 'mp4_to_mp3':
+            plan.video = False
+            plan.video_filters = []
+    return plan
+
+
+def _video_stream(source, plan, offset=0.0):
+    filters = plan.video_filters
+    if offset and filters:
+        # A segment starts at 0 after seeking; filters such as subtitles expect the full timeline
+        filters = [('setpts', (f'PTS+{offset}/TB',), {})] + filters + [('setpts', ('PTS-STARTPTS',), {})]
+    video = source['v:0']
+    for name, args, kwargs in filters:
+        video = video.filter(name, *args, **kwargs)
+    return video
+
+
+def _input(path, start=0.0, duration=None):
+    import ffmpeg
+
+    options = {}
+    if start:
+        options['ss'] = start
+    if duration is not None:
+        options['t'] = duration
+    return ffmpeg.input(path, **options)
+
+
+def _segment_count(segments):
+    if segments in (None, '', False):
+        return 1
+    if str(segments).lower() == 'auto':
+        return os.cpu_count() or 1
+    return max(1, int(segments))
+
+
+def output_ext_for_steps(steps):
+    ext = None
+    for name, _ in parse_steps(steps):
+        ext = OPERATIONS.get(name) or ext
+    return ext
+
+
+class FfmpegEngine:
+    """
+    Runs video edits and remuxes as a single ffmpeg invocation instead of decoding frames
+    through moviepy.
+
+    A chain of steps (see video_pipeline) is folded into one command: trims become input
+    seeking, resolution changes and burned-in subtitles one filtergraph, and audio is mapped
+    from the input or an added file. Streams are copied rather than encoded whenever nothing
+    touches them and the output container can hold their codec, which makes keyframe-aligned
+    trims and avi/mp4 remuxes as fast as reading the file. Without an ffmpeg binary the
+    moviepy implementation (the `engine=moviepy` variant) is used instead.
+
+    Re-encodes of long inputs can be split with `segments` (a count, or 'auto' for one per
+    core): the video is cut at keyframes, the pieces are encoded by `workers` ffmpeg
+    processes at once and joined losslessly with the concat demuxer (see _run_segmented).
+    """
+
+    @staticmethod
+    def run_steps(input_path, output_path, steps, segments=None, workers=None, progress=None):
+        plan = compile_plan(steps)
+        ffmpeg_path = ffmpeg_binary()
+        if not ffmpeg_path:
+            return FfmpegEngine._fallback(input_path, output_path, steps, progress)
+        import ffmpeg
+
+        ext = os.path.splitext(output_path)[1].lower()
+        info = probe(input_path) or {}
+        video_encoder, audio_encoder = ENCODERS.get(ext, ENCODERS['.mkv'])
+
+        source = _input(input_path, plan.start, plan.duration)
+        video_args, audio_args, output_args = {}, {}, {}
+        audio = None
+        duration = plan.duration
+        if info.get('duration'):
+            duration = min(duration or info['duration'], max(info['duration'] - plan.start, 0.0))
+
+        if plan.video:
+            if (not plan.video_filters and info and _can_hold(ext, video=info.get('video'))
+                    and (not plan.start or is_keyframe_aligned(input_path, plan.start))):
+                video_args['vcodec'] = 'copy'
+            else:
+                video_args.update(video_encoder)
+        else:
+            output_args['vn'] = None
+
+        if plan.audio == 'input':
+            if info.get('audio') or not info:
+                audio = source['a:0?']
+                copy = info and _can_hold(ext, audio=info.get('audio'))
+                audio_args.update({'acodec': 'copy'} if copy else audio_encoder)
+        elif plan.audio:
+            audio_path, seek = plan.audio
+            audio = _input(audio_path, seek)['a:0']
+            audio_info = probe(audio_path) or {}
+            copy = audio_info and _can_hold(ext, audio=audio_info.get('audio'))
+            audio_args.update({'acodec': 'copy'} if copy else audio_encoder)
+            # The added audio is cut (or left short) to the video's length
+            if duration:
+                output_args['t'] = duration
+            else:
+                output_args['shortest'] = None
+        if ext in ('.mp4', '.mov') and plan.video:
+            output_args['movflags'] = '+faststart'
+
+        count = _segment_count(segments)
+        workers = min(count, max(1, int(workers or default_workers())))
+        if count > 1 and workers > 1 and plan.video and video_args.get('vcodec') != 'copy' and duration:
+            bounds = segment_bounds(input_path, plan.start, duration, count)
+            if len(bounds) > 1:
+                return _run_segmented(ffmpeg_path, input_path, output_path, plan, bounds, workers, video_args,
+                                      audio, dict(audio_args, **output_args), duration, info.get('fps'), progress)
+
+        streams = ([_video_stream(source, plan)] if plan.video else []) + ([audio] if audio is not None else [])
+        command = ffmpeg.output(*streams, output_path, **dict(video_args, **audio_args, **output_args)) \
+            .global_args(*GLOBAL_ARGS).compile(cmd=ffmpeg_path, overwrite_output=True)
+        run_ffmpeg(command, duration, progress)
+
+    @staticmethod
+    def _fallback(input_path, output_path, steps, progress=None):
+        from utils.conversions import run_conversion
+
+        steps = parse_steps(steps)
+        if len(steps) == 1:
+            name, options = steps[0]
+            return run_conversion(name, input_path, output_path, dict(options, engine='moviepy'), progress)
+        # moviepy has no way to chain: run the steps one after another through temp files
+        with tempfile.TemporaryDirectory(prefix='video-pipeline-') as work:
+            current = input_path
+            for index, (name, options) in enumerate(steps):
+                last = index == len(steps) - 1
+                ext = OPERATIONS.get(name) or os.path.splitext(current)[1]
+                target = output_path if last else os.path.join(work, f"{index}{ext}")
+                run_conversion(name, current, target, dict(options, engine='moviepy'), progress)
+                current = target
+
+    @staticmethod
+    def video_pipeline(input_path, output_path, steps, segments=None, workers=None, progress=None):
+        FfmpegEngine.run_steps(input_path, output_path, steps, segments, workers, progress)
+
+    @staticmethod
+    def trim_video(input_path, output_path, start_time, end_time, progress=None):
+        FfmpegEngine.run_steps(input_path, output_path,
+                               [('trim_video', {'start_time': start_time, 'end_time': end_time})], progress=progress)
+
+    @staticmethod
+    def remove_sound(input_path, output_path, progress=None):
+        FfmpegEngine.run_steps(input_path, output_path, [('remove_sound', {})], progress=progress)
+
+    @staticmethod
+    def change_resolution(input_path, output_path, new_resolution, segments=None, workers=None, progress=None):
+        FfmpegEngine.run_steps(input_path, output_path, [('change_resolution', {'new_resolution': new_resolution})],
+                               segments, workers, progress)
+
+    @staticmethod
+    def add_audio(input_path, audio_path, output_path, progress=None):
+        FfmpegEngine.run_steps(input_path, output_path, [('add_audio', {'audio_path': audio_path})], progress=progress)
+
+    @staticmethod
+    def add_subtitles(input_path, srt_path, output_path, progress=None):
+        FfmpegEngine.run_steps(input_path, output_path, [('add_subtitles', {'srt_path': srt_path})], progress=progress)
+
+    @staticmethod
+    def avi_to_mp4(input_path, output_path, segments=None, workers=None, progress=None):
+        FfmpegEngine.run_steps(input_path, output_path, [('avi_to_mp4', {})], segments, workers, progress)
+
+    @staticmethod
+    def mp4_to_avi(input_path, output_path, segments=None, workers=None, progress=None):
+        FfmpegEngine.run_steps(input_path, output_path, [('mp4_to_avi', {})], segments, workers, progress)
+
+    @staticmethod
+    def gif_to_mp4(input_path, output_path, segments=None, workers=None, progress=None):
+        FfmpegEngine.run_steps(input_path, output_path, [('gif_to_mp4', {})], segments, workers, progress)
+
+    @staticmethod
+    def mp4_to_mp3(input_path, output_path, progress=None):
+        FfmpegEngine.run_steps(input_path, output_path, [('mp4_to_mp3', {})], progress=progress)
+
+
+class PartProgress:
+    """Progress of one part of a job done in several ffmpeg runs, reported as seconds of the whole."""
+
+    def __init__(self, parent, seconds_done, index, length, total, abort):
+        self.parent = parent
+        self.seconds_done = seconds_done
+        self.index = index
+        self.length = length
+        self.total = total
+        self.abort = abort
+
+    def raise_if_cancelled(self):
+        if self.abort.is_set():
+            raise ConversionCancelled("Another part of the job failed")
+        if self.parent:
+            self.parent.raise_if_cancelled()
+
+    def update(self, done, total=None):
+        self.raise_if_cancelled()
+        if total:
+            self.seconds_done[self.index] = min(done / total, 1.0) * self.length
+        if self.parent:
+            self.parent.update(sum(self.seconds_done.values()), self.total)
+
+
+def _run_segmented(ffmpeg_path, input_path, output_path, plan, bounds, workers, video_args, audio, mux_args,
+                   duration, fps=None, progress=None):
+    """
+    Encode the video as keyframe-aligned segments by up to `workers` concurrent ffmpeg processes,
+    join them without re-encoding using the concat demuxer (muxing the audio in the same pass),
+    and check that the result is as long as it should be.
+    """
+    import ffmpeg
+
+    ext = os.path.splitext(output_path)[1].lower()
+    # Every process would otherwise start one encoder thread per core
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    abort = threading.Event()
+    seconds_done = {}
+    work = tempfile.mkdtemp(prefix='segments-', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        segment_paths, commands = [], []
+        for index, (start, length) in enumerate(bounds):
+            segment_path = os.path.join(work, f'{index:05d}{ext}')
+            video = _video_stream(_input(input_path, start, length), plan, start - plan.start)
+            commands.append(ffmpeg.output(video, segment_path, an=None, threads=threads, **video_args)
+                            .global_args(*GLOBAL_ARGS).compile(cmd=ffmpeg_path, overwrite_output=True))
+            segment_paths.append(segment_path)
+
+        error = None
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_ffmpeg, command, length,
+                                   PartProgress(progress, seconds_done, index, length, duration, abort))
+                       for index, (command, (_, length)) in enumerate(zip(commands, bounds))]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except BaseException as e:
+                    abort.set()
+                    if error is None or (isinstance(error, ConversionCancelled)
+                                         and not isinstance(e, ConversionCancelled)):
+                        error = e
+        if error:
+            raise error
+
+        list_path = os.path.join(work, 'segments.txt')
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for segment_path in segment_paths:
+                f.write("file '" + segment_path.replace("'", "'\\''") + "'\n")
+        video = ffmpeg.input(list_path, f='concat', safe=0)['v:0']
+        streams = [video] + ([audio] if audio is not None else [])
+        command = ffmpeg.output(*streams, output_path, vcodec='copy', **mux_args) \
+            .global_args(*GLOBAL_ARGS).compile(cmd=ffmpeg_path, overwrite_output=True)
+        run_ffmpeg(command)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    actual = (probe(output_path) or {}).get('duration')
+    tolerance = max(0.1, 2.0 / fps) if fps else 0.1
+    if actual is None or abs(actual - duration) > tolerance:
+        found = 'no duration' if actual is None else f'{actual:.3f}s'
+        raise RuntimeError(f"Segmented encode of {os.path.basename(input_path)} produced {found}, "
+                           f"expected {duration:.3f}s")
+    if progress:
+        progress.update(1, 1)
+
+
+def run_ffmpeg(command, duration=None, progress=None):
+    """
+    Run an ffmpeg command line that includes '-progress pipe:1', reporting encoded seconds
+    against `duration` and killing ffmpeg when the job is cancelled.
+    """
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors, stdin=subprocess.DEVNULL)
+        try:
+            for line in process.stdout:
+                key, _, value = line.decode('utf-8', 'replace').strip().partition('=')
+                if progress and key == 'out_time_us' and value.isdigit():
+                    progress.update(int(value) / 1e6, duration)
+                elif progress and key == 'progress':
+                    progress.raise_if_cancelled()
+                    if value == 'end':
+                        progress.update(1, 1)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        if process.wait() != 0:
+            errors.seek(0)
+            message = errors.read().decode('utf-8', 'replace').strip().splitlines()
+            raise RuntimeError(f"ffmpeg failed: {message[-1] if message else 'exit code ' + str(process.returncode)}")
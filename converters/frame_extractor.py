@@ -0,0 +1,230 @@
+import os
+import re
+import json
+import shutil
+import bisect
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from converters.ffmpeg_engine import ffmpeg_binary, ffprobe_binary
+from utils.batch_processor import default_workers
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser("~"), '.cache', 'universal-file-converter', 'keyframes')
+
+# Bump when the index format below changes, so indexes cached by the old code are rebuilt
+INDEX_VERSION = '1'
+
+# Targets decoded by one ffmpeg run; more are split into further runs (and spread over workers)
+MAX_TARGETS_PER_RUN = 64
+DEFAULT_FPS = 30.0
+
+IMAGE_FORMATS = {'png': '.png', 'jpg': '.jpg', 'jpeg': '.jpg', 'webp': '.webp'}
+
+SHOWINFO_PTS = re.compile(r'Parsed_showinfo.*\bpts_time:\s*(-?[\d.]+(?:e-?\d+)?)')
+
+
+class KeyframeIndex:
+    """
+    Keyframe times, duration and frame rate of a video's first video stream.
+
+    Built once per file from packet flags with ffprobe, which demuxes but never decodes,
+    and cached as JSON under a fingerprint of the file (see file_fingerprint), so later
+    extractions from the same video start seeking straight away.
+    """
+
+    def __init__(self, keyframes, duration, start_time=0.0, fps=None):
+        self.keyframes = keyframes
+        self.duration = duration
+        self.start_time = start_time
+        self.fps = fps
+
+    @classmethod
+    def build(cls, path):
+        ffprobe = ffprobe_binary()
+        if not ffprobe:
+            raise RuntimeError("Frame extraction needs ffprobe (next to ffmpeg, or on PATH)")
+        command = [ffprobe, '-v', 'error', '-select_streams', 'v:0',
+                   '-show_entries', 'packet=pts_time,flags:stream=avg_frame_rate:format=duration,start_time',
+                   '-of', 'json', path]
+        info = json.loads(subprocess.run(command, capture_output=True, check=True).stdout or b'{}')
+        keyframes = sorted(float(p['pts_time']) for p in info.get('packets', [])
+                           if 'K' in p.get('flags', '') and p.get('pts_time', 'N/A') != 'N/A')
+        fps = None
+        streams = info.get('streams') or [{}]
+        num, _, den = streams[0].get('avg_frame_rate', '0/0').partition('/')
+        if den and float(den) and float(num):
+            fps = float(num) / float(den)
+        format_info = info.get('format', {})
+        start_time = float(format_info.get('start_time') or 0)
+        duration = float(format_info.get('duration') or 0)
+        return cls(keyframes or [start_time], duration, start_time, fps)
+
+    @classmethod
+    def load(cls, path, cache_dir=DEFAULT_INDEX_DIR):
+        from utils.result_cache import file_fingerprint
+
+        cache_path = os.path.join(cache_dir, f"{file_fingerprint(path)}-{INDEX_VERSION}.json")
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            pass
+        index = cls.build(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(index.__dict__, f)
+        os.replace(temp_path, cache_path)
+        return index
+
+    def keyframe_before(self, seconds):
+        """Latest keyframe at or before `seconds` (on the stream's own timeline)."""
+        position = bisect.bisect_right(self.keyframes, seconds + 1e-6)
+        return self.keyframes[max(0, position - 1)]
+
+
+def plan_runs(targets, index, max_targets=MAX_TARGETS_PER_RUN, min_runs=1):
+    """
+    Split sorted target times into runs that each seek once and then decode forward.
+
+    A target joins the current run when the keyframe before it is not past the previous
+    target, i.e. when seeking would not skip anything decoding forward has to read anyway.
+    Runs are split further to give `min_runs` runs for the workers to share.
+    """
+    runs = []
+    for seconds in targets:
+        if runs and len(runs[-1]) < max_targets and index.keyframe_before(seconds) <= runs[-1][-1]:
+            runs[-1].append(seconds)
+        else:
+            runs.append([seconds])
+    while len(runs) < min_runs:
+        largest = max(range(len(runs)), key=lambda i: len(runs[i]))
+        if len(runs[largest]) < 2:
+            break
+        run = runs.pop(largest)
+        runs[largest:largest] = [run[:len(run) // 2], run[len(run) // 2:]]
+    return runs
+
+
+def _encoder_args(ext, quality):
+    if ext == '.jpg':
+        # mjpeg's qscale runs from 2 (best) to 31
+        return ['-q:v', str(round(2 + (100 - quality) * 29 / 100))]
+    if ext == '.webp':
+        return ['-c:v', 'libwebp', '-quality', str(quality)]
+    return ['-c:v', 'png']
+
+
+class FrameExtractor:
+    """
+    Frame extraction that seeks through a keyframe index instead of decoding from the start.
+
+    The wanted times (`frame_times`, or every 1/`fps` seconds) are sorted and grouped into
+    runs (see plan_runs). Each run is one ffmpeg process that seeks to the keyframe before
+    its first frame, decodes forward through its frames in a single pass and writes them as
+    PNG, JPEG or WebP (`format`). Runs are shared between `workers` processes.
+    """
+
+    @staticmethod
+    def extract_frames(input_path, output_path, frame_times=None, fps=None, format='png', quality=90, workers=None,
+                       progress=None):
+        ffmpeg_path = ffmpeg_binary()
+        if not ffmpeg_path:
+            from utils.conversions import run_conversion
+            return run_conversion('extract_frames', input_path, output_path,
+                                  {'frame_times': frame_times, 'fps': fps, 'engine': 'moviepy'}, progress)
+        ext = IMAGE_FORMATS.get(str(format or 'png').lower().lstrip('.'))
+        if ext is None:
+            raise ValueError(f"Frames can be written as {', '.join(IMAGE_FORMATS)}, not '{format}'")
+
+        index = KeyframeIndex.load(input_path)
+        if frame_times is not None:
+            times = [float(t) for t in (frame_times if isinstance(frame_times, (list, tuple)) else [frame_times])]
+        elif fps:
+            count = int(index.duration * float(fps) + 1e-9)
+            times = [i / float(fps) for i in range(max(count, 1))]
+        else:
+            raise ValueError("extract_frames needs frame_times or fps")
+        for seconds in times:
+            if seconds < 0 or (index.duration and seconds > index.duration):
+                raise ValueError(f"Frame time {seconds}s is outside the video (0-{index.duration:.3f}s)")
+
+        os.makedirs(output_path, exist_ok=True)
+        targets = sorted(set(times))
+        workers = max(1, int(workers or default_workers()))
+        runs = plan_runs([t + index.start_time for t in targets], index, min_runs=min(workers, len(targets)))
+        threads = max(1, (os.cpu_count() or 1) // min(workers, len(runs)))
+        written = {}
+        done = [0]
+        lock = threading.Lock()
+
+        def on_frame():
+            with lock:
+                done[0] += 1
+            if progress:
+                progress.update(done[0], len(targets))
+
+        def extract(number, run):
+            pattern = os.path.join(output_path, f'.run{number:04d}-%05d{ext}')
+            frames = FrameExtractor._decode_run(ffmpeg_path, input_path, index, run, pattern,
+                                                _encoder_args(ext, int(quality)), threads, on_frame, progress)
+            return run, [pattern % i for i in range(len(frames))], frames
+
+        half_frame = 0.5 / (index.fps or DEFAULT_FPS)
+        outputs = []
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for run, files, frames in pool.map(extract, range(len(runs)), runs):
+                    for seconds in run if frames else ():
+                        frame = min(bisect.bisect_left(frames, seconds - half_frame - 1e-6), len(frames) - 1)
+                        written[round(seconds - index.start_time, 6)] = files[frame]
+            # Files are named after the requested order; a frame asked for twice is written twice
+            for number, seconds in enumerate(times):
+                source = written.get(round(seconds, 6))
+                if source:
+                    target = os.path.join(output_path, f"frame_{number + 1:05d}_{seconds:.3f}s{ext}")
+                    shutil.copyfile(source, target)
+                    outputs.append(target)
+        finally:
+            for name in os.listdir(output_path):
+                if name.startswith('.run') and name.endswith(ext):
+                    os.remove(os.path.join(output_path, name))
+        if len(outputs) < len(times):
+            raise RuntimeError(f"Only {len(outputs)} of {len(times)} frames could be extracted")
+        return outputs
+
+    @staticmethod
+    def _decode_run(ffmpeg_path, input_path, index, run, pattern, encoder_args, threads, on_frame, progress=None):
+        """
+        Seek to the keyframe before run[0], decode forward and write the frame nearest each
+        time in `run` (absolute stream times). Returns the times of the frames written.
+        """
+        seek = index.keyframe_before(run[0])
+        half_frame = 0.5 / (index.fps or DEFAULT_FPS)
+        # The first frame at or after each time (less half a frame, so the nearest one wins)
+        select = '+'.join(f'gte(t,{t:.6f})*not(gte(prev_t,{t:.6f}))' for t in (s - half_frame for s in run))
+        command = [ffmpeg_path, '-nostdin', '-hide_banner', '-nostats', '-loglevel', 'info', '-copyts',
+                   '-ss', f'{seek - index.start_time:.6f}', '-t', f'{run[-1] - seek + 1:.6f}', '-i', input_path,
+                   '-map', '0:v:0', '-vf', f"select='{select}',showinfo", '-vsync', 'passthrough',
+                   '-threads', str(threads), *encoder_args, '-start_number', '0', '-y', pattern]
+        frames = []
+        tail = deque(maxlen=5)
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                   stdin=subprocess.DEVNULL)
+        try:
+            for line in process.stderr:
+                line = line.decode('utf-8', 'replace').strip()
+                match = SHOWINFO_PTS.search(line)
+                if match:
+                    frames.append(float(match.group(1)))
+                    on_frame()
+                elif line:
+                    tail.append(line)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed: {tail[-1] if tail else 'exit code ' + str(process.returncode)}")
+        return frames
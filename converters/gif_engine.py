@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import threading
+from converters.ffmpeg_engine import GLOBAL_ARGS, PartProgress, ffmpeg_binary, probe, run_ffmpeg
+
+# Frame rate used when none is given: GIFs above this mostly get larger, not smoother
+DEFAULT_MAX_FPS = 15
+# Re-encodes allowed to get under `max_bytes`, and the floors the size search stops at
+MAX_SIZE_ATTEMPTS = 5
+MIN_WIDTH = 64
+MIN_FPS = 4
+
+WEBP_ARGS = {'vcodec': 'libwebp_anim', 'lossless': 0, 'q:v': 75, 'compression_level': 4}
+
+
+def output_ext(options):
+    return '.webp' if str(options.get('format') or '').lower().lstrip('.') == 'webp' else '.gif'
+
+
+def _frames(source, fps, width, quantize=False):
+    video = source['v:0'].filter('fps', fps=fps)
+    if width:
+        video = video.filter('scale', int(width), -1, flags='lanczos')
+    if quantize:
+        # palettegen and paletteuse keep a table entry per distinct colour they have seen, which
+        # grows with the clip; at 15-bit colour it is bounded, and 256 colours come out anyway
+        video = video.filter('format', 'rgb555')
+    return video
+
+
+class GifEngine:
+    """
+    Video to animated GIF (or WebP) with ffmpeg, replacing the moviepy path that held every
+    frame as an array.
+
+    GIFs are made in two streaming passes: palettegen collects a 256-colour palette suited to
+    the clip, then paletteuse maps the frames onto it. Doing it in one pass would make ffmpeg
+    buffer the whole clip until the palette is ready, so peak memory would grow with its
+    length. Frames are decimated to `fps` and scaled down to `max_width` before either pass;
+    with `max_bytes` the result is re-encoded smaller until it fits. `format='webp'` writes
+    an animated WebP in a single pass instead. Without an ffmpeg binary the moviepy
+    implementation (`engine=moviepy`) is used and these options are ignored.
+    """
+
+    @staticmethod
+    def mp4_to_gif(input_path, output_path, fps=None, max_width=None, max_bytes=None, format=None, progress=None):
+        ffmpeg_path = ffmpeg_binary()
+        if not ffmpeg_path:
+            from utils.conversions import run_conversion
+            return run_conversion('mp4_to_gif', input_path, output_path, {'engine': 'moviepy'}, progress)
+
+        info = probe(input_path) or {}
+        webp = output_ext({'format': format or os.path.splitext(output_path)[1]}) == '.webp'
+        fps = float(fps or min(info.get('fps') or DEFAULT_MAX_FPS, DEFAULT_MAX_FPS))
+        width = info.get('width')
+        if max_width and (not width or int(max_width) < width):
+            width = int(max_width)
+
+        smallest = None  # (size, width, fps) of the smallest encode so far
+        for _ in range(MAX_SIZE_ATTEMPTS):
+            GifEngine._encode(ffmpeg_path, input_path, output_path, fps, width, webp, info.get('duration'), progress)
+            size = os.path.getsize(output_path)
+            if not max_bytes or size <= int(max_bytes):
+                return
+            if smallest is None or size < smallest[0]:
+                smallest = (size, width, fps)
+            # Size goes roughly with frame area: shrink the width first, then drop frames
+            ratio = int(max_bytes) / size * 0.9
+            if width and width * ratio ** 0.5 >= MIN_WIDTH:
+                width = max(MIN_WIDTH, int(width * ratio ** 0.5) // 2 * 2)
+            elif fps > MIN_FPS:
+                fps = max(MIN_FPS, fps * ratio)
+            else:
+                break
+        size, width, fps = smallest
+        raise RuntimeError(f"Could not get {os.path.basename(output_path)} under {int(max_bytes)} bytes "
+                           f"(smallest was {size} bytes at {width}px wide, {fps:g} fps)")
+
+    @staticmethod
+    def _encode(ffmpeg_path, input_path, output_path, fps, width, webp, duration=None, progress=None):
+        import ffmpeg
+
+        if webp:
+            command = ffmpeg.output(_frames(ffmpeg.input(input_path), fps, width), output_path, an=None, loop=0,
+                                    **WEBP_ARGS)
+            run_ffmpeg(command.global_args(*GLOBAL_ARGS).compile(cmd=ffmpeg_path, overwrite_output=True),
+                       duration, progress)
+            return
+
+        seconds_done = {}
+        abort = threading.Event()
+        total = 2 * duration if duration else None
+        work = tempfile.mkdtemp(prefix='gif-')
+        try:
+            palette_path = os.path.join(work, 'palette.png')
+            palette = _frames(ffmpeg.input(input_path), fps, width, quantize=True).filter('palettegen', stats_mode='diff')
+            command = ffmpeg.output(palette, palette_path, vframes=1, update=1)
+            run_ffmpeg(command.global_args(*GLOBAL_ARGS).compile(cmd=ffmpeg_path, overwrite_output=True),
+                       duration, PartProgress(progress, seconds_done, 0, duration or 0, total, abort))
+
+            frames = _frames(ffmpeg.input(input_path), fps, width, quantize=True)
+            mapped = ffmpeg.filter([frames, ffmpeg.input(palette_path)], 'paletteuse', dither='bayer',
+                                   bayer_scale=5, diff_mode='rectangle')
+            command = ffmpeg.output(mapped, output_path, an=None, loop=0)
+            run_ffmpeg(command.global_args(*GLOBAL_ARGS).compile(cmd=ffmpeg_path, overwrite_output=True),
+                       duration, PartProgress(progress, seconds_done, 1, duration or 0, total, abort))
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
@@ -0,0 +1,132 @@
+import os
+import io
+import zlib
+from converters.pdf_writer import PdfWriter
+
+# EXIF orientations a PDF page's /Rotate can express; mirrored ones are re-encoded instead
+EXIF_ROTATION = {1: 0, 3: 180, 6: 90, 8: 270}
+COLOR_SPACES = {'1': ('/DeviceGray', 1), 'L': ('/DeviceGray', 8), 'RGB': ('/DeviceRGB', 8),
+                'CMYK': ('/DeviceCMYK', 8)}
+DEFAULT_DPI = 72.0
+
+
+def _image_dpi(image, dpi):
+    if dpi:
+        return float(dpi), float(dpi)
+    x, y = image.info.get('dpi') or (DEFAULT_DPI, DEFAULT_DPI)
+    # Some files store 0 or a bogus 1 dpi
+    return (float(x) if x and x > 1 else DEFAULT_DPI), (float(y) if y and y > 1 else DEFAULT_DPI)
+
+
+def _orientation(image):
+    try:
+        return image.getexif().get(0x0112, 1)
+    except Exception:
+        return 1
+
+
+def _flatten(image):
+    """The image in a mode PDF can embed directly; transparency goes onto white, like print."""
+    from PIL import Image
+
+    if image.mode in COLOR_SPACES:
+        return image
+    if image.mode == 'P':
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    if image.mode in ('RGBA', 'LA', 'PA', 'RGBa', 'La'):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    if image.mode.startswith('I') or image.mode == 'F':
+        return image.convert('L')
+    return image.convert('RGB')
+
+
+class PdfImageWriter(PdfWriter):
+    """
+    Writes a PDF of one image per page, page by page (see PdfWriter), so only the current
+    page is ever in memory. Each page is sized to its image at the image's resolution.
+
+    JPEGs are embedded as they are (DCTDecode) with `add_jpeg`: their bytes are copied from
+    the file into the PDF without being decoded or re-encoded. Other images are stored
+    losslessly (FlateDecode), or as JPEG when a `quality` is given.
+    """
+
+    def _add_image_page(self, image_id, width, height, dpi, rotate=0):
+        page_width = width * 72.0 / dpi[0]
+        page_height = height * 72.0 / dpi[1]
+        content = f'q {page_width:.4f} 0 0 {page_height:.4f} 0 0 cm /Im0 Do Q'.encode('ascii')
+        self.add_page(page_width, page_height, content, f'<< /XObject << /Im0 {image_id} 0 R >> >>', rotate)
+
+    def add_jpeg(self, path, image, dpi=None):
+        """
+        Embed the JPEG file at `path` (opened as `image`, which is not decoded) without
+        re-encoding it. Returns False if it cannot be passed through (e.g. a mirrored EXIF
+        orientation), so the caller can use add_image instead.
+        """
+        if image.format != 'JPEG' or image.mode not in ('L', 'RGB', 'CMYK'):
+            return False
+        rotate = EXIF_ROTATION.get(_orientation(image))
+        if rotate is None:
+            return False
+        color_space, bits = COLOR_SPACES[image.mode]
+        # Adobe writes CMYK JPEGs inverted
+        decode = ' /Decode [1 0 1 0 1 0 1 0]' if image.mode == 'CMYK' and 'adobe' in image.info else ''
+        image_id = self.new_id()
+        with open(path, 'rb') as source:
+            self.write_stream(image_id, f'/Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} '
+                                        f'/ColorSpace {color_space} /BitsPerComponent {bits} '
+                                        f'/Filter /DCTDecode{decode}', source=source, length=os.path.getsize(path))
+        self._add_image_page(image_id, image.width, image.height, _image_dpi(image, dpi), rotate)
+        return True
+
+    def add_image(self, image, dpi=None, quality=None):
+        """Embed a PIL image, decoding it; EXIF orientation is applied."""
+        from PIL import ImageOps
+
+        resolution = _image_dpi(image, dpi)
+        if _orientation(image) != 1:
+            image = ImageOps.exif_transpose(image)
+        image = _flatten(image)
+        color_space, bits = COLOR_SPACES[image.mode]
+        if quality and image.mode != '1':
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=int(quality))
+            data, stream_filter = buffer.getvalue(), '/DCTDecode'
+        else:
+            data, stream_filter = zlib.compress(image.tobytes(), 6), '/FlateDecode'
+        image_id = self.new_id()
+        self.write_stream(image_id, f'/Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} '
+                                    f'/ColorSpace {color_space} /BitsPerComponent {bits} /Filter {stream_filter}', data)
+        self._add_image_page(image_id, image.width, image.height, resolution)
+
+
+class ImagePdfConverter:
+    """
+    images_to_pdf through PdfImageWriter: each image is opened, written as a page and closed
+    before the next, so memory use is that of the largest page, however many images there are.
+    """
+
+    @staticmethod
+    def images_to_pdf(input_paths, output_path, dpi=None, jpeg_passthrough=True, quality=None, progress=None):
+        """
+        Every frame of multi-page images (e.g. TIFF scans) becomes a page. `dpi` overrides
+        the resolution stored in the images (72 if they have none), which sets the page size.
+        With `jpeg_passthrough`, JPEGs are embedded without re-encoding; `quality` re-encodes
+        the other images as JPEG instead of storing them losslessly.
+        """
+        from PIL import Image, ImageSequence
+
+        if isinstance(input_paths, str):
+            input_paths = input_paths.split(';')
+        if not input_paths:
+            raise ValueError("images_to_pdf needs at least one image")
+        with PdfImageWriter(output_path) as writer:
+            for done, path in enumerate(input_paths, 1):
+                with Image.open(path) as image:
+                    if not (jpeg_passthrough and writer.add_jpeg(path, image, dpi)):
+                        for frame in ImageSequence.Iterator(image):
+                            writer.add_image(frame, dpi, quality)
+                if progress:
+                    progress.update(done, len(input_paths))
@@ -0,0 +1,153 @@
+import os
+from utils.conversions import parse_steps
+
+FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.bmp': 'BMP', '.webp': 'WEBP', '.gif': 'GIF',
+           '.tif': 'TIFF', '.tiff': 'TIFF'}
+DEFAULT_QUALITY = 90
+
+
+def _format_step(name):
+    """Output extension set by a format conversion step such as png_to_webp, else None."""
+    from utils.conversions import CONVERSIONS, IMAGE
+
+    conversion = CONVERSIONS.get(name)
+    if conversion and conversion.backend == IMAGE and conversion.output_ext in FORMATS:
+        return conversion.output_ext
+    return None
+
+
+def output_ext_for_steps(steps, output_format=None):
+    """Extension of the file a pipeline writes, or None to keep the input's format."""
+    if output_format:
+        return '.' + output_format.lower().lstrip('.')
+    ext = None
+    for name, _ in parse_steps(steps):
+        ext = _format_step(name) or ext
+    return ext
+
+
+def _resize(image, size):
+    # reducing_gap lets Pillow shrink by whole factors with reduce() before the final resample
+    return image.resize(tuple(size), _resample(), reducing_gap=3.0)
+
+
+def _resample():
+    from PIL import Image
+    return getattr(Image, 'Resampling', Image).LANCZOS
+
+
+def _rotate(image, degrees):
+    return image.rotate(float(degrees), expand=True)
+
+
+def _flip(image, direction):
+    from PIL import ImageOps
+    if direction == 'horizontal':
+        return ImageOps.mirror(image)
+    if direction == 'vertical':
+        return ImageOps.flip(image)
+    raise ValueError(f"Flip direction must be 'horizontal' or 'vertical', got '{direction}'")
+
+
+def _grayscale(image):
+    return image.convert('LA' if 'A' in image.getbands() else 'L')
+
+
+def _watermark(image, watermark_text, position, font_size, font_path=None):
+    from PIL import Image, ImageDraw, ImageFont
+
+    try:
+        font = ImageFont.truetype(font_path or 'arial.ttf', int(font_size))
+    except OSError:
+        font = ImageFont.load_default()
+    base = image.convert('RGBA')
+    overlay = Image.new('RGBA', base.size, (255, 255, 255, 0))
+    ImageDraw.Draw(overlay).text(tuple(position), watermark_text, font=font, fill=(255, 255, 255, 128))
+    return Image.alpha_composite(base, overlay)
+
+
+OPERATIONS = {
+    'resize_image': _resize,
+    'rotate_image': _rotate,
+    'flip_image': _flip,
+    'convert_to_grayscale': _grayscale,
+    'add_watermark': _watermark,
+}
+
+
+class ImagePipeline:
+    """
+    A chain of image edits and format conversions applied with a single decode and a
+    single encode.
+
+    `steps` (see parse_steps) may contain the editing operations in OPERATIONS, `compress_image`
+    (sets the encode quality) and format conversions such as `png_to_webp` (set the output
+    format). When the first operation is a resize, JPEG inputs are decoded at a reduced scale
+    with Pillow's draft mode, so large photos are never fully decoded just to be shrunk.
+    """
+
+    def __init__(self, steps, output_format=None):
+        self.transforms = []
+        self.quality = None
+        self.output_ext = output_ext_for_steps(steps, output_format)
+        for name, options in parse_steps(steps):
+            if name in OPERATIONS:
+                self.transforms.append((name, options))
+            elif name == 'compress_image':
+                self.quality = int(options.get('quality', DEFAULT_QUALITY))
+            elif not _format_step(name):
+                raise ValueError(f"Unsupported image pipeline step: {name}")
+
+    def draft_size(self):
+        if self.transforms and self.transforms[0][0] == 'resize_image':
+            return tuple(self.transforms[0][1]['size'])
+        return None
+
+    def open(self, input_path):
+        from PIL import Image
+
+        image = Image.open(input_path)
+        size = self.draft_size()
+        if size and image.format == 'JPEG':
+            image.draft(image.mode, size)  # Picks the smallest DCT scale still >= size
+        image.load()
+        return image
+
+    def apply(self, image):
+        for name, options in self.transforms:
+            image = OPERATIONS[name](image, **options)
+        return image
+
+    def save(self, image, output_path):
+        image_format = FORMATS.get(os.path.splitext(output_path)[1].lower())
+        if image_format is None:
+            raise ValueError(f"Unsupported image output format: {output_path}")
+        params = {}
+        if image_format in ('JPEG', 'WEBP'):
+            params['quality'] = self.quality or DEFAULT_QUALITY
+        elif image_format == 'PNG' and self.quality:
+            params['optimize'] = True
+        if image_format in ('JPEG', 'BMP') and image.mode not in ('RGB', 'L'):
+            image = image.convert('L' if image.mode == 'LA' else 'RGB')
+        image.save(output_path, image_format, **params)
+
+    def process(self, input_path, output_path, progress=None):
+        total = len(self.transforms) + 2
+        image = self.open(input_path)
+        if progress:
+            progress.update(1, total)
+        for done, (name, options) in enumerate(self.transforms, 2):
+            image = OPERATIONS[name](image, **options)
+            if progress:
+                progress.update(done, total)
+        self.save(image, output_path)
+        if progress:
+            progress.update(total, total)
+
+    @staticmethod
+    def image_pipeline(input_path, output_path, steps, format=None, progress=None):
+        if os.path.isdir(output_path):
+            from utils.conversions import output_path_for
+            output_path = output_path_for('image_pipeline', input_path, output_path,
+                                          {'steps': steps, 'format': format})
+        ImagePipeline(steps, format).process(input_path, output_path, progress)
@@ -0,0 +1,388 @@
+import os
+import json
+import html
+import time
+import sqlite3
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from utils.batch_processor import default_workers
+
+DEFAULT_PAGE_CACHE_DIR = os.path.join(os.path.expanduser("~"), '.cache', 'universal-file-converter', 'pages')
+DEFAULT_PAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_DPI = 150
+IMAGE_FORMATS = {'png': ('.png', 'PNG'), 'jpg': ('.jpg', 'JPEG'), 'jpeg': ('.jpg', 'JPEG'),
+                 'webp': ('.webp', 'WEBP'), 'tiff': ('.tiff', 'TIFF'), 'bmp': ('.bmp', 'BMP')}
+
+# Bump when the extraction below changes, so pages cached by the old code are parsed again
+EXTRACTOR_VERSION = '1'
+
+
+def parse_page_range(spec, page_count):
+    """
+    Turn a page range such as '1-5,8,10-' (1-based, inclusive, open ended with a trailing '-')
+    into a sorted list of 0-based page indexes. None or '' selects every page.
+    """
+    if not spec:
+        return list(range(page_count))
+    if isinstance(spec, int):
+        spec = str(spec)
+    pages = set()
+    for part in str(spec).replace(' ', '').split(','):
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                start, end = part.split('-', 1)
+                start = int(start) if start else 1
+                end = int(end) if end else page_count
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise ValueError(f"Invalid page range: '{spec}'") from None
+        if start < 1 or end < start:
+            raise ValueError(f"Invalid page range: '{part}'")
+        pages.update(range(start - 1, min(end, page_count)))
+    if not pages:
+        raise ValueError(f"Page range '{spec}' selects no pages (the document has {page_count})")
+    return sorted(pages)
+
+
+def _extract_chunk(input_path, page_numbers):
+    """Extract text and tables of the given 0-based pages. Runs in a worker process."""
+    import pdfplumber
+
+    extracted = []
+    with pdfplumber.open(input_path) as pdf:
+        for number in page_numbers:
+            page = pdf.pages[number]
+            extracted.append({'page': number + 1,
+                              'text': page.extract_text() or '',
+                              'tables': page.extract_tables()})
+            page.flush_cache()  # pdfplumber keeps every parsed page's objects otherwise
+    return extracted
+
+
+def _render_chunk(input_path, page_numbers, output_dir, dpi, image_format, quality):
+    """
+    Rasterize the given 0-based pages to image files and return their paths. Runs in a
+    worker process, holding one page's bitmap at a time.
+    """
+    ext, pil_format = IMAGE_FORMATS[image_format]
+    params = {'quality': quality} if pil_format in ('JPEG', 'WEBP') else {}
+    paths = []
+    try:
+        import pypdfium2
+    except ImportError:
+        pypdfium2 = None
+    if pypdfium2:
+        # pdfplumber's own renderer; opened once per chunk rather than once per page
+        pdf = pypdfium2.PdfDocument(input_path)
+        try:
+            for number in page_numbers:
+                page = pdf[number]
+                image = page.render(scale=dpi / 72).to_pil()
+                page.close()
+                paths.append(_save_page(image, output_dir, number, ext, pil_format, params))
+        finally:
+            pdf.close()
+        return paths
+
+    import pdfplumber
+
+    with pdfplumber.open(input_path) as pdf:
+        for number in page_numbers:
+            page = pdf.pages[number]
+            image = page.to_image(resolution=dpi).original
+            page.flush_cache()
+            paths.append(_save_page(image, output_dir, number, ext, pil_format, params))
+    return paths
+
+
+def _save_page(image, output_dir, number, ext, pil_format, params):
+    if pil_format in ('JPEG', 'BMP') and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    path = os.path.join(output_dir, f"page_{number + 1:04d}{ext}")
+    image.save(path, pil_format, **params)
+    return path
+
+
+def _chunks(numbers, workers):
+    # Several chunks per worker so a slow stretch of pages does not leave the others idle
+    chunk_size = max(1, -(-len(numbers) // (workers * 4)))
+    return [numbers[i:i + chunk_size] for i in range(0, len(numbers), chunk_size)]
+
+
+def _run_chunks(work, chunks, workers, collect, progress=None):
+    """
+    Call `collect(work(chunk))` for every chunk of pages, in a process pool of `workers`
+    processes when there is more than one chunk. `work` must be picklable; each worker opens
+    the document itself, so nothing large is pickled between processes.
+    """
+    if workers == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            collect(work(chunk))
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)),
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        pending = {pool.submit(work, chunk) for chunk in chunks}
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future.result())
+                if progress:
+                    progress.raise_if_cancelled()
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+
+class PageCache:
+    """
+    Extracted pages kept in SQLite, keyed by document (see document_key) and page number,
+    so converting the same PDF to another format (or another page range) skips parsing.
+    Least recently used pages are dropped once the cache holds more than `max_bytes`.
+
+    Connections are opened lazily per thread, like ResultCache's.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_PAGE_CACHE_DIR, max_bytes=DEFAULT_PAGE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            conn = self._local.conn = sqlite3.connect(os.path.join(self.cache_dir, 'pages.sqlite'),
+                                                      timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS pages (document TEXT, number INTEGER, data TEXT, '
+                         'size INTEGER, last_used REAL, PRIMARY KEY (document, number))')
+        return conn
+
+    @staticmethod
+    def document_key(path):
+        """Sampled content hash (see file_fingerprint) with size and mtime, so the PDF is not read whole."""
+        from utils.result_cache import file_fingerprint
+
+        stat = os.stat(path)
+        return f"{file_fingerprint(path)}-{stat.st_size}-{stat.st_mtime_ns}-{EXTRACTOR_VERSION}"
+
+    def get(self, document, number):
+        row = self.conn.execute('SELECT data FROM pages WHERE document = ? AND number = ?',
+                                (document, number)).fetchone()
+        if row is None:
+            return None
+        self.conn.execute('UPDATE pages SET last_used = ? WHERE document = ? AND number = ?',
+                          (time.time(), document, number))
+        return json.loads(row[0])
+
+    def put(self, document, page):
+        data = json.dumps(page, ensure_ascii=False)
+        self.conn.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)',
+                          (document, page['page'] - 1, data, len(data.encode('utf-8')), time.time()))
+
+    def evict(self):
+        """Drop least recently used pages until the cache fits in max_bytes."""
+        total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for document, number, size in self.conn.execute(
+                'SELECT document, number, size FROM pages ORDER BY last_used').fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute('DELETE FROM pages WHERE document = ? AND number = ?', (document, number))
+            total -= size
+
+
+def extract_pages(input_path, pages=None, workers=None, progress=None, cache=None):
+    """
+    Extract the selected pages of a PDF, in page order, as dicts with 'page' (1-based),
+    'text' and 'tables'.
+
+    Pages missing from `cache` (a PageCache) are split into chunks and extracted in a process
+    pool of `workers` processes (see _run_chunks). `progress` receives (pages done, pages
+    selected).
+    """
+    import pdfplumber
+
+    with pdfplumber.open(input_path) as pdf:
+        page_count = len(pdf.pages)
+    selected = parse_page_range(pages, page_count)
+    workers = max(1, int(workers or default_workers()))
+
+    document = cache.document_key(input_path) if cache else None
+    results = {}
+    if cache:
+        for number in selected:
+            page = cache.get(document, number)
+            if page is not None:
+                results[number] = page
+    missing = [number for number in selected if number not in results]
+
+    def collect(extracted):
+        for page in extracted:
+            results[page['page'] - 1] = page
+            if cache:
+                cache.put(document, page)
+        if progress:
+            progress.update(len(results), len(selected))
+
+    if progress:
+        progress.update(len(results), len(selected))
+    _run_chunks(functools.partial(_extract_chunk, input_path), _chunks(missing, workers), workers, collect, progress)
+    if cache and missing:
+        cache.evict()
+    return [results[number] for number in selected]
+
+
+def _clean_table(table):
+    return [['' if cell is None else str(cell) for cell in row] for row in table]
+
+
+def _markdown_table(table):
+    rows = [[cell.replace('|', '\\|').replace('\n', ' ') for cell in row] for row in _clean_table(table)]
+    if not rows:
+        return ''
+    width = max(len(row) for row in rows)
+    rows = [row + [''] * (width - len(row)) for row in rows]
+    lines = ['| ' + ' | '.join(rows[0]) + ' |', '|' + ' --- |' * width]
+    lines += ['| ' + ' | '.join(row) + ' |' for row in rows[1:]]
+    return '\n'.join(lines)
+
+
+class PdfPageConverter:
+    """
+    PDF to Word/HTML/Markdown/Excel, extracting pages in parallel (see extract_pages), and
+    PDF to images, rasterizing pages in parallel.
+
+    Every conversion takes `pages` (e.g. '1-5,8') to convert only part of the document and
+    `workers` to size the process pool. Extracted pages are cached, so running the same PDF
+    through a second output format reuses the first run's parsing.
+    """
+
+    @staticmethod
+    def pdf_to_images(input_path, output_path, dpi=DEFAULT_DPI, format='png', quality=90, pages=None, workers=None,
+                      progress=None):
+        """
+        Render the selected pages at `dpi` into the `output_path` directory as page_0001.png
+        and so on (`format` png, jpeg, webp, tiff or bmp). Returns the paths in page order.
+        """
+        import pdfplumber
+
+        image_format = str(format or 'png').lower().lstrip('.')
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Pages can be written as {', '.join(IMAGE_FORMATS)}, not '{format}'")
+        dpi = float(dpi or DEFAULT_DPI)
+        if not 1 <= dpi <= 2400:
+            raise ValueError(f"DPI must be between 1 and 2400, not {dpi:g}")
+        with pdfplumber.open(input_path) as pdf:
+            page_count = len(pdf.pages)
+        selected = parse_page_range(pages, page_count)
+        workers = max(1, int(workers or default_workers()))
+        os.makedirs(output_path, exist_ok=True)
+
+        written = []
+
+        def collect(paths):
+            written.extend(paths)
+            if progress:
+                progress.update(len(written), len(selected))
+
+        if progress:
+            progress.update(0, len(selected))
+        work = functools.partial(_render_chunk, input_path, output_dir=output_path, dpi=dpi,
+                                 image_format=image_format, quality=int(quality))
+        _run_chunks(work, _chunks(selected, workers), workers, collect, progress)
+        return sorted(written)
+
+    @staticmethod
+    def pdf_to_word(input_path, output_path, pages=None, workers=None, progress=None):
+        from docx import Document
+
+        document = Document()
+        for index, page in enumerate(extract_pages(input_path, pages, workers, progress, PageCache())):
+            if index:
+                document.add_page_break()
+            for line in page['text'].splitlines():
+                document.add_paragraph(line)
+            for table in page['tables']:
+                rows = _clean_table(table)
+                if not rows:
+                    continue
+                word_table = document.add_table(rows=len(rows), cols=max(len(row) for row in rows))
+                word_table.style = 'Table Grid'
+                for row, cells in zip(word_table.rows, rows):
+                    for cell, value in zip(row.cells, cells):
+                        cell.text = value
+        document.save(output_path)
+
+    @staticmethod
+    def pdf_to_html(input_path, output_path, pages=None, workers=None, progress=None):
+        extracted = extract_pages(input_path, pages, workers, progress, PageCache())
+        with open(output_path, 'w', encoding='utf-8') as out:
+            out.write('<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>'
+                      f'{html.escape(os.path.basename(input_path))}</title></head>\n<body>\n')
+            for page in extracted:
+                out.write(f'<div class="page" id="page-{page["page"]}">\n')
+                for line in page['text'].splitlines():
+                    out.write(f'<p>{html.escape(line)}</p>\n')
+                for table in page['tables']:
+                    out.write('<table border="1">\n')
+                    for row in _clean_table(table):
+                        out.write('<tr>' + ''.join(f'<td>{html.escape(cell)}</td>' for cell in row) + '</tr>\n')
+                    out.write('</table>\n')
+                out.write('</div>\n')
+            out.write('</body>\n</html>\n')
+
+    @staticmethod
+    def pdf_to_md(input_path, output_path, pages=None, workers=None, progress=None):
+        extracted = extract_pages(input_path, pages, workers, progress, PageCache())
+        with open(output_path, 'w', encoding='utf-8') as out:
+            for index, page in enumerate(extracted):
+                if index:
+                    out.write('---\n\n')
+                if page['text']:
+                    out.write('\n\n'.join(page['text'].splitlines()) + '\n\n')
+                for table in page['tables']:
+                    out.write(_markdown_table(table) + '\n\n')
+
+    @staticmethod
+    def pdf_to_excel(input_path, output_path, pages=None, workers=None, progress=None):
+        from openpyxl import Workbook
+
+        # One sheet per page holding its tables; documents without tables get their text lines
+        extracted = extract_pages(input_path, pages, workers, progress, PageCache())
+        workbook = Workbook(write_only=True)
+        has_tables = any(page['tables'] for page in extracted)
+        for page in extracted:
+            if has_tables and not page['tables']:
+                continue
+            sheet = workbook.create_sheet(f"Page {page['page']}")
+            if not has_tables:
+                for line in page['text'].splitlines():
+                    sheet.append([line])
+                continue
+            for index, table in enumerate(page['tables']):
+                if index:
+                    sheet.append([])
+                for row in _clean_table(table):
+                    sheet.append(row)
+        if not extracted or not workbook.worksheets:
+            workbook.create_sheet('Sheet1')
+        workbook.save(output_path)
@@ -0,0 +1,87 @@
+import shutil
+
+
+class PdfWriter:
+    """
+    Writes a PDF one object at a time, so a document of any length is produced with only the
+    current page in memory. Pages are added with `add_page`; the page tree and the
+    cross-reference table are written by `close`, once every object's position is known.
+    """
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self._file = open(output_path, 'wb')
+        self._offsets = {}
+        self._pages = []
+        self._fonts = {}
+        # 1 and 2 are the catalog and page tree, written last
+        self._next_id = 3
+        self._file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type:
+            self._file.close()
+        else:
+            self.close()
+
+    @property
+    def page_count(self):
+        return len(self._pages)
+
+    def new_id(self):
+        self._next_id += 1
+        return self._next_id - 1
+
+    def _begin(self, object_id):
+        self._offsets[object_id] = self._file.tell()
+        self._file.write(f'{object_id} 0 obj\n'.encode('ascii'))
+
+    def write_object(self, object_id, body):
+        self._begin(object_id)
+        self._file.write(body.encode('ascii') + b'\nendobj\n')
+
+    def write_stream(self, object_id, dictionary, data=None, source=None, length=None):
+        """A stream object holding `data`, or `length` bytes copied from the file object `source`."""
+        self._begin(object_id)
+        length = len(data) if data is not None else length
+        self._file.write(f'<< {dictionary} /Length {length} >>\nstream\n'.encode('ascii'))
+        if data is not None:
+            self._file.write(data)
+        else:
+            shutil.copyfileobj(source, self._file, 1024 * 1024)
+        self._file.write(b'\nendstream\nendobj\n')
+
+    def font(self, base_font):
+        """Object id of one of the standard 14 fonts (e.g. Helvetica), which need no embedding."""
+        if base_font not in self._fonts:
+            self._fonts[base_font] = self.new_id()
+            self.write_object(self._fonts[base_font], f'<< /Type /Font /Subtype /Type1 /BaseFont /{base_font} '
+                                                      f'/Encoding /WinAnsiEncoding >>')
+        return self._fonts[base_font]
+
+    def add_page(self, width, height, content, resources, rotate=0, compressed=False):
+        """Add a page drawn by `content` (bytes, FlateDecode'd if `compressed`) using `resources`."""
+        content_id = self.new_id()
+        self.write_stream(content_id, '/Filter /FlateDecode' if compressed else '', content)
+        page_id = self.new_id()
+        rotation = f' /Rotate {rotate}' if rotate else ''
+        self.write_object(page_id, f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width:.4f} {height:.4f}] '
+                                   f'/Resources {resources} /Contents {content_id} 0 R{rotation} >>')
+        self._pages.append(page_id)
+
+    def close(self):
+        if self._file.closed:
+            return
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self._pages)
+        self.write_object(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>')
+        self.write_object(1, '<< /Type /Catalog /Pages 2 0 R >>')
+        xref = self._file.tell()
+        self._file.write(f'xref\n0 {self._next_id}\n0000000000 65535 f \n'.encode('ascii'))
+        for object_id in range(1, self._next_id):
+            self._file.write(f'{self._offsets[object_id]:010d} 00000 n \n'.encode('ascii'))
+        self._file.write(f'trailer\n<< /Size {self._next_id} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'
+                         .encode('ascii'))
+        self._file.close()
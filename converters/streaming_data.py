@@ -0,0 +1,279 @@
+import os
+import csv
+import json
+import itertools
+from xml.sax.saxutils import escape, quoteattr
+import xml.etree.ElementTree as ET
+
+READ_CHUNK_SIZE = 1024 * 1024
+CSV_WRITE_BATCH = 10000
+YAML_DUMP_BATCH = 1000
+NUMBER_CHARS = '0123456789.eE+-'
+
+
+class _TrackedFile:
+    """Text file that can report how far through the underlying bytes it has read."""
+
+    def __init__(self, path, progress=None, newline=None):
+        self.size = os.path.getsize(path) or 1
+        self.progress = progress
+        self.file = open(path, 'r', encoding='utf-8', newline=newline)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+    def report(self):
+        if self.progress:
+            self.progress.update(self.file.buffer.tell(), self.size)
+
+
+def iter_json_values(tracked):
+    """
+    Yield the values of a JSON document one at a time without loading it whole.
+
+    A top-level array yields its elements. Anything else is read as a stream of
+    whitespace-separated values, which covers both NDJSON/JSON-lines and a single object.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    in_array = None
+    count = 0
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = tracked.file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    while True:
+        # Skip whitespace and (inside an array) the separating commas
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or (in_array and buffer[pos] == ',')):
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            fill()
+        if pos >= len(buffer):
+            if in_array:
+                raise ValueError("Unexpected end of JSON input: array is not closed")
+            return
+        if in_array is None:
+            in_array = buffer[pos] == '['
+            if in_array:
+                pos += 1
+                continue
+        if in_array and buffer[pos] == ']':
+            return
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        if not eof and isinstance(value, (int, float)) and (end == len(buffer) or buffer[end] in NUMBER_CHARS):
+            # A number cut off by the chunk boundary ('-5.' or '1e') decodes as a shorter one
+            fill()
+            continue
+        pos = end
+        yield value
+        count += 1
+        if count % 1000 == 0:
+            tracked.report()
+
+
+def _cell(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _element_to_value(element):
+    """Convert an XML element to JSON-friendly data: '@attr' keys, '#text', repeated tags as lists."""
+    children = list(element)
+    if not children and not element.attrib:
+        return element.text.strip() if element.text and element.text.strip() else None
+    value = {f'@{name}': attr for name, attr in element.attrib.items()}
+    for child in children:
+        child_value = _element_to_value(child)
+        if child.tag in value:
+            if not isinstance(value[child.tag], list):
+                value[child.tag] = [value[child.tag]]
+            value[child.tag].append(child_value)
+        else:
+            value[child.tag] = child_value
+    if element.text and element.text.strip():
+        value['#text'] = element.text.strip()
+    return value
+
+
+def _write_xml_value(out, tag, value):
+    if isinstance(value, dict):
+        attrs = ''.join(f' {key[1:]}={quoteattr(str(val))}' for key, val in value.items() if key.startswith('@'))
+        out.write(f'<{tag}{attrs}>')
+        for key, val in value.items():
+            if key == '#text':
+                out.write(escape(str(val)))
+            elif not key.startswith('@'):
+                _write_xml_value(out, key, val)
+        out.write(f'</{tag}>')
+    elif isinstance(value, list):
+        for item in value:
+            _write_xml_value(out, tag, item)
+    elif value is None:
+        out.write(f'<{tag}/>')
+    else:
+        out.write(f'<{tag}>{escape(str(value))}</{tag}>')
+
+
+class _JsonArrayWriter:
+    """Writes values as a JSON array (or one value per line for NDJSON) as they arrive."""
+
+    def __init__(self, out, ndjson=False):
+        self.out = out
+        self.ndjson = ndjson
+        self.count = 0
+
+    def __enter__(self):
+        if not self.ndjson:
+            self.out.write('[')
+        return self
+
+    def write(self, value):
+        if self.ndjson:
+            self.out.write(json.dumps(value, ensure_ascii=False) + '\n')
+        else:
+            self.out.write((',\n' if self.count else '\n') + json.dumps(value, ensure_ascii=False))
+        self.count += 1
+
+    def __exit__(self, *exc):
+        if not self.ndjson:
+            self.out.write('\n]\n' if self.count else ']\n')
+
+
+def _is_ndjson(output_path, ndjson):
+    return ndjson if ndjson is not None else output_path.lower().endswith(('.ndjson', '.jsonl'))
+
+
+class StreamingDataConverter:
+    """
+    Bounded-memory variants of the MiscConverter data conversions.
+
+    Selected with the `stream` option (see utils/conversions.py). Records are parsed and
+    written one at a time, so memory stays flat however large the input is: JSON arrays and
+    NDJSON are decoded incrementally, XML with iterparse and element clearing, CSV row by
+    row, and YAML one document at a time.
+    """
+
+    @staticmethod
+    def json_to_csv(input_path, output_path, progress=None):
+        # First pass collects the union of keys so every column gets a header; both passes stream
+        fieldnames = {}
+        with _TrackedFile(input_path) as tracked:
+            for record in iter_json_values(tracked):
+                if isinstance(record, dict):
+                    fieldnames.update(dict.fromkeys(record))
+        fieldnames = list(fieldnames) or ['value']
+
+        with _TrackedFile(input_path, progress) as tracked, \
+                open(output_path, 'w', encoding='utf-8', newline='') as out:
+            writer = csv.DictWriter(out, fieldnames=fieldnames)
+            writer.writeheader()
+            batch = []
+            for record in iter_json_values(tracked):
+                if not isinstance(record, dict):
+                    record = {fieldnames[0]: record}
+                batch.append({key: _cell(value) for key, value in record.items()})
+                if len(batch) >= CSV_WRITE_BATCH:
+                    writer.writerows(batch)
+                    batch.clear()
+            writer.writerows(batch)
+
+    @staticmethod
+    def csv_to_json(input_path, output_path, ndjson=None, progress=None):
+        with _TrackedFile(input_path, progress, newline='') as tracked, \
+                open(output_path, 'w', encoding='utf-8') as out, \
+                _JsonArrayWriter(out, _is_ndjson(output_path, ndjson)) as writer:
+            for row in csv.DictReader(tracked.file):
+                writer.write(row)
+                if writer.count % CSV_WRITE_BATCH == 0:
+                    tracked.report()
+
+    @staticmethod
+    def yaml_to_json(input_path, output_path, ndjson=None, progress=None):
+        import yaml
+
+        with _TrackedFile(input_path, progress) as tracked:
+            documents = yaml.load_all(tracked.file, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+            # Counted rather than compared with None: an empty document ('---' alone) loads as None
+            head = list(itertools.islice(documents, 2))
+            with open(output_path, 'w', encoding='utf-8') as out:
+                if len(head) < 2 and not _is_ndjson(output_path, ndjson):
+                    # Single document: written as-is, like the in-memory converter does
+                    json.dump(head[0] if head else None, out, ensure_ascii=False, indent=4)
+                    return
+                with _JsonArrayWriter(out, _is_ndjson(output_path, ndjson)) as writer:
+                    for document in itertools.chain(head, documents):
+                        writer.write(document)
+                        tracked.report()
+
+    @staticmethod
+    def json_to_yaml(input_path, output_path, progress=None):
+        import yaml
+
+        # Records are dumped a batch at a time as list entries; the concatenation is a valid YAML sequence
+        dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+        with _TrackedFile(input_path, progress) as tracked, open(output_path, 'w', encoding='utf-8') as out:
+            batch = []
+            for record in iter_json_values(tracked):
+                batch.append(record)
+                if len(batch) >= YAML_DUMP_BATCH:
+                    yaml.dump(batch, out, Dumper=dumper, allow_unicode=True, sort_keys=False)
+                    batch.clear()
+            if batch or not out.tell():
+                yaml.dump(batch, out, Dumper=dumper, allow_unicode=True, sort_keys=False)
+
+    @staticmethod
+    def xml_to_json(input_path, output_path, ndjson=None, progress=None):
+        size = os.path.getsize(input_path) or 1
+        with open(input_path, 'rb') as source, open(output_path, 'w', encoding='utf-8') as out:
+            root = None
+            depth = 0
+            writer = None
+            for event, element in ET.iterparse(source, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if root is None:
+                        root = element
+                        writer = _JsonArrayWriter(out, _is_ndjson(output_path, ndjson))
+                        if not writer.ndjson:
+                            out.write(f'{{{json.dumps(root.tag)}: ')
+                        writer.__enter__()
+                    continue
+                depth -= 1
+                if depth == 1:
+                    # A complete record under the root: write it and drop it from the tree
+                    writer.write({element.tag: _element_to_value(element)})
+                    root.remove(element)
+                    if progress and writer.count % 1000 == 0:
+                        progress.update(source.tell(), size)
+            if writer is not None:
+                writer.__exit__(None, None, None)
+                if not writer.ndjson:
+                    out.write('}\n')
+
+    @staticmethod
+    def json_to_xml(input_path, output_path, root_tag='root', item_tag='item', progress=None):
+        with _TrackedFile(input_path, progress) as tracked, open(output_path, 'w', encoding='utf-8') as out:
+            out.write(f'<?xml version="1.0" encoding="utf-8"?>\n<{root_tag}>\n')
+            for record in iter_json_values(tracked):
+                _write_xml_value(out, item_tag, record)
+                out.write('\n')
+            out.write(f'</{root_tag}>\n')
@@ -0,0 +1,387 @@
+import os
+import re
+import csv
+import zlib
+import struct
+import shutil
+import zipfile
+import tempfile
+import functools
+import multiprocessing
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from xml.sax.saxutils import escape
+from converters.pdf_writer import PdfWriter
+from converters.streaming_data import _TrackedFile, CSV_WRITE_BATCH
+from utils.batch_processor import default_workers
+
+EXCEL_MAX_ROWS = 1048576
+# At most 15 digits, like Excel; longer digit strings (card numbers, IDs) stay text
+INTEGER = re.compile(r'-?(0|[1-9]\d{0,14})')
+FLOAT = re.compile(r'-?(\d+\.\d*|\.\d+)([eE][-+]?\d+)?|-?\d+[eE][-+]?\d+')
+ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+PAGE_LENGTH = struct.Struct('>I')
+
+# excel_to_pdf layout, in points: A4 landscape, Helvetica
+PAGE_SIZE = (841.89, 595.28)
+MARGIN = 36
+FONT_SIZE = 7
+ROW_HEIGHT = 10
+TITLE_HEIGHT = 18
+MIN_COLUMN_WIDTH = 40
+CELL_PADDING = 2
+
+# excel_to_word: the parts of a minimal .docx package (US Letter, 1" margins)
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>')
+PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/></Relationships>')
+DOCUMENT_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>')
+DOCUMENT_END = (
+    '<w:sectPr><w:pgSz w:w="12240" w:h="15840"/><w:pgMar w:top="1440" w:right="1440" w:bottom="1440" '
+    'w:left="1440" w:header="720" w:footer="720" w:gutter="0"/></w:sectPr></w:body></w:document>')
+TEXT_WIDTH_TWIPS = 9360
+TABLE_BORDERS = ''.join(f'<w:{side} w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+                        for side in ('top', 'left', 'bottom', 'right', 'insideH', 'insideV'))
+
+
+def _csv_value(text):
+    """A CSV field as the number it spells, if it does, so Excel gets numeric cells."""
+    if not text:
+        return None
+    if INTEGER.fullmatch(text):
+        return int(text)
+    if FLOAT.fullmatch(text):
+        return float(text)
+    return text
+
+
+def _text(value):
+    return '' if value is None else str(value)
+
+
+def _is_xlsx(input_path):
+    return os.path.splitext(input_path)[1].lower() != '.xls'
+
+
+def _in_memory(conversion_type, *args):
+    # openpyxl only reads .xlsx; old .xls workbooks go through the in-memory converter
+    from utils.conversions import DOCUMENT, load_backend
+    return getattr(load_backend(DOCUMENT), conversion_type)(*args)
+
+
+def _sheet_names(input_path, sheet):
+    """The sheets to convert: the first by default, one by name or 0-based index, or 'all'."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(input_path, read_only=True)
+    names = workbook.sheetnames
+    workbook.close()
+    if sheet is None:
+        return names[:1]
+    if str(sheet).lower() in ('all', '*'):
+        return names
+    if str(sheet) in names:
+        return [str(sheet)]
+    if str(sheet).isdigit() and int(sheet) < len(names):
+        return [names[int(sheet)]]
+    raise ValueError(f"No sheet '{sheet}' in {os.path.basename(input_path)} (sheets: {', '.join(names)})")
+
+
+def iter_rows(input_path, sheet_name, progress=None):
+    """
+    Yield the value tuples of a sheet's rows, read with openpyxl's read-only mode, which
+    parses the sheet's XML as it goes instead of building the workbook in memory. Only the
+    workbook's shared-strings table is loaded whole. Close the generator when stopping early,
+    so the workbook is closed right away.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(input_path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name]
+        total = worksheet.max_row or 0
+        for number, row in enumerate(worksheet.iter_rows(values_only=True), 1):
+            yield row
+            if progress and total and number % 1000 == 0:
+                progress.update(number, total)
+    finally:
+        workbook.close()
+
+
+def _map_sheets(work, sheet_names, workers, progress=None):
+    """
+    `work(sheet_name)` for every sheet, in order. Sheets are converted in a process pool of
+    `workers` processes, each opening the workbook itself; a single sheet is converted here,
+    where it can report progress row by row.
+    """
+    workers = max(1, int(workers or default_workers()))
+    if workers == 1 or len(sheet_names) == 1:
+        return [work(name, progress=progress) for name in sheet_names]
+    with ProcessPoolExecutor(max_workers=min(workers, len(sheet_names)),
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(work, name) for name in sheet_names]
+        pending = set(futures)
+        try:
+            while pending:
+                _, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                if progress:
+                    progress.update(len(futures) - len(pending), len(futures))
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+        return [future.result() for future in futures]
+
+
+def _fit(text, width, font, string_width):
+    """`text` cut (with an ellipsis) to fit `width` points."""
+    # Helvetica has no glyph wider than 1.02 em, so short strings need no measuring
+    if len(text) * FONT_SIZE * 1.02 <= width or string_width(text, font, FONT_SIZE) <= width:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if string_width(text[:middle] + '…', font, FONT_SIZE) <= width:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + '…'
+
+
+def _pdf_string(text):
+    data = text.encode('cp1252', 'replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _sheet_to_pdf_pages(input_path, temp_dir, sheet_name, progress=None):
+    """
+    Lay a sheet out as table pages and write their compressed content streams, one after
+    the other, to a file in `temp_dir`. Returns (path, page count).
+
+    The first row is the header and is repeated on every page. Columns that do not fit
+    across a page go on further pages (another pass over the sheet per band of columns).
+    Bands are planned from the header's width; rows found to be wider add bands for their
+    extra columns. Past the first band, only rows with a value in the band's columns are
+    laid out, so a band that few rows reach takes few pages (though reading the sheet again
+    for it still costs a full pass).
+    """
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    width, height = PAGE_SIZE
+    usable = width - 2 * MARGIN
+    rows_per_page = int((height - 2 * MARGIN - TITLE_HEIGHT) // ROW_HEIGHT) - 1
+    with closing(iter_rows(input_path, sheet_name)) as rows:
+        header = next(rows, None)
+    per_band = max(1, int(usable // MIN_COLUMN_WIDTH))
+
+    def plan(start, columns):
+        return [(first, min(first + per_band, columns)) for first in range(start, columns, per_band)]
+
+    widest = len(header) if header else 0
+    bands = plan(0, widest) or [(0, 0)]
+    descriptor, path = tempfile.mkstemp(suffix='.pages', dir=temp_dir)
+    pages = 0
+
+    def page_content(rows, band, page_number):
+        start, end = band
+        column_width = usable / max(1, end - start)
+        title = f"{sheet_name} - page {page_number}"
+        if start or len(bands) > 1:
+            title += f" (columns {start + 1}-{end})"
+        top = height - MARGIN
+        parts = [b'BT /F2 9 Tf', f'1 0 0 1 {MARGIN} {top - 9:.2f} Tm'.encode('ascii') + _pdf_string(title) + b' Tj']
+        y = top - TITLE_HEIGHT
+        for index, row in enumerate(rows):
+            font = 'Helvetica-Bold' if index == 0 else 'Helvetica'
+            if index < 2:
+                parts.append(f"/{'F2' if index == 0 else 'F1'} {FONT_SIZE} Tf".encode('ascii'))
+            for column, value in enumerate(row[start:end]):
+                text = _fit(_text(value), column_width - 2 * CELL_PADDING, font, stringWidth)
+                if text:
+                    x = MARGIN + column * column_width + CELL_PADDING
+                    parts.append(f'1 0 0 1 {x:.2f} {y - FONT_SIZE:.2f} Tm'.encode('ascii') + _pdf_string(text)
+                                 + b' Tj')
+            y -= ROW_HEIGHT
+        parts.append(b'ET')
+        # A rule under the header row
+        rule = top - TITLE_HEIGHT - ROW_HEIGHT + 1
+        parts.append(f'0.5 w {MARGIN} {rule:.2f} m {width - MARGIN} {rule:.2f} l S'.encode('ascii'))
+        return zlib.compress(b'\n'.join(parts), 6)
+
+    with open(descriptor, 'wb') as out:
+        for band in bands:  # Grows while it is iterated when wider rows turn up
+            rows = iter_rows(input_path, sheet_name, progress if band == bands[0] else None)
+            header_row = next(rows, None)
+            page_rows = []
+            page_number = 0
+            first = band is bands[0]
+            for row in rows:
+                widest = max(widest, len(row))
+                if not first and not any(_text(value) for value in row[band[0]:band[1]]):
+                    continue
+                page_rows.append(row)
+                if len(page_rows) == rows_per_page:
+                    page_number += 1
+                    content = page_content([header_row] + page_rows, band, page_number)
+                    out.write(PAGE_LENGTH.pack(len(content)) + content)
+                    pages += 1
+                    page_rows = []
+            if page_rows or (first and not page_number):
+                content = page_content(([header_row] if header_row else []) + page_rows, band, page_number + 1)
+                out.write(PAGE_LENGTH.pack(len(content)) + content)
+                pages += 1
+            if band is bands[-1]:
+                bands.extend(plan(band[1], widest))
+    return path, pages
+
+
+def _sheet_to_docx_xml(input_path, temp_dir, sheet_name, progress=None):
+    """
+    Write a sheet's rows as WordprocessingML table rows to a file in `temp_dir`. Returns
+    (path, number of columns). The first row is a header repeated on every page.
+    """
+    descriptor, path = tempfile.mkstemp(suffix='.xml', dir=temp_dir)
+    columns = 0
+    with open(descriptor, 'w', encoding='utf-8') as out:
+        batch = []
+        for number, row in enumerate(iter_rows(input_path, sheet_name, progress)):
+            columns = max(columns, len(row))
+            cells = []
+            for value in row:
+                text = ILLEGAL_XML.sub('', _text(value))
+                if not text:
+                    cells.append('<w:tc><w:p/></w:tc>')
+                    continue
+                bold = '<w:rPr><w:b/></w:rPr>' if number == 0 else ''
+                cells.append(f'<w:tc><w:p><w:r>{bold}<w:t xml:space="preserve">{escape(text)}</w:t></w:r></w:p>'
+                             f'</w:tc>')
+            header = '<w:trPr><w:tblHeader/></w:trPr>' if number == 0 else ''
+            batch.append(f'<w:tr>{header}{"".join(cells)}</w:tr>')
+            if len(batch) >= CSV_WRITE_BATCH:
+                out.write(''.join(batch))
+                batch.clear()
+        out.write(''.join(batch))
+    return path, columns
+
+
+class StreamingSheetConverter:
+    """
+    Bounded-memory variants of the DocumentConverter spreadsheet conversions.
+
+    Selected with the `stream` option (see utils/conversions.py), like the streaming data
+    conversions. Workbooks are read row by row with openpyxl's read-only mode and written
+    with its write-only mode; CSV is read and written in batches of rows; Word and PDF
+    output is produced a row (or a page) at a time. Memory stays flat however many rows
+    there are.
+
+    The Word and PDF conversions take `sheet` (a name, a 0-based index or 'all'; the first
+    sheet by default, like the in-memory converter) and convert several sheets in parallel
+    across `workers` processes. .xls files, which openpyxl cannot read, go through the
+    in-memory converter.
+    """
+
+    @staticmethod
+    def csv_to_excel(input_path, output_path, progress=None):
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)  # Rows go to a temporary file as they are appended
+        worksheet = workbook.create_sheet('Sheet1')
+        with _TrackedFile(input_path, progress, newline='') as tracked:
+            reader = csv.reader(tracked.file)
+            header = next(reader, None)
+            if header is not None:
+                worksheet.append(header)
+            rows = 1
+            for count, row in enumerate(reader, 1):
+                if rows == EXCEL_MAX_ROWS:
+                    # Past Excel's row limit: carry on in another sheet, under the same header
+                    worksheet = workbook.create_sheet(f'Sheet{len(workbook.worksheets) + 1}')
+                    worksheet.append(header)
+                    rows = 1
+                worksheet.append([_csv_value(value) for value in row])
+                rows += 1
+                if count % CSV_WRITE_BATCH == 0:
+                    tracked.report()
+        workbook.save(output_path)
+
+    @staticmethod
+    def excel_to_csv(input_path, output_path, sheet=None, progress=None):
+        if not _is_xlsx(input_path):
+            return _in_memory('excel_to_csv', input_path, output_path)
+        sheet_name = _sheet_names(input_path, sheet)[0]
+        with open(output_path, 'w', encoding='utf-8', newline='') as out:
+            writer = csv.writer(out)
+            batch = []
+            for row in iter_rows(input_path, sheet_name, progress):
+                batch.append(['' if value is None else value for value in row])
+                if len(batch) >= CSV_WRITE_BATCH:
+                    writer.writerows(batch)
+                    batch.clear()
+            writer.writerows(batch)
+
+    @staticmethod
+    def excel_to_word(input_path, output_path, sheet=None, workers=None, progress=None):
+        if not _is_xlsx(input_path):
+            return _in_memory('excel_to_word', input_path, output_path)
+        sheet_names = _sheet_names(input_path, sheet)
+        temp_dir = tempfile.mkdtemp(prefix='.sheets-', dir=os.path.dirname(os.path.abspath(output_path)))
+        try:
+            fragments = _map_sheets(functools.partial(_sheet_to_docx_xml, input_path, temp_dir), sheet_names,
+                                    workers, progress)
+            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as package:
+                package.writestr('[Content_Types].xml', CONTENT_TYPES)
+                package.writestr('_rels/.rels', PACKAGE_RELS)
+                with package.open('word/document.xml', 'w', force_zip64=True) as document:
+                    document.write(DOCUMENT_START.encode('utf-8'))
+                    for name, (path, columns) in zip(sheet_names, fragments):
+                        if len(sheet_names) > 1:
+                            document.write(f'<w:p><w:r><w:rPr><w:b/></w:rPr><w:t xml:space="preserve">'
+                                           f'{escape(name)}</w:t></w:r></w:p>'.encode('utf-8'))
+                        if columns:
+                            grid = ''.join(f'<w:gridCol w:w="{TEXT_WIDTH_TWIPS // columns}"/>'
+                                           for _ in range(columns))
+                            document.write(f'<w:tbl><w:tblPr><w:tblW w:w="5000" w:type="pct"/>'
+                                           f'<w:tblBorders>{TABLE_BORDERS}</w:tblBorders>'
+                                           f'<w:tblLayout w:type="fixed"/></w:tblPr>'
+                                           f'<w:tblGrid>{grid}</w:tblGrid>'.encode('utf-8'))
+                            with open(path, 'rb') as fragment:
+                                shutil.copyfileobj(fragment, document, 1024 * 1024)
+                            document.write(b'</w:tbl>')
+                        # Keeps consecutive tables apart
+                        document.write(b'<w:p/>')
+                    document.write(DOCUMENT_END.encode('utf-8'))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    @staticmethod
+    def excel_to_pdf(input_path, output_path, sheet=None, workers=None, progress=None):
+        if not _is_xlsx(input_path):
+            return _in_memory('excel_to_pdf', input_path, output_path)
+        sheet_names = _sheet_names(input_path, sheet)
+        temp_dir = tempfile.mkdtemp(prefix='.sheets-', dir=os.path.dirname(os.path.abspath(output_path)))
+        try:
+            sheets = _map_sheets(functools.partial(_sheet_to_pdf_pages, input_path, temp_dir), sheet_names,
+                                 workers, progress)
+            with PdfWriter(output_path) as writer:
+                resources = (f'<< /Font << /F1 {writer.font("Helvetica")} 0 R '
+                             f'/F2 {writer.font("Helvetica-Bold")} 0 R >> >>')
+                for path, pages in sheets:
+                    with open(path, 'rb') as source:
+                        for _ in range(pages):
+                            length, = PAGE_LENGTH.unpack(source.read(PAGE_LENGTH.size))
+                            writer.add_page(*PAGE_SIZE, source.read(length), resources, compressed=True)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
@@ -1,19 +1,25 @@
 import sys
 import os
 import logging
+from collections import deque
 from PyQt5.QtWidgets import (QApplication, QWidget, QLabel, QLineEdit, QPushButton,
                              QFileDialog, QComboBox, QProgressBar, QVBoxLayout, QHBoxLayout,
-                             QMessageBox, QGroupBox, QCheckBox, QTabWidget, QTextEdit, QGridLayout)
+                             QMessageBox, QGroupBox, QCheckBox, QTabWidget, QTextEdit, QGridLayout,
+                             QSpinBox)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from converters.document_converter import DocumentConverter
-from converters.image_converter import ImageConverter
-from converters.media_converter import MediaConverter
-from converters.misc_converter import MiscConverter
-from editors.video_editor import VideoEditor
-from editors.audio_editor import AudioEditor
-from editors.image_editor import ImageEditor
+from utils.conversions import (accepts, get_conversion, is_image_conversion, output_path_for, CONVERSION_TYPES,
+                               EDITING_TYPES, PDF_PAGES, SEGMENTED)
+from utils.batch_processor import BatchProcessor, BatchJob, run_job
+from utils.result_cache import ResultCache
+from utils.metrics import MetricsRecorder, DEFAULT_PROMETHEUS_PATH
+from utils.daemon import DaemonClient
+from utils.journal import BatchJournal
+from utils.watcher import FolderWatcher, watch_jobs
+from utils.progress import CancelToken, ProgressReporter
 from utils.file_handler import FileHandler
 from utils.cloud_integration import GoogleDriveIntegration
+from utils.transfer_manager import TransferManager
+from utils.scratch import ScratchSpace
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,141 +28,98 @@ class ConversionThread(QThread):
     progress = pyqtSignal(int)
     finished = pyqtSignal(str)
 
-    def __init__(self, converter, input_path, output_path, conversion_type, options=None):
+    def __init__(self, converter, input_path, output_path, conversion_type, options=None, cache=None, metrics=None,
+                 daemon=None):
         super().__init__()
         self.converter = converter
         self.input_path = input_path
         self.output_path = output_path
         self.conversion_type = conversion_type
         self.options = options or {}
+        self.cache = cache
+        self.metrics = metrics
+        self.daemon = daemon  # A DaemonClient: run on the conversion daemon's warm workers
+        self.cancel_token = CancelToken()
 
     def run(self):
-        try:
-            if self.conversion_type == 'word_to_pdf':
-                DocumentConverter.word_to_pdf(self.input_path, self.output_path)
-            elif self.conversion_type == 'pdf_to_word':
-                DocumentConverter.pdf_to_word(self.input_path, self.output_path)
-            elif self.conversion_type == 'excel_to_pdf':
-                DocumentConverter.excel_to_pdf(self.input_path, self.output_path)
-            elif self.conversion_type == 'pdf_to_excel':
-                DocumentConverter.pdf_to_excel(self.input_path, self.output_path)
-            elif self.conversion_type == 'excel_to_word':
-                DocumentConverter.excel_to_word(self.input_path, self.output_path)
-            elif self.conversion_type == 'word_to_excel':
-                DocumentConverter.word_to_excel(self.input_path, self.output_path)
-            elif self.conversion_type == 'txt_to_word':
-                DocumentConverter.txt_to_word(self.input_path, self.output_path)
-            elif self.conversion_type == 'word_to_txt':
-                DocumentConverter.word_to_txt(self.input_path, self.output_path)
-            elif self.conversion_type == 'csv_to_excel':
-                DocumentConverter.csv_to_excel(self.input_path, self.output_path)
-            elif self.conversion_type == 'excel_to_csv':
-                DocumentConverter.excel_to_csv(self.input_path, self.output_path)
-            elif self.conversion_type == 'pdf_to_html':
-                DocumentConverter.pdf_to_html(self.input_path, self.output_path)
-            elif self.conversion_type == 'pdf_to_md':
-                DocumentConverter.pdf_to_md(self.input_path, self.output_path)
-            elif self.conversion_type == 'jpeg_to_png':
-                ImageConverter.jpeg_to_png(self.input_path, self.output_path)
-            elif self.conversion_type == 'png_to_jpeg':
-                ImageConverter.png_to_jpeg(self.input_path, self.output_path)
-            elif self.conversion_type == 'jpeg_to_bmp':
-                ImageConverter.jpeg_to_bmp(self.input_path, self.output_path)
-            elif self.conversion_type == 'bmp_to_png':
-                ImageConverter.bmp_to_png(self.input_path, self.output_path)
-            elif self.conversion_type == 'png_to_webp':
-                ImageConverter.png_to_webp(self.input_path, self.output_path)
-            elif self.conversion_type == 'webp_to_png':
-                ImageConverter.webp_to_png(self.input_path, self.output_path)
-            elif self.conversion_type == 'pdf_to_images':
-                ImageConverter.pdf_to_images(self.input_path, self.output_path)
-            elif self.conversion_type == 'images_to_pdf':
-                ImageConverter.images_to_pdf(self.input_path.split(';'), self.output_path)
-            elif self.conversion_type == 'mp4_to_mp3':
-                MediaConverter.mp4_to_mp3(self.input_path, self.output_path)
-            elif self.conversion_type == 'mp3_to_wav':
-                MediaConverter.mp3_to_wav(self.input_path, self.output_path)
-            elif self.conversion_type == 'wav_to_mp3':
-                MediaConverter.wav_to_mp3(self.input_path, self.output_path)
-            elif self.conversion_type == 'mp4_to_gif':
-                MediaConverter.mp4_to_gif(self.input_path, self.output_path)
-            elif self.conversion_type == 'gif_to_mp4':
-                MediaConverter.gif_to_mp4(self.input_path, self.output_path)
-            elif self.conversion_type == 'avi_to_mp4':
-                MediaConverter.avi_to_mp4(self.input_path, self.output_path)
-            elif self.conversion_type == 'mp4_to_avi':
-                MediaConverter.mp4_to_avi(self.input_path, self.output_path)
-            elif self.conversion_type == 'flac_to_mp3':
-                MediaConverter.flac_to_mp3(self.input_path, self.output_path)
-            elif self.conversion_type == 'mp3_to_flac':
-                MediaConverter.mp3_to_flac(self.input_path, self.output_path)
-            elif self.conversion_type == 'aac_to_mp3':
-                MediaConverter.aac_to_mp3(self.input_path, self.output_path)
-            elif self.conversion_type == 'mp3_to_aac':
-                MediaConverter.mp3_to_aac(self.input_path, self.output_path)
-            elif self.conversion_type == 'json_to_csv':
-                MiscConverter.json_to_csv(self.input_path, self.output_path)
-            elif self.conversion_type == 'csv_to_json':
-                MiscConverter.csv_to_json(self.input_path, self.output_path)
-            elif self.conversion_type == 'yaml_to_json':
-                MiscConverter.yaml_to_json(self.input_path, self.output_path)
-            elif self.conversion_type == 'json_to_yaml':
-                MiscConverter.json_to_yaml(self.input_path, self.output_path)
-            elif self.conversion_type == 'xml_to_json':
-                MiscConverter.xml_to_json(self.input_path, self.output_path)
-            elif self.conversion_type == 'json_to_xml':
-                MiscConverter.json_to_xml(self.input_path, self.output_path)
-            elif self.conversion_type == 'html_to_markdown':
-                MiscConverter.html_to_markdown(self.input_path, self.output_path)
-            elif self.conversion_type == 'markdown_to_html':
-                MiscConverter.markdown_to_html(self.input_path, self.output_path)
-            elif self.conversion_type == 'trim_video':
-                VideoEditor.trim_video(self.input_path, self.output_path, self.options['start_time'], self.options['end_time'])
-            elif self.conversion_type == 'remove_sound':
-                VideoEditor.remove_sound(self.input_path, self.output_path)
-            elif self.conversion_type == 'merge_videos':
-                VideoEditor.merge_videos(self.input_path.split(';'), self.output_path)
-            elif self.conversion_type == 'add_audio':
-                VideoEditor.add_audio(self.input_path, self.options['audio_path'], self.output_path)
-            elif self.conversion_type == 'change_resolution':
-                VideoEditor.change_resolution(self.input_path, self.output_path, self.options['new_resolution'])
-            elif self.conversion_type == 'add_subtitles':
-                VideoEditor.add_subtitles(self.input_path, self.options['srt_path'], self.output_path)
-            elif self.conversion_type == 'extract_frames':
-                VideoEditor.extract_frames(self.input_path, self.output_path, self.options['frame_times'], self.options['fps'])
-            elif self.conversion_type == 'trim_audio':
-                AudioEditor.trim_audio(self.input_path, self.output_path, self.options['start_time'], self.options['end_time'])
-            elif self.conversion_type == 'remove_noise':
-                AudioEditor.remove_noise(self.input_path, self.output_path, self.options['noise_reduction_amount'])
-            elif self.conversion_type == 'change_speed':
-                AudioEditor.change_speed(self.input_path, self.output_path, self.options['speed_factor'])
-            elif self.conversion_type == 'merge_audio_files':
-                AudioEditor.merge_audio_files(self.input_path.split(';'), self.output_path)
-            elif self.conversion_type == 'extract_audio_from_video':
-                AudioEditor.extract_audio_from_video(self.input_path, self.output_path)
-            elif self.conversion_type == 'resize_image':
-                ImageEditor.resize_image(self.input_path, self.output_path, self.options['size'])
-            elif self.conversion_type == 'compress_image':
-                ImageEditor.compress_image(self.input_path, self.output_path, self.options['quality'])
-            elif self.conversion_type == 'rotate_image':
-                ImageEditor.rotate_image(self.input_path, self.output_path, self.options['degrees'])
-            elif self.conversion_type == 'flip_image':
-                ImageEditor.flip_image(self.input_path, self.output_path, self.options['direction'])
-            elif self.conversion_type == 'add_watermark':
-                ImageEditor.add_watermark(self.input_path, self.output_path, self.options['watermark_text'], self.options['position'], self.options['font_size'], self.options['font_path'])
-            elif self.conversion_type == 'convert_to_grayscale':
-                ImageEditor.convert_to_grayscale(self.input_path, self.output_path)
-
+        # Converters report through this; it throttles signals and raises when cancelled
+        reporter = ProgressReporter(self.progress.emit, self.cancel_token)
+        job = BatchJob(self.conversion_type, self.input_path, self.output_path, self.options)
+        if self.daemon:
+            result = self.daemon.run_job(job, self.cache, reporter)
+        else:
+            result = run_job(job, self.cache, reporter)
+        if self.metrics:
+            self.metrics.record(result.metrics)
+        if result.error == 'Cancelled':
+            self.finished.emit("Conversion cancelled.")
+        elif result.error:
+            self.finished.emit(f"Error: {result.error}")
+            logging.error(f"Conversion error: {result.error}")
+        elif result.cached:
+            self.progress.emit(100)
+            self.finished.emit("Conversion successful! (from cache)")
+        else:
+            self.progress.emit(100)
             self.finished.emit("Conversion successful!")
+
+    def cancel(self):
+        self.cancel_token.cancel()
+
+class BatchThread(QThread):
+    progress = pyqtSignal(int)
+    file_finished = pyqtSignal(object)
+    finished = pyqtSignal(str)
+
+    def __init__(self, jobs, total, max_workers=None, after_job=None, after_batch=None, cache=None, unit='files',
+                 metrics=None, daemon=None, journal=None):
+        super().__init__()
+        self.jobs = jobs
+        self.total = total
+        self.after_job = after_job  # Called from this thread with each BatchResult (e.g. uploads)
+        self.after_batch = after_batch  # Called from this thread at the end (even after an error), may return a message
+        self.processor = BatchProcessor(max_workers=max_workers, cache=cache, unit=unit, metrics=metrics,
+                                        daemon=daemon, journal=journal)
+
+    def run(self):
+        summary = None
+        try:
+            summary = self.processor.run(self.jobs, self.handle_result)
         except Exception as e:
-            self.finished.emit(f"Error: {e}")
-            logging.error(f"Conversion error: {e}")
+            summary = f"Error: {e}"
+            logging.error(f"Batch error: {e}")
+        finally:
+            # Also when the jobs raised, so what the batch set up (e.g. transfer pools) is released
+            if self.after_batch:
+                try:
+                    message = self.after_batch()
+                except Exception as e:
+                    message = f"Error: {e}"
+                    logging.error(f"Error finishing batch: {e}")
+                if message:
+                    summary = f"{summary}\n{message}" if summary else message
+        self.finished.emit(summary)
+
+    def handle_result(self, result):
+        if self.after_job:
+            try:
+                self.after_job(result)
+            except Exception as e:
+                logging.error(f"Post-processing error for {result.job.input_path}: {e}")
+        if self.total:
+            self.progress.emit(min(100, int(self.processor.files_done * 100 / self.total)))
+        self.file_finished.emit(result)
+
+    def cancel(self):
+        self.processor.cancel()
 
 class FileConverterApp(QWidget):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Universal File Converter and Media Editor")
         self.setGeometry(100, 100, 800, 600)
+        # Every job's record goes to ~/.cache/universal-file-converter/metrics (JSONL + Prometheus text)
+        self.metrics = MetricsRecorder(prometheus_path=DEFAULT_PROMETHEUS_PATH)
         self.initUI()
 
     def initUI(self):
@@ -192,21 +155,27 @@ class FileConverterApp(QWidget):
         # Conversion type selection
         self.conversion_label = QLabel("Conversion Type:")
         self.conversion_combo = QComboBox()
-        self.conversion_combo.addItems([
-            "word_to_pdf", "pdf_to_word", "excel_to_pdf", "pdf_to_excel",
-            "excel_to_word", "word_to_excel", "txt_to_word", "word_to_txt",
-            "csv_to_excel", "excel_to_csv", "pdf_to_html", "pdf_to_md",
-            "jpeg_to_png", "png_to_jpeg", "jpeg_to_bmp", "bmp_to_png",
-            "png_to_webp", "webp_to_png", "pdf_to_images", "images_to_pdf",
-            "mp4_to_mp3", "mp3_to_wav", "wav_to_mp3", "mp4_to_gif",
-            "gif_to_mp4", "avi_to_mp4", "mp4_to_avi", "flac_to_mp3",
-            "mp3_to_flac", "aac_to_mp3", "mp3_to_aac", "json_to_csv",
-            "csv_to_json", "yaml_to_json", "json_to_yaml", "xml_to_json",
-            "json_to_xml", "html_to_markdown", "markdown_to_html"
-        ])
+        self.conversion_combo.addItems(CONVERSION_TYPES)
 
         # Batch processing checkbox
         self.batch_checkbox = QCheckBox("Batch Processing")
+        self.cache_checkbox = QCheckBox("Reuse Cached Results")
+        self.cache_checkbox.setToolTip("Hash each input and reuse the output of an identical earlier conversion")
+        self.stream_checkbox = QCheckBox("Stream Large Data Files")
+        self.stream_checkbox.setToolTip("Convert JSON/CSV/YAML/XML and spreadsheets record by record in bounded memory")
+        self.segments_checkbox = QCheckBox("Split Long Videos Across Cores")
+        self.segments_checkbox.setToolTip("Encode video conversions as keyframe-aligned segments in parallel")
+        self.resume_checkbox = QCheckBox("Skip Files Finished in an Earlier Run")
+        self.resume_checkbox.setToolTip("Journal local batches so an interrupted batch resumes instead of starting over")
+        self.watch_checkbox = QCheckBox("Keep Watching Input Folder")
+        self.watch_checkbox.setToolTip("Batch: convert files as they are dropped into the input folder, until Cancel")
+        self.pages_label = QLabel("Pages:")
+        self.pages_edit = QLineEdit()
+        self.pages_edit.setPlaceholderText("All (e.g. 1-5,8,20-) for PDF conversions")
+        self.workers_label = QLabel("Parallel Jobs:")
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 64)
+        self.workers_spin.setValue(os.cpu_count() or 1)
 
         # Cloud integration (Google Drive)
         self.cloud_group = QGroupBox("Cloud Integration")
@@ -226,6 +195,11 @@ class FileConverterApp(QWidget):
         self.convert_button = QPushButton("Convert")
         self.convert_button.clicked.connect(self.convert_file)
 
+        # Cancel button
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_conversion)
+
         # Log display
         self.log_label = QLabel("Log:")
         self.log_text = QTextEdit()
@@ -243,10 +217,20 @@ class FileConverterApp(QWidget):
         layout.addWidget(self.conversion_combo, 2, 1)
         layout.addWidget(self.batch_checkbox, 3, 0)
         layout.addWidget(self.cloud_group, 3, 1, 1, 2)
-        layout.addWidget(self.convert_button, 4, 1)
-        layout.addWidget(self.progress_bar, 5, 0, 1, 3)
-        layout.addWidget(self.log_label, 6, 0)
-        layout.addWidget(self.log_text, 7, 0, 1, 3)
+        layout.addWidget(self.workers_label, 4, 0)
+        layout.addWidget(self.workers_spin, 4, 1)
+        layout.addWidget(self.cache_checkbox, 4, 2)
+        layout.addWidget(self.pages_label, 5, 0)
+        layout.addWidget(self.pages_edit, 5, 1)
+        layout.addWidget(self.stream_checkbox, 5, 2)
+        layout.addWidget(self.segments_checkbox, 6, 0)
+        layout.addWidget(self.convert_button, 6, 1)
+        layout.addWidget(self.cancel_button, 6, 2)
+        layout.addWidget(self.resume_checkbox, 7, 0)
+        layout.addWidget(self.watch_checkbox, 7, 1)
+        layout.addWidget(self.progress_bar, 8, 0, 1, 3)
+        layout.addWidget(self.log_label, 9, 0)
+        layout.addWidget(self.log_text, 10, 0, 1, 3)
 
         self.converter_tab.setLayout(layout)
 
@@ -266,13 +250,7 @@ class FileConverterApp(QWidget):
         # Editing type selection
         self.editing_label = QLabel("Editing Type:")
         self.editing_combo = QComboBox()
-        self.editing_combo.addItems([
-            "trim_video", "remove_sound", "merge_videos", "add_audio",
-            "change_resolution", "add_subtitles", "extract_frames", "trim_audio",
-            "remove_noise", "change_speed", "merge_audio_files", "extract_audio_from_video",
-            "resize_image", "compress_image", "rotate_image", "flip_image",
-            "add_watermark", "convert_to_grayscale"
-        ])
+        self.editing_combo.addItems(EDITING_TYPES)
 
         # Options for editing
         self.options_group = QGroupBox("Editing Options")
@@ -284,6 +262,9 @@ class FileConverterApp(QWidget):
         # Edit button
         self.edit_button = QPushButton("Edit")
         self.edit_button.clicked.connect(self.edit_media)
+        self.editor_cancel_button = QPushButton("Cancel")
+        self.editor_cancel_button.setEnabled(False)
+        self.editor_cancel_button.clicked.connect(self.cancel_edit)
 
         # Progress bar
         self.editor_progress_bar = QProgressBar()
@@ -301,6 +282,7 @@ class FileConverterApp(QWidget):
         layout.addWidget(self.editing_combo, 2, 1)
         layout.addWidget(self.options_group, 3, 0, 1, 3)
         layout.addWidget(self.edit_button, 4, 1)
+        layout.addWidget(self.editor_cancel_button, 4, 2)
         layout.addWidget(self.editor_progress_bar, 5, 0, 1, 3)
 
         self.editor_tab.setLayout(layout)
@@ -403,6 +385,12 @@ class FileConverterApp(QWidget):
             self.options_layout.addWidget(self.font_path_label, 3, 0)
             self.options_layout.addWidget(self.font_path_edit, 3, 1)
             self.options_layout.addWidget(self.font_path_button, 3, 2)
+        elif editing_type == "image_pipeline":
+            self.steps_label = QLabel("Steps:")
+            self.steps_edit = QLineEdit()
+            self.steps_edit.setPlaceholderText("resize_image size=800x600 | convert_to_grayscale | png_to_webp")
+            self.options_layout.addWidget(self.steps_label, 0, 0)
+            self.options_layout.addWidget(self.steps_edit, 0, 1)
 
     def browse_audio_path(self):
         audio_path, _ = QFileDialog.getOpenFileName(self, "Select Audio File")
@@ -487,6 +475,8 @@ class FileConverterApp(QWidget):
             options['position'] = tuple(map(int, self.position_edit.text().split(',')))
             options['font_size'] = int(self.font_size_edit.text())
             options['font_path'] = self.font_path_edit.text() if self.font_path_edit.text() else None
+        elif editing_type == "image_pipeline":
+            options['steps'] = self.steps_edit.text()
 
         return options
 
@@ -500,12 +490,23 @@ class FileConverterApp(QWidget):
             QMessageBox.warning(self, "Error", "Please select input and output files.")
             return
 
-        self.conversion_thread = ConversionThread(None, input_path, output_path, editing_type, options)
+        self.editor_progress_bar.setValue(0)
+        self.conversion_thread = ConversionThread(None, input_path, output_path, editing_type, options,
+                                                  metrics=self.metrics, daemon=self.daemon_client())
         self.conversion_thread.progress.connect(self.editor_progress_bar.setValue)
         self.conversion_thread.finished.connect(self.handle_edit_result)
+        self.edit_button.setEnabled(False)
+        self.editor_cancel_button.setEnabled(True)
         self.conversion_thread.start()
 
+    def cancel_edit(self):
+        if hasattr(self, 'conversion_thread') and self.conversion_thread.isRunning():
+            self.conversion_thread.cancel()
+            self.editor_cancel_button.setEnabled(False)
+
     def handle_edit_result(self, message):
+        self.edit_button.setEnabled(True)
+        self.editor_cancel_button.setEnabled(False)
         QMessageBox.information(self, "Editing Result", message)
 
     def convert_file(self):
@@ -523,95 +524,254 @@ class FileConverterApp(QWidget):
             if self.batch_checkbox.isChecked():
                 # Batch processing with Google Drive
                 folder_id = input_path  # Assuming input_path is a folder ID in this case
-                files = self.gdrive.list_files_in_folder(folder_id)
-
-                for file in files:
-                    file_id = file['id']
-                    file_name = file['name']
-                    temp_file = os.path.join(os.path.expanduser("~"), file_name)  # Download to user's home dir
-
-                    # Download file from Google Drive
-                    self.gdrive.download_file(file_id, temp_file)
-
-                    # Construct output file path in the specified Google Drive folder
-                    output_file = os.path.join(output_path, os.path.splitext(file_name)[
-                        0] + '_converted' + FileHandler.get_file_extension(file_name))
-
-                    # Create and start conversion thread
-                    self.conversion_thread = ConversionThread(None, temp_file, output_file, conversion_type)
-                    self.conversion_thread.progress.connect(self.progress_bar.setValue)
-                    self.conversion_thread.finished.connect(
-                        lambda msg: self.handle_conversion_result(msg, temp_file, output_file))
-                    self.conversion_thread.start()
-
+                # Listed lazily on the batch thread: conversion starts while later pages load
+                files = (file for file in self.gdrive.list_files_in_folder(folder_id)
+                         if accepts(conversion_type, file['name']))
+                total = None
             else:
                 # Single file processing with Google Drive
                 file_id = input_path  # Assuming input_path is a file ID
-                file_name = self.gdrive.get_file_name(file_id)
-                temp_file = os.path.join(os.path.expanduser("~"), file_name)  # Download to user's home dir
-
-                # Download file from Google Drive
-                self.gdrive.download_file(file_id, temp_file)
-
-                # Construct output file path (you might need to adjust this based on your needs)
-                output_file = os.path.join(output_path, os.path.splitext(file_name)[
-                    0] + '_converted' + FileHandler.get_file_extension(file_name))
-
-                # Create and start conversion thread
-                self.conversion_thread = ConversionThread(None, temp_file, output_file, conversion_type)
-                self.conversion_thread.progress.connect(self.progress_bar.setValue)
-                self.conversion_thread.finished.connect(
-                    lambda msg: self.handle_conversion_result(msg, temp_file, output_file))
-                self.conversion_thread.start()
+                file = self.gdrive.get_file_metadata(file_id)
+                if file is None:
+                    self.log_text.append(f"Drive file {file_id}: Error: not found or no access")
+                    return
+                files = [file]
+                total = 1
+            self.start_drive_batch(files, total, conversion_type, output_path)
 
         else:
             # Local file processing
-            if self.batch_checkbox.isChecked():
+            if self.batch_checkbox.isChecked() and self.watch_checkbox.isChecked():
+                self.start_watch(input_path, output_path, conversion_type)
+            elif self.batch_checkbox.isChecked():
                 # Batch processing
-                files = FileHandler.list_files_in_directory(input_path)
-                for file in files:
-                    output_file = os.path.join(output_path, os.path.splitext(os.path.basename(file))[
-                        0] + '_converted' + FileHandler.get_file_extension(file))
-                    self.conversion_thread = ConversionThread(None, file, output_file, conversion_type)
-                    self.conversion_thread.progress.connect(self.progress_bar.setValue)
-                    self.conversion_thread.finished.connect(
-                        lambda msg: self.handle_conversion_result(msg, file, output_file))
-                    self.conversion_thread.start()
+                files = [file for file in FileHandler.list_files_in_directory(input_path)
+                         if accepts(conversion_type, file)]
+                options = self.conversion_options(conversion_type)
+                jobs = (BatchJob(conversion_type, file, output_path_for(conversion_type, file, output_path), options)
+                        for file in files)
+                journal = BatchJournal() if self.resume_checkbox.isChecked() else None
+                self.start_batch(jobs, len(files), unit=self.batch_unit(conversion_type), journal=journal)
             else:
                 # Single file processing
                 if conversion_type == 'images_to_pdf':
                     input_files = input_path.split(';')
                     output_file = output_path  # Output is already a full path for this case
                 else:
-                    output_file = os.path.join(output_path, os.path.splitext(os.path.basename(input_path))[
-                        0] + '_converted' + FileHandler.get_file_extension(input_path))
+                    output_file = output_path_for(conversion_type, input_path, output_path)
 
-                self.conversion_thread = ConversionThread(None, input_path, output_file, conversion_type)
+                self.progress_bar.setValue(0)
+                self.conversion_thread = ConversionThread(None, input_path, output_file, conversion_type,
+                                                          self.conversion_options(conversion_type),
+                                                          self.result_cache(), self.metrics, self.daemon_client())
                 self.conversion_thread.progress.connect(self.progress_bar.setValue)
                 self.conversion_thread.finished.connect(
                     lambda msg: self.handle_conversion_result(msg, input_path, output_file))
+                self.convert_button.setEnabled(False)
+                self.cancel_button.setEnabled(True)
                 self.conversion_thread.start()
 
-    def handle_conversion_result(self, message, input_file, output_file):
-        self.log_text.append(message)
+    def start_batch(self, jobs, total, after_job=None, after_batch=None, unit='files', record_metrics=True,
+                    journal=None):
+        # `total` is None when the number of files is not known up front (streamed Drive listing)
+        if total is None:
+            self.progress_bar.setRange(0, 0)  # Busy indicator
+            self.log_text.append(f"Starting batch with {self.workers_spin.value()} parallel job(s)...")
+        else:
+            self.progress_bar.setRange(0, 100)
+            self.progress_bar.setValue(0)
+            self.log_text.append(f"Starting batch of {total} file(s) with {self.workers_spin.value()} parallel job(s)...")
+        self.batch_thread = BatchThread(jobs, total, self.workers_spin.value(), after_job, after_batch,
+                                        self.result_cache(), unit, self.metrics if record_metrics else None,
+                                        self.daemon_client(), journal)
+        self.batch_thread.progress.connect(self.progress_bar.setValue)
+        self.batch_thread.file_finished.connect(self.handle_batch_file_result)
+        self.batch_thread.finished.connect(self.handle_batch_finished)
+        self.convert_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.batch_thread.start()
+
+    def start_watch(self, input_path, output_path, conversion_type):
+        if os.path.realpath(input_path) == os.path.realpath(output_path):
+            QMessageBox.warning(self, "Error", "Please choose an output directory other than the watched one.")
+            return
+        journal = BatchJournal() if self.resume_checkbox.isChecked() else None
+        try:
+            # With the journal, files already in the folder are converted too unless done before
+            watcher = FolderWatcher(input_path, include_existing=journal is not None)
+        except OSError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+        os.makedirs(output_path, exist_ok=True)
+        jobs = watch_jobs(watcher, conversion_type, output_path, self.conversion_options(conversion_type))
+        self.log_text.append(f"Watching {input_path} for new files, press Cancel to stop")
+        self.start_batch(jobs, None, after_batch=watcher.close, unit=self.batch_unit(conversion_type),
+                         journal=journal)
 
-        # Clean up temporary file if using Google Drive
-        if self.cloud_checkbox.isChecked() and hasattr(self, 'gdrive'):
-            try:
-                os.remove(input_file)  # Delete the temporary downloaded file
-            except Exception as e:
-                self.log_text.append(f"Error deleting temporary file: {e}")
+    def batch_unit(self, conversion_type):
+        return 'images' if is_image_conversion(conversion_type) else 'files'
 
-        # Upload to Google Drive if conversion was successful and option is enabled
-        if self.cloud_checkbox.isChecked() and hasattr(self, 'gdrive') and message == "Conversion successful!":
+    def conversion_options(self, conversion_type):
+        options = {}
+        if self.stream_checkbox.isChecked() and 'stream' in get_conversion(conversion_type).variants:
+            options['stream'] = True
+        if self.pages_edit.text().strip() and get_conversion(conversion_type).backend == PDF_PAGES:
+            options['pages'] = self.pages_edit.text().strip()
+        if self.segments_checkbox.isChecked() and conversion_type in SEGMENTED:
+            options['segments'] = 'auto'
+        return options or None
+
+    def result_cache(self):
+        if not self.cache_checkbox.isChecked():
+            return None
+        if not hasattr(self, 'cache'):
+            self.cache = ResultCache()
+        return self.cache
+
+    def daemon_client(self):
+        # Jobs go to the conversion daemon (python -m utils.daemon) whenever one is running
+        return DaemonClient.connect()
+
+    def cancel_conversion(self):
+        if hasattr(self, 'batch_thread') and self.batch_thread.isRunning():
+            self.batch_thread.cancel()
+            self.cancel_button.setEnabled(False)
+            self.log_text.append("Cancelling batch...")
+        elif hasattr(self, 'conversion_thread') and self.conversion_thread.isRunning():
+            self.conversion_thread.cancel()
+            self.cancel_button.setEnabled(False)
+
+    def start_drive_batch(self, files, total, conversion_type, output_path):
+        transfers = TransferManager(self.gdrive)
+        folder_id = output_path  # output_edit.text() should be the folder ID
+        # Each file is downloaded and converted in a scratch directory of its own, removed once uploaded
+        scratch = ScratchSpace()
+        admitted = {}  # Drive file ID -> ScratchJob, until its download is done
+        scratch_jobs = {}  # Local input path -> ScratchJob, until its conversion is done
+
+        cache = self.result_cache()
+        options = self.conversion_options(conversion_type)
+        cached = deque()
+
+        def scratch_path(file):
+            # Called on a download thread, which waits here while the scratch volume is full
+            scratch_job = admitted[file['id']] = scratch.job(int(file.get('size') or 0))
+            return scratch_job.path_for(file['name'])
+
+        def batch_job(file, scratch_job, **kwargs):
+            input_path = scratch_job.path_for(file['name'])
+            scratch_jobs[input_path] = scratch_job
+            output_file = output_path_for(conversion_type, file['name'], scratch_job.path)
+            return BatchJob(conversion_type, input_path, output_file, options, cache_key(file), **kwargs)
+
+        def cache_key(file):
+            if cache and file.get('md5Checksum'):
+                return cache.make_key(conversion_type, file['md5Checksum'], options)
+            return None
+
+        def to_download():
+            for file in files:
+                if cache_key(file) and cache.contains(cache_key(file)):
+                    cached.append(file)  # Cache hit: no need to download the input at all
+                else:
+                    yield file
+
+        def cached_jobs():
+            while cached:
+                file = cached.popleft()
+                yield batch_job(file, scratch.job())  # Only the output is written, from the cache
+
+        def drive_jobs():
+            # Runs on the batch thread. Later files keep downloading while earlier ones convert.
+            for download in transfers.iter_downloads(to_download(), scratch_path, idle_timeout=0.5):
+                yield from cached_jobs()
+                if download is None:
+                    yield None  # Nothing downloaded yet: let the batch handle finished jobs meanwhile
+                    continue
+                file, temp_file, error = download
+                if error:
+                    logging.error(f"Error downloading {file['name']}: {error}")
+                    if file['id'] in admitted:
+                        admitted.pop(file['id']).release()
+                    continue
+                scratch_job = admitted.pop(file['id'])
+                scratch_job.count_written(temp_file)
+                yield batch_job(file, scratch_job,
+                                phases={'download': transfers.download_seconds.pop(temp_file, None)})
+            yield from cached_jobs()
+
+        def record(result, scratch_job, error=None, **phases):
+            if result.metrics:
+                record = dict(result.metrics, scratch_bytes_written=scratch_job.bytes_written,
+                              scratch_bytes_read=scratch_job.bytes_read)
+                if error:
+                    record.update(status='error', error=error)
+                self.metrics.record(record, **phases)
+
+        def upload_done(result, scratch_job, error):
+            # Runs on the upload thread before wait_for_uploads returns
+            scratch_job.count_read(result.job.output_path)
+            scratch_job.release()
+            # The job's record is written once its upload is done, so it has all three phases
+            record(result, scratch_job, error, upload=transfers.upload_seconds.pop(result.job.output_path, None))
+
+        def finish_job(result):
+            scratch_job = scratch_jobs.pop(result.job.input_path)
             try:
-                # Upload the converted file to Google Drive
-                self.gdrive.upload_file(output_file,
-                                        self.output_edit.text())  # output_edit.text() should be the folder ID
-                QMessageBox.information(self, "Conversion Result",
-                                        "Conversion successful and uploaded to Google Drive!")
-            except Exception as e:
-                QMessageBox.warning(self, "Upload Error", f"Error uploading to Google Drive: {e}")
-                self.log_text.append(f"Upload error: {e}")
+                scratch_job.count_read(result.job.input_path)
+                if result.error:
+                    record(result, scratch_job)
+                    return
+                scratch_job.count_written(result.job.output_path)
+                try:
+                    os.remove(result.job.input_path)  # No longer needed: free the space for the next download
+                except FileNotFoundError:  # Not downloaded on a cache hit
+                    pass
+                scratch_job.acquire()  # The output stays until its upload, which starts right away, is done
+                transfers.upload(result.job.output_path, folder_id,
+                                 after=lambda error, result=result, scratch_job=scratch_job:
+                                 upload_done(result, scratch_job, error))
+            finally:
+                scratch_job.release()
+
+        def finish_batch():
+            # Also runs when the batch was cancelled or its jobs raised: no more files are needed
+            jobs.close()
+            transfers.cancel_downloads()  # Running downloads stop after their current chunk
+            scratch.stop()  # Downloads still waiting for scratch space fail
+            # When cancelled, only the uploads already started are waited for
+            dropped = transfers.cancel_uploads() if self.batch_thread.processor.cancelled else 0
+            uploaded, failed = transfers.wait_for_uploads()
+            transfers.shutdown()  # Waits for the downloads to stop, so none is writing to the scratch space
+            scratch.close()
+            message = f"Uploaded {uploaded} file(s) to Google Drive, {failed} failed."
+            if dropped:
+                message += f" {dropped} upload(s) cancelled."
+            return message
+
+        jobs = drive_jobs()
+        self.start_batch(jobs, total, after_job=finish_job, after_batch=finish_batch,
+                         unit=self.batch_unit(conversion_type), record_metrics=False)
+
+    def handle_batch_file_result(self, result):
+        name = os.path.basename(result.job.input_path)
+        if result.error:
+            self.log_text.append(f"{name}: Error: {result.error}")
+            logging.error(f"Conversion error for {result.job.input_path}: {result.error}")
+        elif result.skipped:
+            self.log_text.append(f"{name}: Unchanged since the last run, skipped")
         else:
-            QMessageBox.information(self, "Conversion Result", message)
+            self.log_text.append(f"{name}: Conversion successful! ({result.elapsed:.2f}s)")
+
+    def handle_batch_finished(self, summary):
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(100)
+        self.log_text.append(summary)
+        self.convert_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+
+    def handle_conversion_result(self, message, input_file, output_file):
+        self.convert_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        self.log_text.append(message)
+        QMessageBox.information(self, "Conversion Result", message)
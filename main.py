@@ -1,16 +1,23 @@
 import sys
-from PyQt5.QtWidgets import QApplication
-from gui import FileConverterApp  # Import the FileConverterApp class from gui.py
 
 def main():
     """
     Main function to create and run the File Converter application.
+
+    When command line arguments are given the headless CLI is used instead, so PyQt5 is
+    only imported when the GUI is actually needed.
     """
+    if len(sys.argv) > 1:
+        from cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+
+    from PyQt5.QtWidgets import QApplication
+    from gui import FileConverterApp  # Import the FileConverterApp class from gui.py
+
     app = QApplication(sys.argv)
     ex = FileConverterApp()
     ex.show()  # Make sure the window is shown
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
-    main()
-    
\ No newline at end of file
+    main()
\ No newline at end of file
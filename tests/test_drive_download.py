@@ -0,0 +1,151 @@
+"""
+GoogleDriveIntegration.download_request against a stand-in media server on localhost that
+answers ranged GETs like Drive does (206, 416 past the end, or 200 when it ignores Range).
+
+    python -m unittest tests.test_drive_download
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.cloud_integration import GoogleDriveIntegration  # noqa: E402
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes
+REVISION = {'md5Checksum': 'new', 'modifiedTime': '2024-06-01T00:00:00.000Z', 'size': str(len(CONTENT))}
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        content = self.server.content
+        header = self.headers.get('Range')
+        self.server.ranges.append(header)
+        if not header or self.server.ignore_range:
+            self._send(200, content)
+            return
+        start, end = (int(value) for value in header.split('=', 1)[1].split('-'))
+        if start >= len(content):
+            self._send(416, b'', {'Content-Range': f'bytes */{len(content)}'})
+            return
+        end = min(end, len(content) - 1)
+        self._send(206, content[start:end + 1], {'Content-Range': f'bytes {start}-{end}/{len(content)}'})
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Http:
+    """The httplib2-style `request` that download_request calls, over urllib."""
+
+    def request(self, uri, method='GET', headers=None):
+        try:
+            with urlopen(Request(uri, method=method, headers=headers or {})) as response:
+                return self._response(response.status, response.headers), response.read()
+        except HTTPError as e:
+            return self._response(e.code, e.headers), e.read()
+
+    @staticmethod
+    def _response(status, headers):
+        values = {name.lower(): value for name, value in headers.items()}
+        return SimpleNamespace(status=status, get=lambda name, default=None: values.get(name.lower(), default))
+
+
+class Progress:
+    def update(self, done, total):
+        pass
+
+
+class DownloadRequestTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.content = CONTENT
+        self.server.ignore_range = False
+        self.server.ranges = []
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'file.bin')
+        self.drive = GoogleDriveIntegration(chunk_size=4096, num_retries=0)
+        self.request = SimpleNamespace(uri=f'http://127.0.0.1:{self.server.server_address[1]}/media', headers={},
+                                       http=Http())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def leave_part(self, content, revision):
+        with open(self.path + '.part', 'wb') as f:
+            f.write(content)
+        if revision is not None:
+            with open(self.path + '.part.json', 'w', encoding='utf-8') as f:
+                json.dump(revision, f)
+
+    def download(self, revision=REVISION):
+        self.assertEqual(self.drive.download_request(self.request, self.path, progress=Progress(), revision=revision),
+                         self.path)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), CONTENT)
+        self.assertEqual(os.listdir(self.directory), ['file.bin'])
+
+    def test_downloads_in_ranges(self):
+        self.download()
+        self.assertEqual(self.server.ranges, ['bytes=0-4095', 'bytes=4096-8191', 'bytes=8192-12287'])
+
+    def test_resumes_part_of_same_revision(self):
+        self.leave_part(CONTENT[:5000], REVISION)
+        self.download()
+        self.assertEqual(self.server.ranges[0], 'bytes=5000-9095')
+
+    def test_restarts_part_of_other_revision(self):
+        self.leave_part(b'old version' * 100, dict(REVISION, md5Checksum='old'))
+        self.download()
+        self.assertEqual(self.server.ranges[0], 'bytes=0-4095')
+
+    def test_restarts_part_without_revision(self):
+        self.leave_part(b'unknown' * 100, None)
+        self.download()
+        self.assertEqual(self.server.ranges[0], 'bytes=0-4095')
+
+    def test_416_accepts_complete_part(self):
+        self.leave_part(CONTENT, REVISION)
+        self.download()
+        self.assertEqual(self.server.ranges, [f'bytes={len(CONTENT)}-{len(CONTENT) + 4095}'])
+
+    def test_416_restarts_part_larger_than_file(self):
+        self.leave_part(CONTENT + b'trailing bytes of an older, longer version', REVISION)
+        self.download()
+        self.assertEqual(self.server.ranges[1], 'bytes=0-4095')
+
+    def test_200_replaces_part(self):
+        self.server.ignore_range = True
+        self.leave_part(b'x' * 5000, REVISION)
+        self.download()
+        self.assertEqual(len(self.server.ranges), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,346 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from collections import namedtuple
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils.conversions import get_conversion, run_conversion
+from utils.metrics import cpu_seconds, job_record, peak_rss_mb, reset_peak_rss
+from utils.progress import CancelToken, ProgressReporter, ConversionCancelled
+
+# Set in each worker process by _init_worker: the batch's shared cancel event
+_worker_cancel_event = None
+
+# `cache_key` can be given when the input's hash is already known (e.g. Drive md5Checksum),
+# which lets a cache hit skip reading the input entirely. `submitted_at` (wall clock, set when
+# the job is queued) and `phases` (durations of work done before the job, e.g. {'download': 1.2})
+# only feed the job's metrics record.
+BatchJob = namedtuple('BatchJob', ['conversion_type', 'input_path', 'output_path', 'options', 'cache_key',
+                                   'submitted_at', 'phases'])
+BatchJob.__new__.__defaults__ = (None, None, None, None)
+
+# `metrics` is the job's record for a MetricsRecorder (see utils.metrics.job_record); `skipped`
+# is set for jobs a BatchJournal found already done in an earlier run
+BatchResult = namedtuple('BatchResult', ['job', 'error', 'elapsed', 'bytes_in', 'cached', 'metrics', 'skipped'])
+BatchResult.__new__.__defaults__ = (False, None, False)
+
+
+_END = object()
+
+
+def default_workers():
+    """Processes a converter should fan out to: every core, or one inside a batch worker."""
+    # Inside a batch worker process the batch already uses every core: stay on one
+    if multiprocessing.parent_process() is not None:
+        return 1
+    return os.cpu_count() or 1
+
+
+def _input_size(input_path):
+    size = 0
+    for path in input_path.split(';'):
+        try:
+            size += os.path.getsize(path)
+        except OSError:
+            pass
+    return size
+
+
+def _partial_path(job):
+    """
+    Where a single-file output is written before being renamed into place, so a crashed or
+    killed job never leaves a truncated file under the real name. None for outputs that are
+    directories (pdf_to_images, extract_frames), which are written in place.
+    """
+    directory, name = os.path.split(job.output_path)
+    stem, ext = os.path.splitext(name)
+    conversion = get_conversion(job.conversion_type)
+    if not ext or os.path.isdir(job.output_path) or (conversion.kind == 'conversion' and not conversion.output_ext):
+        return None
+    # Same directory (so the rename is atomic) and same extension (converters pick the format from it)
+    return os.path.join(directory, f".{stem}.{os.getpid()}-{threading.get_ident()}.partial{ext}")
+
+
+def _init_worker(cancel_event):
+    global _worker_cancel_event
+    _worker_cancel_event = cancel_event
+
+
+def _run_in_worker(job, cache, profiler=None):
+    return run_job(job, cache, ProgressReporter(cancel_token=CancelToken(_worker_cancel_event)), profiler,
+                   exclusive=True)
+
+
+def run_job(job, cache=None, progress=None, profiler=None, exclusive=False):
+    """
+    Run one BatchJob, going through `cache` (a ResultCache) when one is given. `progress`
+    is an optional ProgressReporter forwarded to the converter; `profiler` (a JobProfiler)
+    profiles the job if it matches. The result carries the job's metrics record. Outputs
+    are written under a temporary name and renamed into place once complete.
+
+    `exclusive` says no other job runs in this process meanwhile (a pool or daemon worker
+    process), so the process's peak RSS and child-process CPU time are the job's own and
+    go into its record; otherwise only the thread's CPU time is.
+    """
+    started = time.monotonic()
+    started_at = time.time()
+    cpu_started = cpu_seconds(exclusive)
+    measure_rss = exclusive and reset_peak_rss()
+    error = None
+    cached = False
+    profile = {}
+    partial = None
+    try:
+        key = None
+        if cache:
+            key = job.cache_key or cache.key_for_input(job.conversion_type, job.input_path, job.options)
+        if key and cache.fetch(key, job.output_path):
+            cached = True
+        else:
+            if key and os.path.isfile(job.output_path):
+                # The old output may be hard-linked into the cache, never write through it
+                os.remove(job.output_path)
+            partial = _partial_path(job)
+            with profiler.profile(job) if profiler else nullcontext({}) as profile:
+                run_conversion(job.conversion_type, job.input_path, partial or job.output_path, job.options,
+                               progress)
+            if partial:
+                os.replace(partial, job.output_path)
+            if key:
+                cache.store(key, job.output_path)
+    except ConversionCancelled:
+        error = 'Cancelled'
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+    if error and partial and os.path.exists(partial):
+        os.remove(partial)
+    elapsed = time.monotonic() - started
+    bytes_in = _input_size(job.input_path)
+    metrics = job_record(job, started_at, elapsed, cpu_seconds(exclusive) - cpu_started, bytes_in, error, cached,
+                         profile, peak_rss_mb() if measure_rss else None)
+    return BatchResult(job, error, elapsed, bytes_in, cached, metrics)
+
+
+class BatchProcessor:
+    """
+    Runs conversion jobs with bounded concurrency.
+
+    Heavy jobs (images, PDF, audio, video) are sent to a process pool and light ones
+    (JSON/YAML/XML, Markdown) to a thread pool, as flagged in the conversion registry.
+    Jobs are pulled lazily from the iterable passed to run(), so only a small window of
+    them is ever queued. With a ResultCache, inputs that were converted before with the
+    same options are served from the cache instead of being converted again. With a
+    MetricsRecorder, every finished job's record is written to it. With a DaemonClient
+    (see utils.daemon), jobs are sent to the daemon's warm workers instead of local pools.
+    With a BatchJournal, jobs that completed in an earlier run of the batch and whose input
+    has not changed are skipped, so an interrupted batch resumes where it stopped.
+    """
+
+    def __init__(self, max_workers=None, thread_workers=None, cache=None, unit='files', metrics=None,
+                 profiler=None, daemon=None, journal=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.thread_workers = thread_workers or min(32, self.max_workers * 4)
+        self.cache = cache
+        self.unit = unit  # What a job is called in the throughput, e.g. 'images'
+        self.metrics = metrics
+        self.profiler = profiler
+        self.daemon = daemon
+        self.journal = journal
+        # Always spawn: forking while the thread pool (or Qt) is running can deadlock the child
+        self._mp_context = multiprocessing.get_context('spawn')
+        # A multiprocessing event, so running jobs in worker processes see cancellation too
+        self._cancel_event = self._mp_context.Event()
+        self.files_done = 0
+        self.files_failed = 0
+        self.files_cached = 0
+        self.files_skipped = 0
+        self.bytes_done = 0
+        self.started_at = None
+        self.finished_at = None
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def run(self, jobs, on_result=None):
+        """
+        Process every job from `jobs` and call `on_result(result)` as each one finishes.
+        Returns the summary string once all jobs are done or the batch was cancelled.
+        `jobs` may yield None when no job is ready yet (see utils.watcher.watch_jobs); the
+        batch then goes on and asks again. A KeyboardInterrupt cancels the batch (jobs that
+        have not started never do) before it is raised again.
+        """
+        self._cancel_event.clear()
+        self.files_done = self.files_failed = self.files_cached = self.files_skipped = self.bytes_done = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        if self.daemon:
+            self._run_on_daemon(iter(jobs), on_result)
+            self.finished_at = time.monotonic()
+            return self.summary()
+
+        jobs = iter(jobs)
+        pending = {}
+        window = (self.max_workers + self.thread_workers) * 2
+        exhausted = idle = False
+
+        thread_progress = ProgressReporter(cancel_token=CancelToken(self._cancel_event))
+
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._mp_context,
+                                 initializer=_init_worker, initargs=(self._cancel_event,)) as processes, \
+                ThreadPoolExecutor(max_workers=self.thread_workers) as threads:
+            try:
+                while True:
+                    idle = False
+                    while not exhausted and not self.cancelled and len(pending) < window:
+                        job = next(jobs, _END)
+                        if job is _END:
+                            exhausted = True
+                            break
+                        if job is None:
+                            idle = True
+                            break
+                        if not isinstance(job, BatchJob):
+                            job = BatchJob(*job)
+                        if self.journal and self._skip(job, on_result):
+                            continue
+                        job = job._replace(submitted_at=time.time())
+                        if get_conversion(job.conversion_type).heavy:
+                            future = processes.submit(_run_in_worker, job, self.cache, self.profiler)
+                        else:
+                            future = threads.submit(run_job, job, self.cache, thread_progress, self.profiler)
+                        pending[future] = job
+
+                    if self.cancelled:
+                        for future in pending:
+                            future.cancel()
+
+                    if not pending:
+                        if exhausted or self.cancelled:
+                            break
+                        continue
+
+                    # Come back for new jobs sooner when the source had none ready
+                    done, _ = wait(pending, timeout=0.1 if idle else 0.5, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job = pending.pop(future)
+                        if future.cancelled():
+                            result = BatchResult(job, 'Cancelled', 0.0, 0)
+                        else:
+                            try:
+                                result = future.result()
+                            except Exception as e:
+                                # Worker process died (e.g. killed) rather than the conversion failing
+                                result = BatchResult(job, str(e) or e.__class__.__name__, 0.0, 0)
+                        self._record(result)
+                        if on_result:
+                            on_result(result)
+            except KeyboardInterrupt:
+                # Cancel here: leaving the `with` waits for every job already handed to the pools
+                self._interrupted(pending)
+                raise
+
+        self.finished_at = time.monotonic()
+        return self.summary()
+
+    def _run_on_daemon(self, jobs, on_result):
+        pending = {}
+        window = (self.max_workers + self.thread_workers) * 2
+        try:
+            self._wait_on_daemon(jobs, on_result, pending, window)
+        except KeyboardInterrupt:
+            self._interrupted(pending)
+            raise
+
+    def _wait_on_daemon(self, jobs, on_result, pending, window):
+        exhausted = cancel_sent = False
+        while True:
+            idle = False
+            while not exhausted and not self.cancelled and len(pending) < window:
+                job = next(jobs, _END)
+                if job is _END:
+                    exhausted = True
+                    break
+                if job is None:
+                    idle = True
+                    break
+                if not isinstance(job, BatchJob):
+                    job = BatchJob(*job)
+                if self.journal and self._skip(job, on_result):
+                    continue
+                pending[self.daemon.submit(job, self.cache)] = job
+            if self.cancelled and not cancel_sent:
+                for job_id in pending:
+                    self.daemon.cancel(job_id)
+                cancel_sent = True
+            if not pending:
+                if exhausted or self.cancelled:
+                    break
+                continue
+            for state in self.daemon.wait(pending, 0.1 if idle else 0.5)['jobs']:
+                if state['status'] in ('done', 'failed', 'cancelled', 'unknown'):
+                    result = self.daemon.result_for(pending.pop(state['id']), state)
+                    self._record(result)
+                    if on_result:
+                        on_result(result)
+
+    def _interrupted(self, pending):
+        """Cancel the batch and its `pending` jobs (futures, or daemon job IDs) after a KeyboardInterrupt."""
+        self.cancel()
+        self.finished_at = time.monotonic()
+        for key in pending:
+            if self.daemon:
+                try:
+                    self.daemon.cancel(key)
+                except Exception as e:
+                    logging.warning(f"Could not cancel daemon job {key}: {e}")
+            else:
+                key.cancel()
+
+    def _skip(self, job, on_result):
+        """Report a job the journal has as done and unchanged, or journal it as started."""
+        if not self.journal.is_done(job):
+            self.journal.start(job)
+            return False
+        result = BatchResult(job, None, 0.0, 0, skipped=True)
+        self._record(result)
+        if on_result:
+            on_result(result)
+        return True
+
+    def _record(self, result):
+        self.files_done += 1
+        if self.journal and not result.skipped:
+            self.journal.finish(result)
+        if result.skipped:
+            self.files_skipped += 1
+        if result.cached:
+            self.files_cached += 1
+        if result.error:
+            self.files_failed += 1
+        else:
+            self.bytes_done += result.bytes_in
+        if self.metrics:
+            self.metrics.record(result.metrics)
+
+    def throughput(self):
+        """Returns (jobs per second, megabytes per second) for the current or last run."""
+        if self.started_at is None:
+            return 0.0, 0.0
+        elapsed = max((self.finished_at or time.monotonic()) - self.started_at, 1e-6)
+        return self.files_done / elapsed, self.bytes_done / (1024 * 1024) / elapsed
+
+    def summary(self):
+        files_per_sec, mb_per_sec = self.throughput()
+        elapsed = (self.finished_at or time.monotonic()) - (self.started_at or time.monotonic())
+        status = "Batch cancelled" if self.cancelled else "Batch finished"
+        cached = f", {self.files_cached} from cache" if self.cache else ""
+        if self.journal:
+            cached += f", {self.files_skipped} unchanged since the last run"
+        return (f"{status}: {self.files_done} file(s), {self.files_failed} failed{cached} in {elapsed:.1f}s "
+                f"({files_per_sec:.2f} {self.unit}/s, {mb_per_sec:.2f} MB/s)")
@@ -1,21 +1,43 @@
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from googleapiclient.http import MediaFileUpload
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 import os
-import io
+import json
+import time
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/drive.metadata.readonly',
           'https://www.googleapis.com/auth/drive.file']
 
+# Downloads are fetched in ranged requests of this size and appended to a '.part' file,
+# so memory use stays at one chunk no matter how large the file is.
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Metadata kept for every file in the local folder cache
+FILE_FIELDS = ('id', 'name', 'size', 'md5Checksum', 'modifiedTime')
+# Metadata that identifies a revision of a file, so a '.part' is only resumed for the same one
+REVISION_FIELDS = ('md5Checksum', 'modifiedTime', 'size')
+
+
+def file_revision(file):
+    """The revision fields of a Drive file's metadata, or None if it has none of them."""
+    revision = {field: file[field] for field in REVISION_FIELDS if file.get(field) is not None}
+    return revision or None
+
 
 class GoogleDriveIntegration:
-    def __init__(self, credentials_file='credentials.json', token_file='token.json'):
+    def __init__(self, credentials_file='credentials.json', token_file='token.json',
+                 chunk_size=DEFAULT_CHUNK_SIZE, num_retries=3, cache_file='drive_cache.json'):
         self.credentials_file = credentials_file
         self.token_file = token_file
+        self.cache_file = cache_file
+        self._folder_cache = None
+        self.chunk_size = chunk_size
+        self.num_retries = num_retries
+        self.creds = None
         self.service = None
 
     def authenticate(self):
@@ -31,8 +53,22 @@ class GoogleDriveIntegration:
                 creds = flow.run_local_server(port=0)
             with open(self.token_file, 'w') as token:
                 token.write(creds.to_json())
+        self.creds = creds
         self.service = build('drive', 'v3', credentials=creds)
 
+    def clone(self):
+        """
+        Return a new client that shares these credentials but has its own service and HTTP
+        connection. httplib2 connections are not thread-safe, so use one clone per thread.
+        """
+        if not self.service:
+            self.authenticate()
+        client = GoogleDriveIntegration(self.credentials_file, self.token_file, self.chunk_size,
+                                        self.num_retries, self.cache_file)
+        client.creds = self.creds
+        client.service = build('drive', 'v3', credentials=self.creds)
+        return client
+
     def upload_file(self, file_path, folder_id=None):
         try:
             if not self.service:
@@ -48,36 +84,200 @@ class GoogleDriveIntegration:
             print(f'An error occurred: {error}')
             return None
 
-    def download_file(self, file_id, file_path):
+    def download_file(self, file_id, file_path, chunk_size=None, progress=None, revision=None):
+        """Download a Drive file (see download_request); `revision` is looked up when not given."""
         try:
             if not self.service:
                 self.authenticate()
+            if revision is None:
+                revision = file_revision(self.service.files().get(
+                    fileId=file_id, fields=', '.join(REVISION_FIELDS)).execute())
             request = self.service.files().get_media(fileId=file_id)
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while done is False:
-                status, done = downloader.next_chunk()
-                print(f'Download {int(status.progress() * 100)}%.')
-            with open(file_path, 'wb') as f:
-                f.write(fh.getvalue())
-            return file_path
+            return self.download_request(request, file_path, chunk_size, progress, revision)
         except HttpError as error:
             print(f'An error occurred: {error}')
             return None
 
-    def list_files_in_folder(self, folder_id):
+    def download_request(self, request, file_path, chunk_size=None, progress=None, revision=None):
+        """
+        Stream a media request into `file_path` chunk by chunk.
+
+        Data is appended to '<file_path>.part'. If a previous attempt was interrupted the
+        download resumes from the last byte received, and the file is only renamed to
+        `file_path` once it is complete. `request` needs `uri`, `headers` and an
+        httplib2-style `http`, which is what `files().get_media()` returns. `progress` (a
+        ProgressReporter) receives bytes received so far and can cancel the download; the
+        partial file is kept so a later call resumes it.
+
+        `revision` (see file_revision) is stored next to the '.part', and a '.part' is only
+        resumed when it was left by a download of the same revision; otherwise the download
+        starts over, so bytes of two versions of a file are never joined.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        partial_path = file_path + '.part'
+        revision_path = partial_path + '.json'
+        if os.path.exists(partial_path) and (revision is None or self._part_revision(revision_path) != revision):
+            os.remove(partial_path)
+        if revision is not None and not os.path.exists(partial_path):
+            with open(revision_path, 'w', encoding='utf-8') as f:
+                json.dump(revision, f)
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        total = None
+        with open(partial_path, 'ab') as fh:
+            while total is None or offset < total:
+                resp, content = self._request_range(request, offset, offset + chunk_size - 1)
+                if resp.status == 416:
+                    content_range = resp.get('content-range', '')
+                    size = content_range.rsplit('/', 1)[1] if '/' in content_range else ''
+                    if (int(size) if size.isdigit() else 0) == offset:
+                        # Nothing left past `offset`: the previous attempt already got everything
+                        break
+                    # The '.part' does not match the file's size on Drive: start over
+                    fh.truncate(0)
+                    offset, total = 0, None
+                    continue
+                if resp.status == 200:
+                    # The server ignored the range and sent the whole file
+                    fh.truncate(0)
+                    fh.write(content)
+                    offset = total = len(content)
+                    break
+                content_range = resp.get('content-range', '')
+                total = int(content_range.rsplit('/', 1)[1]) if '/' in content_range else offset + len(content)
+                fh.write(content)
+                offset += len(content)
+                if not content:
+                    break
+                if progress:
+                    progress.update(offset, total)
+                else:
+                    print(f'Download {int(offset * 100 / total) if total else 100}%.')
+        os.replace(partial_path, file_path)
+        if os.path.exists(revision_path):
+            os.remove(revision_path)
+        return file_path
+
+    @staticmethod
+    def _part_revision(revision_path):
+        try:
+            with open(revision_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _request_range(self, request, start, end):
+        headers = dict(request.headers or {})
+        headers['range'] = f'bytes={start}-{end}'
+        for attempt in range(self.num_retries + 1):
+            try:
+                resp, content = request.http.request(request.uri, method='GET', headers=headers)
+            except (OSError, ConnectionError):
+                if attempt == self.num_retries:
+                    raise
+            else:
+                if resp.status in (200, 206, 416):
+                    return resp, content
+                if (resp.status < 500 and resp.status != 429) or attempt == self.num_retries:
+                    raise HttpError(resp, content, uri=request.uri)
+            time.sleep(2 ** attempt)
+
+    def list_files_in_folder(self, folder_id, use_cache=True):
+        """
+        Yield the files in a folder as dicts with id, name, size, md5Checksum and modifiedTime.
+
+        The first listing walks every page and yields each page as it arrives, so callers can
+        start working before the listing is complete. The result is cached locally together
+        with a changes-feed token. Later calls apply only the changes since then instead of
+        listing the folder again.
+        """
         try:
             if not self.service:
                 self.authenticate()
-            results = self.service.files().list(
-                q=f"'{folder_id}' in parents",
-                fields="nextPageToken, files(id, name)").execute()
-            items = results.get('files', [])
-            return items
+            if use_cache and self._refresh_cached_folder(folder_id):
+                yield from list(self._folder_cache[folder_id]['files'].values())
+                return
+
+            # Take the token before listing so changes made during the listing are not missed
+            start_token = self.service.changes().getStartPageToken().execute().get('startPageToken')
+            files = {}
+            page_token = None
+            while True:
+                results = self.service.files().list(
+                    q=f"'{folder_id}' in parents and trashed = false",
+                    fields=f"nextPageToken, files({', '.join(FILE_FIELDS)})",
+                    pageSize=1000, pageToken=page_token).execute()
+                for item in results.get('files', []):
+                    files[item['id']] = item
+                    yield item
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+            if use_cache and start_token:
+                self._load_folder_cache()[folder_id] = {'page_token': start_token, 'files': files}
+                self._save_folder_cache()
         except HttpError as error:
             print(f'An error occurred: {error}')
-            return []
+
+    def _load_folder_cache(self):
+        if self._folder_cache is None:
+            self._folder_cache = {}
+            if self.cache_file and os.path.exists(self.cache_file):
+                try:
+                    with open(self.cache_file) as f:
+                        self._folder_cache = json.load(f)
+                except (OSError, ValueError) as error:
+                    print(f'Ignoring unreadable Drive cache {self.cache_file}: {error}')
+        return self._folder_cache
+
+    def _save_folder_cache(self):
+        if not self.cache_file:
+            return
+        temp_path = self.cache_file + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self._folder_cache, f)
+        os.replace(temp_path, self.cache_file)
+
+    def _refresh_cached_folder(self, folder_id):
+        """Bring a cached folder listing up to date from the changes feed. False if not cached."""
+        entry = self._load_folder_cache().get(folder_id)
+        if not entry:
+            return False
+        files = entry['files']
+        page_token = entry['page_token']
+        try:
+            while page_token:
+                results = self.service.changes().list(
+                    pageToken=page_token, spaces='drive', pageSize=1000,
+                    fields=f"nextPageToken, newStartPageToken, "
+                           f"changes(fileId, removed, file({', '.join(FILE_FIELDS)}, parents, trashed))").execute()
+                for change in results.get('changes', []):
+                    file = change.get('file')
+                    if (change.get('removed') or not file or file.get('trashed')
+                            or folder_id not in file.get('parents', [])):
+                        files.pop(change['fileId'], None)
+                    else:
+                        files[file['id']] = {key: file[key] for key in FILE_FIELDS if key in file}
+                if 'newStartPageToken' in results:
+                    entry['page_token'] = results['newStartPageToken']
+                    break
+                page_token = results.get('nextPageToken')
+        except HttpError as error:
+            # Usually an expired page token: forget the entry and list the folder again
+            print(f'Drive changes feed failed, relisting folder: {error}')
+            del self._folder_cache[folder_id]
+            return False
+        self._save_folder_cache()
+        return True
+
+    def get_file_metadata(self, file_id):
+        """Return id, name, size, md5Checksum and modifiedTime for a single file."""
+        try:
+            if not self.service:
+                self.authenticate()
+            return self.service.files().get(fileId=file_id, fields=', '.join(FILE_FIELDS)).execute()
+        except HttpError as error:
+            print(f'An error occurred: {error}')
+            return None
 
     def get_file_name(self, file_id):
         try:
@@ -0,0 +1,319 @@
+import os
+import re
+import json
+import inspect
+import importlib
+from collections import namedtuple, OrderedDict
+
+# Registry of every conversion and editing type. Backends are only imported the first time
+# one of their conversions runs, so a CSV -> JSON job never pays for moviepy, cv2 or pandas.
+#
+# `args` lists the handler's positional arguments in order: 'input', 'inputs' (the input
+# path split on ';'), 'output', or an option name. Option names ending in '?' are optional.
+# Any other option whose name matches a keyword parameter of the handler is passed by keyword.
+#
+# `variants` maps an option name to an alternative backend with a method of the same name;
+# when that option is set, e.g. {'stream': True}, the alternative handles the job instead.
+# A 'name=value' key matches only that value, e.g. 'engine=moviepy'.
+#
+# `output_ext` is None to keep the input's extension, or a function of the options when
+# they decide the output format.
+
+Conversion = namedtuple('Conversion', ['name', 'kind', 'backend', 'input_exts', 'output_ext', 'args', 'heavy',
+                                       'variants'])
+
+DOCUMENT = ('converters.document_converter', 'DocumentConverter')
+IMAGE = ('converters.image_converter', 'ImageConverter')
+MEDIA = ('converters.media_converter', 'MediaConverter')
+MISC = ('converters.misc_converter', 'MiscConverter')
+VIDEO_EDITOR = ('editors.video_editor', 'VideoEditor')
+AUDIO_EDITOR = ('editors.audio_editor', 'AudioEditor')
+IMAGE_EDITOR = ('editors.image_editor', 'ImageEditor')
+STREAMING_DATA = ('converters.streaming_data', 'StreamingDataConverter')
+PDF_PAGES = ('converters.pdf_pages', 'PdfPageConverter')
+IMAGE_PIPELINE = ('converters.image_pipeline', 'ImagePipeline')
+FFMPEG = ('converters.ffmpeg_engine', 'FfmpegEngine')
+GIF = ('converters.gif_engine', 'GifEngine')
+AUDIO_ENGINE = ('converters.audio_engine', 'AudioEngine')
+FRAMES = ('converters.frame_extractor', 'FrameExtractor')
+IMAGE_PDF = ('converters.image_pdf', 'ImagePdfConverter')
+STREAMING_SHEETS = ('converters.streaming_sheets', 'StreamingSheetConverter')
+
+WORD = ('.docx', '.doc')
+EXCEL = ('.xlsx', '.xls')
+JPEG = ('.jpg', '.jpeg')
+IMAGES = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.gif', '.tiff')
+VIDEOS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+AUDIO = ('.mp3', '.wav', '.flac', '.aac', '.ogg', '.m4a')
+
+CONVERSIONS = OrderedDict()
+
+
+def _register(name, backend, input_exts, output_ext, args=('input', 'output'), heavy=True, kind='conversion',
+              variants=None):
+    CONVERSIONS[name] = Conversion(name, kind, backend, input_exts, output_ext, args, heavy, variants or {})
+
+
+def _register_edit(name, backend, input_exts, args=('input', 'output'), output_ext=None, variants=None):
+    _register(name, backend, input_exts, output_ext, args, kind='editing', variants=variants)
+
+
+def _gif_output_ext(options):
+    from converters.gif_engine import output_ext
+    return output_ext(options)
+
+
+STREAMABLE = {'stream': STREAMING_DATA}
+STREAMABLE_SHEETS = {'stream': STREAMING_SHEETS}
+# Operations the ffmpeg engine runs by default; `engine=moviepy` selects the original code
+MOVIEPY_MEDIA = {'engine=moviepy': MEDIA}
+MOVIEPY_VIDEO = {'engine=moviepy': VIDEO_EDITOR}
+# Audio operations streamed through ffmpeg by default; `engine=pydub` selects the original code
+PYDUB_MEDIA = {'engine=pydub': MEDIA}
+PYDUB_AUDIO = {'engine=pydub': AUDIO_EDITOR}
+
+_register('word_to_pdf', DOCUMENT, WORD, '.pdf')
+_register('pdf_to_word', PDF_PAGES, ('.pdf',), '.docx')
+_register('excel_to_pdf', DOCUMENT, EXCEL, '.pdf', variants=STREAMABLE_SHEETS)
+_register('pdf_to_excel', PDF_PAGES, ('.pdf',), '.xlsx')
+_register('excel_to_word', DOCUMENT, EXCEL, '.docx', variants=STREAMABLE_SHEETS)
+_register('word_to_excel', DOCUMENT, WORD, '.xlsx')
+_register('txt_to_word', DOCUMENT, ('.txt',), '.docx')
+_register('word_to_txt', DOCUMENT, WORD, '.txt')
+_register('csv_to_excel', DOCUMENT, ('.csv',), '.xlsx', variants=STREAMABLE_SHEETS)
+_register('excel_to_csv', DOCUMENT, EXCEL, '.csv', variants=STREAMABLE_SHEETS)
+_register('pdf_to_html', PDF_PAGES, ('.pdf',), '.html')
+_register('pdf_to_md', PDF_PAGES, ('.pdf',), '.md')
+_register('jpeg_to_png', IMAGE, JPEG, '.png')
+_register('png_to_jpeg', IMAGE, ('.png',), '.jpg')
+_register('jpeg_to_bmp', IMAGE, JPEG, '.bmp')
+_register('bmp_to_png', IMAGE, ('.bmp',), '.png')
+_register('png_to_webp', IMAGE, ('.png',), '.webp')
+_register('webp_to_png', IMAGE, ('.webp',), '.png')
+_register('pdf_to_images', PDF_PAGES, ('.pdf',), None)
+_register('images_to_pdf', IMAGE_PDF, IMAGES, '.pdf', args=('inputs', 'output'))
+_register('mp4_to_mp3', FFMPEG, ('.mp4',), '.mp3', variants=MOVIEPY_MEDIA)
+_register('mp3_to_wav', AUDIO_ENGINE, ('.mp3',), '.wav', variants=PYDUB_MEDIA)
+_register('wav_to_mp3', AUDIO_ENGINE, ('.wav',), '.mp3', variants=PYDUB_MEDIA)
+_register('mp4_to_gif', GIF, ('.mp4',), _gif_output_ext, variants=MOVIEPY_MEDIA)
+_register('gif_to_mp4', FFMPEG, ('.gif',), '.mp4', variants=MOVIEPY_MEDIA)
+_register('avi_to_mp4', FFMPEG, ('.avi',), '.mp4', variants=MOVIEPY_MEDIA)
+_register('mp4_to_avi', FFMPEG, ('.mp4',), '.avi', variants=MOVIEPY_MEDIA)
+_register('flac_to_mp3', AUDIO_ENGINE, ('.flac',), '.mp3', variants=PYDUB_MEDIA)
+_register('mp3_to_flac', AUDIO_ENGINE, ('.mp3',), '.flac', variants=PYDUB_MEDIA)
+_register('aac_to_mp3', AUDIO_ENGINE, ('.aac',), '.mp3', variants=PYDUB_MEDIA)
+_register('mp3_to_aac', AUDIO_ENGINE, ('.mp3',), '.aac', variants=PYDUB_MEDIA)
+_register('json_to_csv', MISC, ('.json', '.ndjson', '.jsonl'), '.csv', heavy=False, variants=STREAMABLE)
+_register('csv_to_json', MISC, ('.csv',), '.json', heavy=False, variants=STREAMABLE)
+_register('yaml_to_json', MISC, ('.yaml', '.yml'), '.json', heavy=False, variants=STREAMABLE)
+_register('json_to_yaml', MISC, ('.json', '.ndjson', '.jsonl'), '.yaml', heavy=False, variants=STREAMABLE)
+_register('xml_to_json', MISC, ('.xml',), '.json', heavy=False, variants=STREAMABLE)
+_register('json_to_xml', MISC, ('.json', '.ndjson', '.jsonl'), '.xml', heavy=False, variants=STREAMABLE)
+_register('html_to_markdown', MISC, ('.html', '.htm'), '.md', heavy=False)
+_register('markdown_to_html', MISC, ('.md', '.markdown'), '.html', heavy=False)
+
+_register_edit('trim_video', FFMPEG, VIDEOS, args=('input', 'output', 'start_time', 'end_time'),
+               variants=MOVIEPY_VIDEO)
+_register_edit('remove_sound', FFMPEG, VIDEOS, variants=MOVIEPY_VIDEO)
+_register_edit('merge_videos', VIDEO_EDITOR, VIDEOS, args=('inputs', 'output'))
+_register_edit('add_audio', FFMPEG, VIDEOS, args=('input', 'audio_path', 'output'), variants=MOVIEPY_VIDEO)
+_register_edit('change_resolution', FFMPEG, VIDEOS, args=('input', 'output', 'new_resolution'),
+               variants=MOVIEPY_VIDEO)
+_register_edit('add_subtitles', FFMPEG, VIDEOS, args=('input', 'srt_path', 'output'), variants=MOVIEPY_VIDEO)
+_register_edit('extract_frames', FRAMES, VIDEOS, args=('input', 'output', 'frame_times?', 'fps?'),
+               variants=MOVIEPY_VIDEO)
+_register_edit('trim_audio', AUDIO_ENGINE, AUDIO, args=('input', 'output', 'start_time', 'end_time'),
+               variants=PYDUB_AUDIO)
+_register_edit('remove_noise', AUDIO_ENGINE, AUDIO, args=('input', 'output', 'noise_reduction_amount'),
+               variants=PYDUB_AUDIO)
+_register_edit('change_speed', AUDIO_ENGINE, AUDIO, args=('input', 'output', 'speed_factor'), variants=PYDUB_AUDIO)
+_register_edit('merge_audio_files', AUDIO_ENGINE, AUDIO, args=('inputs', 'output'), variants=PYDUB_AUDIO)
+_register_edit('extract_audio_from_video', AUDIO_EDITOR, VIDEOS, output_ext='.mp3')
+_register_edit('resize_image', IMAGE_EDITOR, IMAGES, args=('input', 'output', 'size'))
+_register_edit('compress_image', IMAGE_EDITOR, IMAGES, args=('input', 'output', 'quality'))
+_register_edit('rotate_image', IMAGE_EDITOR, IMAGES, args=('input', 'output', 'degrees'))
+_register_edit('flip_image', IMAGE_EDITOR, IMAGES, args=('input', 'output', 'direction'))
+_register_edit('add_watermark', IMAGE_EDITOR, IMAGES,
+               args=('input', 'output', 'watermark_text', 'position', 'font_size', 'font_path?'))
+_register_edit('convert_to_grayscale', IMAGE_EDITOR, IMAGES)
+
+
+def _pipeline_output_ext(options):
+    from converters.image_pipeline import output_ext_for_steps
+    return output_ext_for_steps(options.get('steps'), options.get('format'))
+
+
+_register_edit('image_pipeline', IMAGE_PIPELINE, IMAGES, args=('input', 'output', 'steps'),
+               output_ext=_pipeline_output_ext)
+
+
+def _video_pipeline_output_ext(options):
+    from converters.ffmpeg_engine import output_ext_for_steps
+    return output_ext_for_steps(options.get('steps'))
+
+
+_register_edit('video_pipeline', FFMPEG, VIDEOS, args=('input', 'output', 'steps'),
+               output_ext=_video_pipeline_output_ext)
+
+# Operations whose ffmpeg engine handler takes `segments` (parallel keyframe-aligned encoding), declared
+# here so the GUI can offer the option without importing the backend
+SEGMENTED = frozenset({'avi_to_mp4', 'mp4_to_avi', 'gif_to_mp4', 'change_resolution', 'video_pipeline'})
+
+CONVERSION_TYPES = [name for name, c in CONVERSIONS.items() if c.kind == 'conversion']
+EDITING_TYPES = [name for name, c in CONVERSIONS.items() if c.kind == 'editing']
+
+_backends = {}
+_parameters = {}
+
+
+def get_conversion(conversion_type):
+    try:
+        return CONVERSIONS[conversion_type]
+    except KeyError:
+        raise ValueError(f"Unsupported conversion type: {conversion_type}") from None
+
+
+def load_backend(backend):
+    """Import a (module, class) backend on first use and cache it."""
+    if backend not in _backends:
+        module_name, class_name = backend
+        _backends[backend] = getattr(importlib.import_module(module_name), class_name)
+    return _backends[backend]
+
+
+def select_backend(conversion_type, options=None):
+    """The backend that will run the conversion with these options (see `variants`)."""
+    conversion = get_conversion(conversion_type)
+    options = options or {}
+    for key, backend in conversion.variants.items():
+        option, _, value = key.partition('=')
+        if (str(options.get(option)) == value) if value else options.get(option):
+            return backend
+    return conversion.backend
+
+
+def get_handler(conversion_type, options=None):
+    return getattr(load_backend(select_backend(conversion_type, options)), conversion_type)
+
+
+def handler_parameters(handler):
+    """Names of the parameters a handler accepts, cached per handler."""
+    if handler not in _parameters:
+        try:
+            _parameters[handler] = frozenset(inspect.signature(handler).parameters)
+        except (TypeError, ValueError):
+            _parameters[handler] = frozenset()
+    return _parameters[handler]
+
+
+def _parse_value(value):
+    if re.fullmatch(r'\d+x\d+', value):
+        return tuple(map(int, value.split('x')))
+    if re.fullmatch(r'-?\d+(,-?\d+)+', value):
+        return tuple(map(int, value.split(',')))
+    try:
+        value = json.loads(value)
+    except ValueError:
+        return value
+    return tuple(value) if isinstance(value, list) else value
+
+
+def parse_steps(steps):
+    """
+    Normalize the `steps` option of the pipeline types (image_pipeline, video_pipeline) to a
+    list of (operation, options) pairs. Operation names are registered conversion names.
+
+    Steps can be given as a list of [name, {options}] pairs or {'op': name, ...} dicts (e.g.
+    from JSON), or as text: 'resize_image size=800x600 | add_watermark watermark_text=Draft
+    position=10,10 font_size=24 | png_to_webp'.
+    """
+    if isinstance(steps, str):
+        stripped = steps.strip()
+        if stripped.startswith('['):
+            return parse_steps(json.loads(stripped))
+        parsed = []
+        for part in stripped.split('|'):
+            words = part.split()
+            if not words:
+                continue
+            options = {}
+            for word in words[1:]:
+                if '=' not in word:
+                    raise ValueError(f"Step options must look like KEY=VALUE, got '{word}'")
+                key, value = word.split('=', 1)
+                options[key] = _parse_value(value)
+            parsed.append((words[0], options))
+        return parsed
+    parsed = []
+    for step in steps or ():
+        if isinstance(step, dict):
+            options = dict(step)
+            parsed.append((options.pop('op'), options))
+        elif isinstance(step, str):
+            parsed.append((step, {}))
+        else:
+            name, options = step if len(step) == 2 else (step[0], {})
+            parsed.append((name, dict(options or {})))
+    return parsed
+
+
+def required_options(conversion_type):
+    return [arg for arg in get_conversion(conversion_type).args
+            if arg not in ('input', 'inputs', 'output') and not arg.endswith('?')]
+
+
+def accepts(conversion_type, path):
+    """Whether `path` has one of the input extensions of the conversion."""
+    return os.path.splitext(path)[1].lower() in get_conversion(conversion_type).input_exts
+
+
+def output_path_for(conversion_type, input_path, output_dir, options=None):
+    """Default output file for `input_path`: '<name>_converted<ext>' inside `output_dir`."""
+    name, ext = os.path.splitext(os.path.basename(input_path))
+    output_ext = get_conversion(conversion_type).output_ext
+    if callable(output_ext):
+        output_ext = output_ext(options or {})
+    return os.path.join(output_dir, name + '_converted' + (output_ext or ext))
+
+
+def is_image_conversion(conversion_type):
+    """Whether the conversion takes single images, so batch throughput can be shown as images/s."""
+    conversion = get_conversion(conversion_type)
+    return 'inputs' not in conversion.args and set(conversion.input_exts) <= set(IMAGES)
+
+
+def run_conversion(conversion_type, input_path, output_path, options=None, progress=None):
+    """
+    Run a single conversion or editing operation by name.
+
+    This is the dispatch used by both the GUI threads and the batch workers, so it
+    must stay free of any Qt imports. `progress` (a ProgressReporter) is passed on to
+    handlers that accept it, and is checked for cancellation before the handler starts.
+    """
+    conversion = get_conversion(conversion_type)
+    options = options or {}
+    missing = [name for name in required_options(conversion_type) if name not in options]
+    if missing:
+        raise ValueError(f"Missing option(s) for {conversion_type}: {', '.join(missing)}")
+
+    args = []
+    for arg in conversion.args:
+        if arg == 'input':
+            args.append(input_path)
+        elif arg == 'inputs':
+            args.append(input_path.split(';'))
+        elif arg == 'output':
+            args.append(output_path)
+        else:
+            args.append(options.get(arg.rstrip('?')))
+
+    handler = get_handler(conversion_type, options)
+    positional = {arg.rstrip('?') for arg in conversion.args}
+    parameters = handler_parameters(handler)
+    kwargs = {name: value for name, value in options.items()
+              if name in parameters and name not in positional and name != 'progress'}
+    if progress is not None:
+        progress.raise_if_cancelled()
+        if 'progress' in parameters:
+            kwargs['progress'] = progress
+    return handler(*args, **kwargs)
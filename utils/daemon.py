@@ -0,0 +1,600 @@
+"""
+Long-running conversion daemon with pre-warmed worker processes, and its client.
+
+Start it with `python -m utils.daemon`. It listens on localhost HTTP; the port and an
+access token are written to ~/.cache/universal-file-converter/daemon.json (readable only by
+the user), which is how the CLI and GUI find it. While it runs they send their jobs to it
+instead of converting in-process, so a small file costs only the conversion itself: the
+workers have already imported every converter backend (moviepy, pdfplumber, pandas,
+reportlab, ...) and located ffmpeg.
+
+    python -m utils.daemon --workers 4 --metrics-textfile /var/lib/node_exporter/converter.prom
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import hashlib
+import secrets
+import logging
+import argparse
+import threading
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from utils.batch_processor import BatchJob, BatchResult, run_job
+from utils.conversions import CONVERSIONS, get_conversion, load_backend
+from utils.progress import CancelToken, ProgressReporter
+
+DAEMON_DIR = os.path.join(os.path.expanduser("~"), '.cache', 'universal-file-converter')
+STATE_PATH = os.path.join(DAEMON_DIR, 'daemon.json')
+LOG_PATH = os.path.join(DAEMON_DIR, 'daemon.log')
+
+# Finished jobs kept for clients to collect; older ones are forgotten
+FINISHED_JOBS_KEPT = 1000
+# Jobs a worker process runs before it is replaced, so leaks in converter libraries cannot pile up
+DEFAULT_MAX_JOBS_PER_WORKER = 500
+STARTUP_TIMEOUT = 60
+FINISHED = ('done', 'failed', 'cancelled')
+
+
+def _code_version():
+    """Stamp of the converter and utility modules on disk; any edit to them changes it."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha1()
+    for package in ('converters', 'utils'):
+        directory = os.path.join(root, package)
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.py'):
+                stat = os.stat(os.path.join(directory, name))
+                digest.update(f'{package}/{name}:{stat.st_size}:{stat.st_mtime_ns};'.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+# Taken at import: a daemon reports the code it started with, a client compares it with the code it runs
+CODE_VERSION = _code_version()
+
+
+def _warm_up():
+    """Import every converter backend and locate ffmpeg, so no job pays for it."""
+    from converters.ffmpeg_engine import ffmpeg_binary, ffprobe_binary
+
+    backends = {c.backend for c in CONVERSIONS.values()}
+    backends.update(backend for c in CONVERSIONS.values() for backend in c.variants.values())
+    for backend in sorted(backends):
+        try:
+            load_backend(backend)
+        except Exception as e:
+            # A missing optional dependency only affects the conversions that need it
+            logging.info(f"Not preloading {'.'.join(backend)}: {e}")
+    ffmpeg_binary()
+    ffprobe_binary()
+
+
+def _worker_main(conn, cancel_event):
+    """Loop of a warm worker process: run each job sent down `conn`, reporting back on it."""
+    _warm_up()
+    caches = {}
+    send_lock = threading.Lock()
+
+    def send(message):
+        # Converters may report progress from their own threads
+        with send_lock:
+            conn.send(message)
+
+    send(('ready', os.getpid()))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        job, cache_spec = message
+        cache = None
+        if cache_spec:
+            from utils.result_cache import ResultCache
+            cache = caches.get(tuple(cache_spec)) or caches.setdefault(tuple(cache_spec), ResultCache(*cache_spec))
+        reporter = ProgressReporter(lambda percent: send(('progress', percent)), CancelToken(cancel_event))
+        send(('result', run_job(job, cache, reporter, exclusive=True)))
+
+
+class _Job:
+    def __init__(self, batch_job, cache_spec):
+        self.id = uuid.uuid4().hex
+        self.batch_job = batch_job
+        self.cache_spec = cache_spec
+        self.status = 'queued'
+        self.progress = 0
+        self.result = None
+        self.cancel_token = CancelToken()
+
+    def to_dict(self):
+        data = {'id': self.id, 'conversion_type': self.batch_job.conversion_type, 'status': self.status,
+                'progress': self.progress}
+        if self.result:
+            data['result'] = {'error': self.result.error, 'elapsed': self.result.elapsed,
+                              'bytes_in': self.result.bytes_in, 'cached': self.result.cached,
+                              'metrics': self.result.metrics}
+        return data
+
+
+class _WorkerSlot(threading.Thread):
+    """Feeds heavy jobs to one warm worker process, restarting it when it dies or is due."""
+
+    def __init__(self, daemon, number, max_jobs):
+        super().__init__(name=f'worker-slot-{number}', daemon=True)
+        self.owner = daemon
+        self.max_jobs = max_jobs
+        self.context = multiprocessing.get_context('spawn')
+        self.process = None
+        self.conn = None
+        self.cancel_event = self.context.Event()
+        self.jobs_run = 0
+        self.current = None
+
+    def start_process(self):
+        self.conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(target=_worker_main, args=(child_conn, self.cancel_event), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs_run = 0
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline and self.process.is_alive():
+            if self.conn.poll(0.5):
+                self.conn.recv()
+                return
+        raise RuntimeError(f"Worker process did not start (exit code {self.process.exitcode})")
+
+    def stop_process(self):
+        if self.process and self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        self.process = None
+
+    def cancel(self, job):
+        if job is not None and self.current is job:
+            self.cancel_event.set()
+
+    def run(self):
+        while True:
+            job = self.owner.next_heavy_job()
+            if job is None:
+                self.stop_process()
+                return
+            try:
+                if not self.process or not self.process.is_alive() or self.jobs_run >= self.max_jobs:
+                    self.stop_process()
+                    self.start_process()
+                result = self.run_on_process(job)
+            except Exception as e:
+                result = BatchResult(job.batch_job, str(e) or e.__class__.__name__, 0.0, 0)
+            self.owner.finish(job, result)
+
+    def run_on_process(self, job):
+        self.cancel_event.clear()
+        self.current = job
+        self.jobs_run += 1
+        try:
+            if job.cancel_token.cancelled:
+                self.cancel_event.set()
+            self.conn.send((job.batch_job, job.cache_spec))
+            while True:
+                try:
+                    if not self.conn.poll(0.5):
+                        if self.process.is_alive():
+                            continue
+                        raise EOFError
+                    kind, value = self.conn.recv()
+                except (EOFError, OSError):
+                    self.process.join(1)
+                    raise RuntimeError(f"Worker process died (exit code {self.process.exitcode})") from None
+                if kind == 'progress':
+                    job.progress = value
+                else:
+                    return value
+        finally:
+            self.current = None
+
+
+class ConversionDaemon:
+    """
+    Runs jobs submitted over HTTP. Heavy conversions go to `workers` warm processes (see
+    _WorkerSlot), light ones (data and Markdown conversions) to a thread pool in the daemon,
+    as in BatchProcessor. Every job is recorded in `metrics` (a MetricsRecorder).
+    """
+
+    def __init__(self, workers=None, thread_workers=None, max_jobs_per_worker=DEFAULT_MAX_JOBS_PER_WORKER,
+                 metrics=None):
+        self.metrics = metrics
+        self.jobs = OrderedDict()
+        self.finished = deque()
+        self.changed = threading.Condition()
+        self.heavy_queue = deque()
+        self.stopping = False
+        self.caches = {}
+        self.slots = [_WorkerSlot(self, number, max_jobs_per_worker)
+                      for number in range(workers or os.cpu_count() or 1)]
+        self.threads = ThreadPoolExecutor(max_workers=thread_workers or min(32, len(self.slots) * 4),
+                                          thread_name_prefix='light-job')
+        _warm_up()
+        for slot in self.slots:
+            slot.start_process()
+            slot.start()
+
+    def submit(self, batch_job, cache_spec=None):
+        job = _Job(batch_job._replace(submitted_at=time.time()), cache_spec)
+        with self.changed:
+            self.jobs[job.id] = job
+            if get_conversion(batch_job.conversion_type).heavy:
+                self.heavy_queue.append(job)
+                self.changed.notify_all()
+                return job
+        self.threads.submit(self._run_light, job)
+        return job
+
+    def next_heavy_job(self):
+        with self.changed:
+            while True:
+                if self.stopping:
+                    return None
+                while self.heavy_queue:
+                    job = self.heavy_queue.popleft()
+                    if job.status == 'queued':
+                        job.status = 'running'
+                        return job
+                self.changed.wait()
+
+    def _run_light(self, job):
+        with self.changed:
+            if job.status != 'queued':
+                return
+            job.status = 'running'
+        cache = None
+        if job.cache_spec:
+            from utils.result_cache import ResultCache
+            cache = self.caches.get(tuple(job.cache_spec)) or self.caches.setdefault(
+                tuple(job.cache_spec), ResultCache(*job.cache_spec))
+
+        def report(percent):
+            job.progress = percent
+
+        self.finish(job, run_job(job.batch_job, cache, ProgressReporter(report, job.cancel_token)))
+
+    def finish(self, job, result):
+        with self.changed:
+            job.result = result
+            job.progress = 100 if not result.error else job.progress
+            job.status = 'cancelled' if result.error == 'Cancelled' else 'failed' if result.error else 'done'
+            self.finished.append(job.id)
+            while len(self.finished) > FINISHED_JOBS_KEPT:
+                self.jobs.pop(self.finished.popleft(), None)
+            self.changed.notify_all()
+        if self.metrics:
+            self.metrics.record(result.metrics)
+
+    def cancel(self, job_id):
+        with self.changed:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job.cancel_token.cancel()
+            if job.status == 'queued':
+                job.status = 'cancelled'
+                job.result = BatchResult(job.batch_job, 'Cancelled', 0.0, 0)
+                self.finished.append(job.id)
+                self.changed.notify_all()
+        for slot in self.slots:
+            slot.cancel(job)
+        return job
+
+    def wait(self, job_ids, timeout):
+        """States of `job_ids` once one of them has finished, or after `timeout` seconds."""
+        deadline = time.monotonic() + max(0.0, min(float(timeout), 30.0))
+        with self.changed:
+            while True:
+                jobs = [self.jobs.get(job_id) for job_id in job_ids]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or any(job is None or job.status in FINISHED for job in jobs):
+                    return [job.to_dict() if job else {'id': job_id, 'status': 'unknown'}
+                            for job_id, job in zip(job_ids, jobs)]
+                self.changed.wait(remaining)
+
+    def health(self):
+        with self.changed:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {'pid': os.getpid(), 'version': CODE_VERSION, 'workers': [slot.process.pid if slot.process else None for slot in self.slots],
+                'jobs': counts}
+
+    def close(self):
+        with self.changed:
+            self.stopping = True
+            for job in self.heavy_queue:
+                job.cancel_token.cancel()
+            self.changed.notify_all()
+        for slot in self.slots:
+            slot.cancel(slot.current)
+        for slot in self.slots:
+            slot.join(10)
+        self.threads.shutdown(wait=False, cancel_futures=True)
+
+
+def _job_from_request(body):
+    options = {key: tuple(value) if isinstance(value, list) else value
+               for key, value in (body.get('options') or {}).items()}
+    phases = body.get('phases')
+    return BatchJob(body['conversion_type'], body['input_path'], body['output_path'], options,
+                    body.get('cache_key'), phases=phases)
+
+
+def make_server(daemon, host='127.0.0.1', port=0, token=None):
+    """HTTP front end of `daemon`. Every request must carry 'Authorization: Bearer <token>'."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, data):
+            body = data.encode('utf-8') if isinstance(data, str) else json.dumps(data).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4' if isinstance(data, str)
+                             else 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _authorized(self):
+            if secrets.compare_digest(self.headers.get('Authorization', ''), f'Bearer {token}'):
+                return True
+            self._reply(401, {'error': 'Missing or wrong token'})
+            return False
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return json.loads(self.rfile.read(length) or b'{}')
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            path = self.path.split('?')[0]
+            if path == '/health':
+                self._reply(200, daemon.health())
+            elif path == '/metrics':
+                self._reply(200, daemon.metrics.prometheus_text() if daemon.metrics else '')
+            elif path.startswith('/jobs/'):
+                states = daemon.wait([path[len('/jobs/'):]], 0)
+                self._reply(404 if states[0]['status'] == 'unknown' else 200, states[0])
+            else:
+                self._reply(404, {'error': 'Not found'})
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            path = self.path.split('?')[0]
+            try:
+                body = self._body()
+                if path == '/jobs':
+                    job = daemon.submit(_job_from_request(body), body.get('cache'))
+                    self._reply(202, job.to_dict())
+                elif path == '/jobs/wait':
+                    self._reply(200, {'jobs': daemon.wait(body.get('ids') or [], body.get('timeout', 0))})
+                elif path.startswith('/jobs/') and path.endswith('/cancel'):
+                    job = daemon.cancel(path[len('/jobs/'):-len('/cancel')])
+                    self._reply(404 if job is None else 200, job.to_dict() if job else {'error': 'Unknown job'})
+                elif path == '/shutdown':
+                    self._reply(200, {'status': 'stopping'})
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                else:
+                    self._reply(404, {'error': 'Not found'})
+            except (KeyError, TypeError, ValueError) as e:
+                self._reply(400, {'error': str(e) or e.__class__.__name__})
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+class DaemonClient:
+    """
+    Client of a running daemon, found through its state file. run_job and the batch methods
+    mirror utils.batch_processor, so callers can send jobs either way.
+    """
+
+    def __init__(self, port, token, host='127.0.0.1'):
+        self.base_url = f'http://{host}:{port}'
+        self.token = token
+        self.version = None
+
+    @classmethod
+    def connect(cls, autostart=False, state_path=STATE_PATH, any_version=False):
+        """
+        A client for the running daemon, or None. A daemon started from code other than this
+        process's (e.g. before an update) is not used; with `autostart` it is replaced, and a
+        daemon is started if none is running. `any_version` accepts a daemon of other code.
+        """
+        client = cls._from_state(state_path)
+        if client and client.version != CODE_VERSION and not any_version:
+            if not autostart:
+                logging.warning(f"The conversion daemon at {client.base_url} runs other code than this one, "
+                                f"not using it (restart it to pick up the changes)")
+                return None
+            logging.info(f"Replacing the conversion daemon at {client.base_url}, which runs older code")
+            client.stop()
+            client = None
+        if client or not autostart:
+            return client
+        import subprocess
+
+        os.makedirs(DAEMON_DIR, exist_ok=True)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with open(LOG_PATH, 'ab') as log:
+            subprocess.Popen([sys.executable, '-m', 'utils.daemon'], cwd=root, stdin=subprocess.DEVNULL,
+                             stdout=log, stderr=log, start_new_session=True)
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.2)
+            client = cls._from_state(state_path)
+            if client and client.version == CODE_VERSION:
+                return client
+        raise RuntimeError(f"The conversion daemon did not start, see {LOG_PATH}")
+
+    @classmethod
+    def _from_state(cls, state_path):
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            client = cls(state['port'], state['token'])
+            client.version = client.health().get('version')
+            return client
+        except (OSError, ValueError, KeyError, AttributeError, RuntimeError):
+            # No daemon, or the port now belongs to some other service
+            return None
+
+    def _request(self, method, path, body=None, timeout=10):
+        from urllib.request import Request, urlopen
+        from urllib.error import HTTPError
+
+        request = Request(self.base_url + path, method=method,
+                          data=json.dumps(body).encode('utf-8') if body is not None else None,
+                          headers={'Authorization': f'Bearer {self.token}', 'Content-Type': 'application/json'})
+        try:
+            with urlopen(request, timeout=timeout) as response:
+                return json.loads(response.read() or b'{}')
+        except HTTPError as e:
+            raise RuntimeError(f"Daemon: {json.loads(e.read() or b'{}').get('error', e.reason)}") from None
+
+    def health(self):
+        return self._request('GET', '/health', timeout=2)
+
+    def shutdown(self):
+        return self._request('POST', '/shutdown')
+
+    def stop(self, timeout=10):
+        """Shut the daemon down and wait until it no longer answers."""
+        try:
+            self.shutdown()
+        except (OSError, ValueError, RuntimeError):
+            return
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                self.health()
+            except (OSError, ValueError, RuntimeError):
+                return
+            time.sleep(0.1)
+
+    def submit(self, job, cache=None):
+        """Queue a BatchJob on the daemon and return its id. Paths are made absolute first."""
+        options = {key: os.path.abspath(value) if key.endswith('_path') and isinstance(value, str) else value
+                   for key, value in (job.options or {}).items()}
+        body = {'conversion_type': job.conversion_type,
+                'input_path': ';'.join(os.path.abspath(path) for path in job.input_path.split(';')),
+                'output_path': os.path.abspath(job.output_path), 'options': options,
+                'cache_key': job.cache_key, 'phases': job.phases,
+                'cache': [cache.cache_dir, cache.max_bytes] if cache else None}
+        return self._request('POST', '/jobs', body)['id']
+
+    def cancel(self, job_id):
+        return self._request('POST', f'/jobs/{job_id}/cancel')
+
+    def wait(self, job_ids, timeout=0.5):
+        return self._request('POST', '/jobs/wait', {'ids': list(job_ids), 'timeout': timeout}, timeout=timeout + 10)
+
+    @staticmethod
+    def result_for(job, state):
+        result = state.get('result')
+        if state['status'] == 'unknown' or not result:
+            return BatchResult(job, 'Job was lost by the daemon', 0.0, 0)
+        return BatchResult(job, result['error'], result['elapsed'], result['bytes_in'], result['cached'],
+                           result['metrics'])
+
+    def run_job(self, job, cache=None, progress=None):
+        """Like utils.batch_processor.run_job, on the daemon; `progress` sees its progress and can cancel it."""
+        try:
+            job_id = self.submit(job, cache)
+            cancelled = False
+            reported = 0
+            while True:
+                state = self.wait([job_id], 0.2)['jobs'][0]
+                if state['status'] in FINISHED or state['status'] == 'unknown':
+                    return self.result_for(job, state)
+                if progress is not None:
+                    if progress.cancelled and not cancelled:
+                        self.cancel(job_id)
+                        cancelled = True
+                    elif progress.callback and state['progress'] != reported:
+                        reported = state['progress']
+                        progress.callback(reported)
+        except (OSError, RuntimeError) as e:
+            return BatchResult(job, f"Conversion daemon: {e}", 0.0, 0)
+
+
+def write_state(port, token, state_path=STATE_PATH):
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    temp_path = f"{state_path}.{os.getpid()}.tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({'pid': os.getpid(), 'port': port, 'token': token}, f)
+    os.replace(temp_path, state_path)
+
+
+def main(argv=None):
+    from utils.metrics import MetricsRecorder
+
+    parser = argparse.ArgumentParser(prog='python -m utils.daemon', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=None, help='Warm worker processes (default: CPU count)')
+    parser.add_argument('--port', type=int, default=0, help='Port on 127.0.0.1 (default: any free port)')
+    parser.add_argument('--max-jobs-per-worker', type=int, default=DEFAULT_MAX_JOBS_PER_WORKER)
+    parser.add_argument('--metrics', default=None, metavar='FILE.jsonl',
+                        help='Also append every job record here (clients normally write their own)')
+    parser.add_argument('--metrics-textfile', default=None, metavar='FILE.prom',
+                        help='Keep per-conversion totals in this Prometheus text file (also served on /metrics)')
+    parser.add_argument('--stop', action='store_true', help='Stop the running daemon')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    running = DaemonClient.connect(any_version=True)
+    if args.stop:
+        if running:
+            running.shutdown()
+        return 0 if running else 1
+    if running:
+        print(f"A daemon is already running ({running.base_url})", file=sys.stderr)
+        return 1
+
+    daemon = ConversionDaemon(args.workers, max_jobs_per_worker=args.max_jobs_per_worker,
+                              metrics=MetricsRecorder(args.metrics, args.metrics_textfile))
+    token = secrets.token_urlsafe(32)
+    server = make_server(daemon, port=args.port, token=token)
+    write_state(server.server_address[1], token)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+    logging.info(f"Conversion daemon listening on http://127.0.0.1:{server.server_address[1]} "
+                 f"with {len(daemon.slots)} warm worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        try:
+            with open(STATE_PATH, 'r', encoding='utf-8') as f:
+                if json.load(f).get('pid') == os.getpid():
+                    os.remove(STATE_PATH)
+        except (OSError, ValueError):
+            pass
+        server.server_close()
+        daemon.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.expanduser("~"), '.cache', 'universal-file-converter', 'journal.sqlite')
+
+
+def input_stat(input_path):
+    """(total size, latest mtime in ns) of an input; ';'-joined paths for multi-input jobs. None if missing."""
+    size = mtime = 0
+    for path in input_path.split(';'):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        size += stat.st_size
+        mtime = max(mtime, stat.st_mtime_ns)
+    return size, mtime
+
+
+def input_hash(input_path):
+    from utils.result_cache import file_fingerprint
+    return ','.join(file_fingerprint(path) for path in input_path.split(';'))
+
+
+class BatchJournal:
+    """
+    Persistent record of batch jobs, so an interrupted batch can be resumed.
+
+    Each job's input (path, size, mtime and a sampled content hash, see file_fingerprint),
+    conversion type, options, output path and status is kept in SQLite, written as the job
+    starts and finishes. Running the same batch again skips inputs whose last run completed
+    and that have not changed since, as long as their output is still there; failed,
+    interrupted and changed inputs are converted again. Checking an input costs one stat
+    and one lookup, and its hash is only read when the size matches but the mtime does not
+    (e.g. after a copy), so restarting a large batch takes seconds.
+
+    Connections are opened lazily per thread, like ResultCache's, so instances can be handed
+    to other threads.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS jobs '
+                         '(input_path TEXT, conversion_type TEXT, options TEXT, output_path TEXT, '
+                         'size INTEGER, mtime_ns INTEGER, hash TEXT, status TEXT, error TEXT, updated_at REAL, '
+                         'PRIMARY KEY (input_path, conversion_type, options, output_path))')
+        return conn
+
+    @staticmethod
+    def _key(job):
+        options = json.dumps(job.options or {}, sort_keys=True, default=str)
+        input_path = ';'.join(os.path.abspath(path) for path in job.input_path.split(';'))
+        return input_path, job.conversion_type, options, os.path.abspath(job.output_path)
+
+    def is_done(self, job):
+        """Whether the job completed before, its input is unchanged and its output still exists."""
+        row = self.conn.execute('SELECT size, mtime_ns, hash, status FROM jobs WHERE input_path = ? AND '
+                                'conversion_type = ? AND options = ? AND output_path = ?', self._key(job)).fetchone()
+        if not row or row[3] != 'done' or not os.path.exists(job.output_path):
+            return False
+        stat = input_stat(job.input_path)
+        if stat is None or stat[0] != row[0]:
+            return False
+        if stat[1] == row[1]:
+            return True
+        # Same size but touched: unchanged if the content hash still matches
+        if row[2] and input_hash(job.input_path) == row[2]:
+            self.conn.execute('UPDATE jobs SET mtime_ns = ? WHERE input_path = ? AND conversion_type = ? AND '
+                              'options = ? AND output_path = ?', (stat[1], *self._key(job)))
+            return True
+        return False
+
+    def start(self, job):
+        stat = input_stat(job.input_path) or (None, None)
+        self.conn.execute('INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, NULL, ?, NULL, ?)',
+                          (*self._key(job), stat[0], stat[1], 'running', time.time()))
+
+    def finish(self, result):
+        """Record a BatchResult. Completed inputs are hashed now, while they are likely still in the page cache."""
+        job = result.job
+        status = 'failed' if result.error else 'done'
+        stat = input_stat(job.input_path) or (None, None)
+        digest = None
+        if not result.error:
+            try:
+                digest = input_hash(job.input_path)
+            except OSError:
+                pass
+        self.conn.execute('UPDATE jobs SET size = ?, mtime_ns = ?, hash = ?, status = ?, error = ?, updated_at = ? '
+                          'WHERE input_path = ? AND conversion_type = ? AND options = ? AND output_path = ?',
+                          (stat[0], stat[1], digest, status, result.error, time.time(), *self._key(job)))
+
+    def counts(self):
+        """Number of journaled jobs per status."""
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
@@ -0,0 +1,285 @@
+import os
+import io
+import json
+import time
+import fnmatch
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows: no CPU time of child processes
+    resource = None
+
+METRICS_DIR = os.path.join(os.path.expanduser("~"), '.cache', 'universal-file-converter', 'metrics')
+DEFAULT_JSONL_PATH = os.path.join(METRICS_DIR, 'jobs.jsonl')
+DEFAULT_PROMETHEUS_PATH = os.path.join(METRICS_DIR, 'file_converter.prom')
+DEFAULT_PROFILE_DIR = os.path.join(METRICS_DIR, 'profiles')
+DEFAULT_PORT = 9464
+
+PROFILE_MODES = ('cprofile', 'tracemalloc')
+
+
+def cpu_seconds(children=True):
+    """
+    CPU time of the calling thread plus, with `children`, that of every child process this
+    process waited for so far, so a job's CPU time includes the ffmpeg (or LibreOffice)
+    processes its converter ran. Children are process-wide: only count them for a job that
+    has the process to itself, or children of concurrent jobs are counted as well.
+    """
+    seconds = time.thread_time()
+    if resource and children:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        seconds += usage.ru_utime + usage.ru_stime
+    return seconds
+
+
+def reset_peak_rss():
+    """
+    Restart this process's peak RSS (VmHWM) from its current RSS, so peak_rss_mb gives the
+    peak since this call. Linux only; returns whether it was reset.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process since reset_peak_rss, in MB (None where unknown)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+
+def worker_id():
+    return f"{os.getpid()}/{threading.current_thread().name}"
+
+
+def _output_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(directory, name))
+                   for directory, _, names in os.walk(path) for name in names)
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def job_record(job, started_at, convert_seconds, cpu, bytes_in, error=None, cached=False, extra=None,
+               peak_rss=None):
+    """
+    The structured record of one finished job, built in the process that ran it. Phase
+    durations done before the job (e.g. a Drive download) come from `job.phases`; later
+    ones (the upload) are added with MetricsRecorder.record. `peak_rss` is the job's own
+    peak in MB, when it could be measured (see run_job).
+    """
+    phases = {phase: seconds for phase, seconds in (job.phases or {}).items() if seconds is not None}
+    phases['convert'] = convert_seconds
+    record = {
+        'time': started_at,
+        'conversion_type': job.conversion_type,
+        'input': job.input_path,
+        'output': job.output_path,
+        'status': 'error' if error else 'cached' if cached else 'ok',
+        'error': error,
+        'input_bytes': bytes_in,
+        'output_bytes': 0 if error else _output_size(job.output_path),
+        'queue_seconds': max(0.0, started_at - job.submitted_at) if job.submitted_at else 0.0,
+        'phases': phases,
+        'cpu_seconds': cpu,
+        'peak_rss_mb': peak_rss,
+        'worker': worker_id(),
+    }
+    record.update(extra or {})
+    return record
+
+
+class JobProfiler:
+    """
+    Runs chosen jobs under cProfile or tracemalloc.
+
+    A job is chosen when `match` (a glob) matches its conversion type or its input file name,
+    e.g. 'pdf_to_word' or 'scan_*.pdf'. cProfile writes a .prof file for pstats or snakeviz;
+    tracemalloc writes the top allocation sites and adds the Python heap peak to the job's
+    record. Both slow the job down, so timings of profiled jobs are not comparable.
+    """
+
+    def __init__(self, mode='cprofile', match='*', output_dir=DEFAULT_PROFILE_DIR, top=25):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Profile mode must be one of {', '.join(PROFILE_MODES)}, not '{mode}'")
+        self.mode = mode
+        self.match = match
+        self.output_dir = output_dir
+        self.top = top
+
+    def wants(self, job):
+        name = os.path.basename(job.input_path.split(';')[0])
+        return fnmatch.fnmatch(job.conversion_type, self.match) or fnmatch.fnmatch(name, self.match)
+
+    def _path(self, job, ext):
+        name = os.path.splitext(os.path.basename(job.input_path.split(';')[0]))[0]
+        os.makedirs(self.output_dir, exist_ok=True)
+        return os.path.join(self.output_dir, f"{job.conversion_type}-{name}-{os.getpid()}-{int(time.time())}{ext}")
+
+    @contextmanager
+    def profile(self, job):
+        """Profile the body of the with block; yields a dict that is filled in for the job's record."""
+        info = {}
+        if not self.wants(job):
+            yield info
+            return
+        if self.mode == 'cprofile':
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield info
+            finally:
+                profiler.disable()
+                info['profile_path'] = self._path(job, '.prof')
+                profiler.dump_stats(info['profile_path'])
+            return
+
+        import tracemalloc
+
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(10)
+        tracemalloc.reset_peak()
+        try:
+            yield info
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            info['tracemalloc_peak_mb'] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            if started:
+                tracemalloc.stop()
+            info['profile_path'] = self._path(job, '.tracemalloc.txt')
+            with open(info['profile_path'], 'w', encoding='utf-8') as f:
+                f.write(f"Peak traced memory: {info['tracemalloc_peak_mb']:.1f} MB\n")
+                for stat in snapshot.statistics('lineno')[:self.top]:
+                    f.write(f"{stat}\n")
+
+
+class MetricsRecorder:
+    """
+    Collects the per-job records (see job_record): appends each one to a JSONL file and keeps
+    per-conversion totals that are exported in the Prometheus text format, as a file (for
+    node_exporter's textfile collector) and/or over HTTP on localhost (see serve).
+
+    Records are written by the process that owns the recorder; batch workers send theirs back
+    with the job's result.
+    """
+
+    def __init__(self, jsonl_path=DEFAULT_JSONL_PATH, prometheus_path=None):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self._lock = threading.Lock()
+        self._jobs = defaultdict(int)
+        self._totals = defaultdict(float)
+        self._peak_rss = {}
+        self._server = None
+
+    def record(self, record, **phases):
+        """Write a job's record; `phases` adds durations measured after the job, e.g. upload=2.5."""
+        if not record:
+            return
+        if phases:
+            record = dict(record, phases=dict(record['phases'], **{k: v for k, v in phases.items() if v is not None}))
+        with self._lock:
+            if self.jsonl_path:
+                os.makedirs(os.path.dirname(os.path.abspath(self.jsonl_path)), exist_ok=True)
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record) + '\n')
+            conversion = record['conversion_type']
+            self._jobs[conversion, record['status']] += 1
+            for phase, seconds in record['phases'].items():
+                self._totals['phase_seconds', conversion, phase] += seconds or 0.0
+            for key in ('queue_seconds', 'cpu_seconds', 'input_bytes', 'output_bytes', 'scratch_bytes_written',
+                        'scratch_bytes_read'):
+                self._totals[key, conversion, None] += record.get(key) or 0
+            if record.get('peak_rss_mb'):
+                self._peak_rss[conversion] = max(self._peak_rss.get(conversion, 0), record['peak_rss_mb'])
+        if self.prometheus_path:
+            self.write_prometheus()
+
+    def prometheus_text(self):
+        out = io.StringIO()
+        metrics = [
+            ('file_converter_jobs_total', 'counter', 'Jobs finished, by conversion type and status'),
+            ('file_converter_phase_seconds_total', 'counter', 'Wall time spent per job phase'),
+            ('file_converter_queue_seconds_total', 'counter', 'Time jobs waited for a worker'),
+            ('file_converter_cpu_seconds_total', 'counter', 'CPU time of jobs, including child processes'),
+            ('file_converter_input_bytes_total', 'counter', 'Bytes read by jobs'),
+            ('file_converter_output_bytes_total', 'counter', 'Bytes written by jobs'),
+            ('file_converter_scratch_bytes_written_total', 'counter', 'Bytes jobs wrote to scratch space'),
+            ('file_converter_scratch_bytes_read_total', 'counter', 'Bytes jobs read from scratch space'),
+            ('file_converter_peak_rss_bytes', 'gauge', 'Highest peak RSS of a single job, where measured'),
+        ]
+        with self._lock:
+            samples = defaultdict(list)
+            for (conversion, status), count in sorted(self._jobs.items()):
+                samples['file_converter_jobs_total'].append((f'conversion="{conversion}",status="{status}"', count))
+            for (key, conversion, phase), value in sorted(self._totals.items(), key=lambda item: str(item[0])):
+                if key == 'phase_seconds':
+                    samples['file_converter_phase_seconds_total'].append(
+                        (f'conversion="{conversion}",phase="{phase}"', value))
+                else:
+                    samples[f'file_converter_{key}_total'].append((f'conversion="{conversion}"', value))
+            for conversion, rss in sorted(self._peak_rss.items()):
+                samples['file_converter_peak_rss_bytes'].append((f'conversion="{conversion}"', rss * 1024 * 1024))
+        for name, kind, help_text in metrics:
+            out.write(f"# HELP {name} {help_text}\n# TYPE {name} {kind}\n")
+            for labels, value in samples[name]:
+                out.write(f"{name}{{{labels}}} {value:g}\n")
+        return out.getvalue()
+
+    def write_prometheus(self):
+        """Replace the Prometheus text file atomically, so a scrape never reads half of it."""
+        text = self.prometheus_text()
+        os.makedirs(os.path.dirname(os.path.abspath(self.prometheus_path)), exist_ok=True)
+        temp_path = f"{self.prometheus_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, self.prometheus_path)
+
+    def serve(self, port=DEFAULT_PORT, host='127.0.0.1'):
+        """Serve the Prometheus text at http://host:port/metrics from a daemon thread."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        recorder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = recorder.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        return self._server.server_address
+
+    def close(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,84 @@
+import time
+import threading
+
+
+class ConversionCancelled(Exception):
+    """Raised inside a converter when the job it is running has been cancelled."""
+
+
+class CancelToken:
+    """Cancellation flag shared between whoever starts a job and the code running it."""
+
+    def __init__(self, event=None):
+        # Any object with set()/is_set() works, e.g. a multiprocessing.Event for worker processes
+        self._event = event or threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise ConversionCancelled("Conversion cancelled")
+
+
+class ProgressReporter:
+    """
+    Progress and cancellation callback handed to converters and editors as `progress=`.
+
+    Converters call `progress.update(done, total)` with whatever unit fits: pages for PDFs,
+    frames for video, bytes for audio and transfers. Updates are turned into a percentage
+    and passed to `callback` at most every `min_interval` seconds (plus once at 100%), so a
+    fast loop cannot flood the Qt event loop. Each update also checks the cancel token and
+    raises ConversionCancelled, which is how long jobs stop promptly.
+    """
+
+    def __init__(self, callback=None, cancel_token=None, min_interval=0.1):
+        self.callback = callback
+        self.cancel_token = cancel_token or CancelToken()
+        self.min_interval = min_interval
+        self._last_emit = 0.0
+        self._last_percent = -1
+
+    def __call__(self, done, total=None):
+        self.update(done, total)
+
+    @property
+    def cancelled(self):
+        return self.cancel_token.cancelled
+
+    def raise_if_cancelled(self):
+        self.cancel_token.raise_if_cancelled()
+
+    def update(self, done, total=None):
+        self.raise_if_cancelled()
+        if not self.callback or not total:
+            return
+        percent = max(0, min(100, int(done * 100 / total)))
+        now = time.monotonic()
+        if percent == self._last_percent:
+            return
+        if percent < 100 and now - self._last_emit < self.min_interval:
+            return
+        self._last_emit = now
+        self._last_percent = percent
+        self.callback(percent)
+
+    def moviepy_logger(self):
+        """
+        A proglog logger for moviepy's write_videofile/write_audiofile/write_gif `logger=`
+        argument, reporting encoded frames/chunks and stopping the encode on cancel.
+        """
+        from proglog import ProgressBarLogger
+
+        reporter = self
+
+        class _Logger(ProgressBarLogger):
+            def bars_callback(self, bar, attr, value, old_value=None):
+                if attr == 'index':
+                    reporter.update(value, self.bars[bar].get('total'))
+
+        return _Logger()
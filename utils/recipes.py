@@ -0,0 +1,289 @@
+import os
+import json
+import shutil
+import tempfile
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils.conversions import get_conversion, output_path_for, parse_steps, required_options
+from utils.batch_processor import BatchJob, run_job, _init_worker, _run_in_worker
+from utils.progress import ProgressReporter, ConversionCancelled
+
+# A recipe is a DAG of steps, each one a registered conversion or editing type:
+#
+#     steps:
+#       - id: trim
+#         type: trim_video
+#         options: {start_time: 5, end_time: 20}
+#       - id: small
+#         type: change_resolution
+#         input: trim                  # a step id, '$input' (the default) or a file path
+#         options: {new_resolution: [640, 360]}
+#       - id: gif
+#         type: mp4_to_gif
+#         input: small
+#
+# Steps that no other step consumes are the recipe's outputs; `output: name.ext` names the
+# file, `output: true` keeps an intermediate step's result as well. Multi-input steps
+# (merge_videos, images_to_pdf, ...) take a list as `input`.
+
+RECIPE_INPUT = '$input'
+
+Step = namedtuple('Step', ['id', 'type', 'inputs', 'options', 'output'])
+
+# A unit of execution: one step, or a chain of steps fused into one image_pipeline or
+# video_pipeline run
+Stage = namedtuple('Stage', ['id', 'conversion_type', 'inputs', 'options', 'output', 'steps'])
+
+
+def _normalize(value):
+    # Lists of numbers become tuples like CLI options do ('size: [800, 600]' -> (800, 600))
+    if isinstance(value, list) and value and all(isinstance(v, (int, float)) for v in value):
+        return tuple(value)
+    return value
+
+
+def _fusion(step):
+    """
+    The pipeline type a step can be fused into: 'image_pipeline' (in-memory ImagePipeline),
+    'video_pipeline' (one ffmpeg invocation), or None.
+    """
+    from utils.conversions import IMAGE, IMAGE_EDITOR
+    from converters.ffmpeg_engine import OPERATIONS as VIDEO_OPERATIONS
+
+    conversion = get_conversion(step.type)
+    if step.type in ('compress_image', 'image_pipeline'):
+        return 'image_pipeline'
+    if step.type in VIDEO_OPERATIONS or step.type == 'video_pipeline':
+        return 'video_pipeline' if step.options.get('engine') != 'moviepy' else None
+    if conversion.backend == IMAGE_EDITOR:
+        if step.type in ('resize_image', 'rotate_image', 'flip_image', 'convert_to_grayscale', 'add_watermark'):
+            return 'image_pipeline'
+        return None
+    if conversion.backend == IMAGE and conversion.output_ext is not None and 'inputs' not in conversion.args:
+        return 'image_pipeline'
+    return None
+
+
+class Recipe:
+    """A validated multi-step job. Load one with Recipe.load(path) or Recipe.from_dict(data)."""
+
+    def __init__(self, steps, name=None):
+        self.name = name
+        self.steps = []
+        ids = set()
+        for index, raw in enumerate(steps):
+            if not isinstance(raw, dict) or 'type' not in raw:
+                raise ValueError(f"Recipe step {index + 1} needs a 'type'")
+            step_id = str(raw.get('id') or raw['type'])
+            if step_id in ids or step_id == RECIPE_INPUT:
+                raise ValueError(f"Duplicate recipe step id '{step_id}'")
+            ids.add(step_id)
+            get_conversion(raw['type'])  # Raises ValueError for unknown types
+            inputs = raw.get('input', RECIPE_INPUT)
+            inputs = [str(i) for i in inputs] if isinstance(inputs, list) else [str(inputs)]
+            options = {key: _normalize(value) for key, value in (raw.get('options') or {}).items()}
+            missing = [name for name in required_options(raw['type']) if name not in options]
+            if missing:
+                raise ValueError(f"Recipe step '{step_id}' ({raw['type']}) is missing option(s): {', '.join(missing)}")
+            self.steps.append(Step(step_id, raw['type'], inputs, options, raw.get('output')))
+        if not self.steps:
+            raise ValueError("A recipe needs at least one step")
+        self.by_id = {step.id: step for step in self.steps}
+        self.order = self._topological_order()
+
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, list):
+            return cls(data)
+        return cls(data.get('steps') or [], data.get('name'))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.lower().endswith('.json'):
+                data = json.load(f)
+            else:
+                import yaml
+                data = yaml.safe_load(f)
+        return cls.from_dict(data or {})
+
+    def dependencies(self, step):
+        return [i for i in step.inputs if i in self.by_id]
+
+    def consumers(self, step_id):
+        return [step for step in self.steps if step_id in step.inputs]
+
+    def _topological_order(self):
+        order, state = [], {}
+
+        def visit(step, path):
+            if state.get(step.id) == 'done':
+                return
+            if state.get(step.id) == 'visiting':
+                raise ValueError(f"Recipe steps form a cycle: {' -> '.join(path + [step.id])}")
+            state[step.id] = 'visiting'
+            for dependency in self.dependencies(step):
+                visit(self.by_id[dependency], path + [step.id])
+            state[step.id] = 'done'
+            order.append(step)
+
+        for step in self.steps:
+            visit(step, [])
+        return order
+
+    def input_exts(self):
+        """Extensions the recipe input may have: those of the first step reading it."""
+        for step in self.order:
+            if RECIPE_INPUT in step.inputs:
+                return get_conversion(step.type).input_exts
+        return ()
+
+    def stages(self):
+        """
+        Group the steps into stages. A chain of image steps where each one only feeds the
+        next is fused into a single image_pipeline stage, so the image is decoded once and
+        intermediates never touch the disk. Chains of video edits are fused the same way into
+        a video_pipeline stage, which runs as one ffmpeg command.
+        """
+        stages = []
+        stage_of = {}
+        for step in self.order:
+            dependencies = self.dependencies(step)
+            fusion = _fusion(step) if len(step.inputs) == 1 and dependencies else None
+            if fusion:
+                previous = stages[stage_of[dependencies[0]]]
+                producer = self.by_id[dependencies[0]]
+                if (previous.id == producer.id and _fusion(producer) == fusion and not producer.output
+                        and len(self.consumers(producer.id)) == 1):
+                    steps = previous.steps + [step]
+                    stages[stage_of[dependencies[0]]] = self._pipeline_stage(fusion, steps, previous.inputs)
+                    stage_of[step.id] = stage_of[dependencies[0]]
+                    continue
+            stage_of[step.id] = len(stages)
+            stages.append(Stage(step.id, step.type, step.inputs, step.options, step.output, [step]))
+        return stages
+
+    @staticmethod
+    def _pipeline_stage(pipeline_type, steps, inputs):
+        pipeline_steps = []
+        for step in steps:
+            if step.type == pipeline_type:
+                pipeline_steps += parse_steps(step.options['steps'])
+            else:
+                pipeline_steps.append((step.type, step.options))
+        last = steps[-1]
+        return Stage(last.id, pipeline_type, inputs, {'steps': pipeline_steps}, last.output, steps)
+
+
+def _output_name(stage, stage_input, recipe_input, output_dir):
+    """'<recipe input name>_<step id><ext>' in `output_dir`, unless the step names its output."""
+    if isinstance(stage.output, str):
+        return os.path.join(output_dir, stage.output)
+    name = os.path.splitext(os.path.basename(recipe_input.split(';')[0]))[0]
+    ext = os.path.splitext(output_path_for(stage.conversion_type, stage_input, output_dir, stage.options))[1]
+    return os.path.join(output_dir, f"{name}_{stage.id}{ext}")
+
+
+def run_recipe(recipe, input_path, output_dir, workers=None, cache=None, progress=None, on_stage=None):
+    """
+    Run `recipe` on `input_path`, writing its outputs into `output_dir`. Returns a dict of
+    step id -> output path for every output step.
+
+    Stages whose inputs are ready run concurrently: heavy ones in a process pool, light ones
+    in threads, as in BatchProcessor. Intermediate results live in a temporary directory and
+    are deleted as soon as their last consumer has finished. `on_stage(stage, result)` is
+    called with each BatchResult; the first failure cancels the rest and raises RuntimeError.
+    """
+    progress = progress or ProgressReporter()
+    stages = recipe.stages()
+    by_id = {stage.id: stage for stage in stages}
+    stage_of_step = {step.id: stage.id for stage in stages for step in stage.steps}
+    consumers = {stage.id: [] for stage in stages}
+    for stage in stages:
+        for source in stage.inputs:
+            if source in stage_of_step:
+                consumers[stage_of_step[source]].append(stage.id)
+    os.makedirs(output_dir, exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    context = multiprocessing.get_context('spawn')
+    cancel_event = context.Event()
+    work = tempfile.mkdtemp(prefix='recipe-')
+    paths = {}
+    outputs = {}
+    remaining_uses = {stage_id: len(users) for stage_id, users in consumers.items()}
+    pending = {}
+    done = set()
+
+    def resolve(source):
+        if source == RECIPE_INPUT:
+            return input_path
+        if source in stage_of_step:
+            return paths[stage_of_step[source]]
+        return source  # An external file, e.g. a second video to merge
+
+    def output_for(stage, stage_input):
+        if stage.output or not consumers[stage.id]:
+            return _output_name(stage, stage_input, input_path, output_dir)
+        ext = os.path.splitext(output_path_for(stage.conversion_type, stage_input, work, stage.options))[1]
+        return os.path.join(work, stage.id + ext)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(cancel_event,)) as processes, \
+                ThreadPoolExecutor(max_workers=workers) as threads:
+            while len(done) < len(stages):
+                if progress.cancelled:
+                    cancel_event.set()
+                    for future in pending:
+                        future.cancel()
+                    progress.raise_if_cancelled()
+                for stage in stages:
+                    if stage.id in done or stage.id in pending.values():
+                        continue
+                    if any(stage_of_step[s] not in done for s in stage.inputs if s in stage_of_step):
+                        continue
+                    stage_input = ';'.join(resolve(source) for source in stage.inputs)
+                    paths[stage.id] = output_for(stage, stage_input)
+                    job = BatchJob(stage.conversion_type, stage_input, paths[stage.id], stage.options)
+                    if get_conversion(stage.conversion_type).heavy:
+                        future = processes.submit(_run_in_worker, job, cache)
+                    else:
+                        future = threads.submit(run_job, job, cache, progress)
+                    pending[future] = stage.id
+
+                finished, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = by_id[pending.pop(future)]
+                    result = future.result()
+                    if on_stage:
+                        on_stage(stage, result)
+                    if result.error:
+                        cancel_event.set()
+                        for other in pending:
+                            other.cancel()
+                        if result.error == 'Cancelled':
+                            raise ConversionCancelled("Recipe cancelled")
+                        raise RuntimeError(f"Recipe step '{stage.id}' ({stage.conversion_type}) failed: {result.error}")
+                    done.add(stage.id)
+                    if stage.output or not consumers[stage.id]:
+                        outputs[stage.id] = paths[stage.id]
+                    for source in set(stage.inputs):
+                        source_stage = stage_of_step.get(source)
+                        if source_stage is None:
+                            continue
+                        remaining_uses[source_stage] -= 1
+                        if remaining_uses[source_stage] == 0 and paths[source_stage].startswith(work):
+                            _remove(paths[source_stage])
+                    progress.update(len(done), len(stages))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return outputs
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+from utils.conversions import select_backend
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), '.cache', 'universal-file-converter', 'results')
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Bump a backend's version here whenever a change to it alters the output it produces,
+# so results cached from the old code are no longer served.
+BACKEND_VERSIONS = {}
+
+
+def file_md5(path, chunk_size=1024 * 1024):
+    """MD5 of a file's content. MD5 is what Drive reports as md5Checksum, so keys match."""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path, sample_size=1024 * 1024):
+    """
+    Quick content hash for large media: MD5 of the size and of samples from the start,
+    middle and end, so multi-gigabyte videos are identified without reading them whole.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.md5(str(size).encode())
+    with open(path, 'rb') as f:
+        for offset in sorted({0, max(0, size // 2 - sample_size // 2), max(0, size - sample_size)}):
+            f.seek(offset)
+            digest.update(f.read(sample_size))
+    return digest.hexdigest()
+
+
+def converter_version(conversion_type, options=None):
+    backend = select_backend(conversion_type, options)
+    return f"{'.'.join(backend)}:{BACKEND_VERSIONS.get(backend, '1')}"
+
+
+def _link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+class ResultCache:
+    """
+    On-disk cache of conversion outputs keyed by (input content hash, conversion type,
+    options, converter version), with size-bounded LRU eviction.
+
+    The index lives in SQLite so batch worker processes can share one cache. Connections
+    are opened lazily per thread, which also keeps instances picklable for the process pool.
+    Outputs are hard-linked in and out of the cache where the filesystem allows it, so
+    outputs served from the cache should be replaced rather than edited in place.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            conn = self._local.conn = sqlite3.connect(os.path.join(self.cache_dir, 'index.sqlite'),
+                                                      timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS entries '
+                         '(key TEXT PRIMARY KEY, path TEXT, size INTEGER, last_used REAL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)')
+        return conn
+
+    def make_key(self, conversion_type, input_hash, options=None):
+        """Cache key for an input whose content hash (MD5) is already known, e.g. from Drive."""
+        normalized = json.dumps(options or {}, sort_keys=True, default=str)
+        raw = '\0'.join([input_hash, conversion_type, normalized, converter_version(conversion_type, options)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def key_for_input(self, conversion_type, input_path, options=None):
+        """Cache key for a local input path (';'-joined paths for multi-input conversions)."""
+        input_hash = ','.join(file_md5(path) for path in input_path.split(';'))
+        return self.make_key(conversion_type, input_hash, options)
+
+    def _count(self, name):
+        self.conn.execute('INSERT INTO stats (name, value) VALUES (?, 1) '
+                          'ON CONFLICT(name) DO UPDATE SET value = value + 1', (name,))
+
+    def contains(self, key):
+        row = self.conn.execute('SELECT path FROM entries WHERE key = ?', (key,)).fetchone()
+        return row is not None and os.path.isfile(row[0])
+
+    def fetch(self, key, output_path):
+        """Place the cached output for `key` at `output_path`. Returns False on a miss."""
+        row = self.conn.execute('SELECT path FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None or not os.path.isfile(row[0]):
+            if row is not None:
+                self.conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._count('misses')
+            return False
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        if os.path.lexists(output_path):
+            os.remove(output_path)
+        _link_or_copy(row[0], output_path)
+        self.conn.execute('UPDATE entries SET last_used = ? WHERE key = ?', (time.time(), key))
+        self._count('hits')
+        return True
+
+    def store(self, key, output_path):
+        """Add a finished output to the cache. Directories (multi-file outputs) are not cached."""
+        if not os.path.isfile(output_path):
+            return False
+        cache_path = os.path.join(self.cache_dir, key[:2], key + os.path.splitext(output_path)[1])
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        _link_or_copy(output_path, temp_path)
+        os.replace(temp_path, cache_path)
+        self.conn.execute('INSERT OR REPLACE INTO entries (key, path, size, last_used) VALUES (?, ?, ?, ?)',
+                          (key, cache_path, os.path.getsize(cache_path), time.time()))
+        self.evict()
+        return True
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, path, size in self.conn.execute(
+                'SELECT key, path, size FROM entries ORDER BY last_used').fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total -= size
+
+    def stats(self):
+        counts = dict(self.conn.execute('SELECT name, value FROM stats').fetchall())
+        entries, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        hits, misses = counts.get('hits', 0), counts.get('misses', 0)
+        return {'hits': hits, 'misses': misses, 'entries': entries, 'bytes': size,
+                'hit_rate': hits / (hits + misses) if hits + misses else 0.0}
@@ -0,0 +1,246 @@
+import os
+import time
+import errno
+import shutil
+import logging
+import tempfile
+import threading
+import itertools
+
+try:
+    import fcntl
+except ImportError:  # Windows: a file another process has open cannot be deleted, which serves as the lock
+    fcntl = None
+
+# Point TMPDIR at a tmpfs or NVMe volume to move scratch space there
+DEFAULT_SCRATCH_ROOT = os.path.join(tempfile.gettempdir(), 'universal-file-converter-scratch')
+DEFAULT_RESERVE_BYTES = 256 * 1024 * 1024  # Always left free on the scratch volume
+GRACE_SECONDS = 60.0  # Leftovers younger than this may belong to a process that is still setting up
+ADMIT_POLL_SECONDS = 1.0  # How often a waiting job looks at the free space again (other processes free it too)
+
+
+class ScratchSpaceFull(OSError):
+    """Raised when a job cannot be admitted because the scratch volume does not have room for it."""
+
+
+def _claim(lock_path):
+    """Whether the process owning `lock_path` is gone; its lock file is removed if so."""
+    if fcntl is None:
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return False
+        return True
+    try:
+        fd = os.open(lock_path, os.O_RDWR)
+    except FileNotFoundError:
+        return True
+    except OSError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    try:
+        os.remove(lock_path)
+    except OSError:
+        pass
+    os.close(fd)
+    return True
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class ScratchJob:
+    """
+    A job's own directory in a ScratchSpace. It is reference-counted: created with one
+    reference, `acquire` adds one for each further user (e.g. an upload of the output) and the
+    directory is removed when the last `release` drops it. `count_written` and `count_read`
+    add a file's size to the job's `bytes_written` and `bytes_read`.
+    """
+
+    def __init__(self, space, path, expected_bytes):
+        self.space = space
+        self.path = path
+        self.expected_bytes = expected_bytes
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self._refs = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    @property
+    def outstanding(self):
+        """Admitted bytes not written yet, which the free space does not show."""
+        return max(0, self.expected_bytes - self.bytes_written)
+
+    def path_for(self, name):
+        return os.path.join(self.path, os.path.basename(name))
+
+    def acquire(self):
+        with self.space._condition:
+            if self._refs <= 0:
+                raise RuntimeError(f"Scratch job {self.path} was already removed")
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self.space._condition:
+            self._refs -= 1
+            if self._refs != 0:
+                return
+        self.space._remove(self)
+
+    def count_written(self, path):
+        size = _size(path)
+        with self.space._condition:
+            self.bytes_written += size
+        return size
+
+    def count_read(self, path):
+        size = _size(path)
+        with self.space._condition:
+            self.bytes_read += size
+        return size
+
+
+class ScratchSpace:
+    """
+    Per-job temporary directories under `root` (DEFAULT_SCRATCH_ROOT, on the volume TMPDIR
+    points to, by default), for files such as Drive downloads that only live as long as the
+    job. Each job gets a directory of its own, so inputs with the same name never collide.
+
+    Before a job is created, its expected size is checked against the free space of the
+    volume, minus `reserve_bytes` and what jobs admitted earlier are still going to write.
+    A job that does not fit waits for other jobs to be released, and ScratchSpaceFull is
+    raised if it cannot fit at all (or not within `timeout`).
+
+    Each process works in a directory of its own, next to a lock file it holds while it
+    runs. When a ScratchSpace is first used, it removes the directories of processes that
+    are gone (e.g. crashed) without cleaning up. `close` removes everything that is left.
+    """
+
+    def __init__(self, root=DEFAULT_SCRATCH_ROOT, reserve_bytes=DEFAULT_RESERVE_BYTES):
+        self.root = root
+        self.reserve_bytes = reserve_bytes
+        self._condition = threading.Condition()
+        self._counter = itertools.count(1)
+        self._jobs = set()
+        self._path = None
+        self._owner = None
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _area(self):
+        if self._closed:
+            raise RuntimeError(f"Scratch space {self.root} is closed")
+        if self._path is None:
+            os.makedirs(self.root, exist_ok=True)
+            self.clean_stale()
+            self._path = tempfile.mkdtemp(prefix=f'{os.getpid()}-', dir=self.root)
+            self._owner = open(self._path + '.lock', 'w')
+            if fcntl is not None:
+                fcntl.flock(self._owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return self._path
+
+    def _fits(self, expected_bytes):
+        free = shutil.disk_usage(self.root).free - self.reserve_bytes
+        return free - sum(job.outstanding for job in self._jobs) >= expected_bytes
+
+    def job(self, expected_bytes=0, timeout=None):
+        """
+        A new ScratchJob, admitted once `expected_bytes` (e.g. the size of a download) fit on
+        the scratch volume. Waits up to `timeout` seconds (forever if None) while other jobs
+        hold the space.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            area = self._area()
+            if expected_bytes > shutil.disk_usage(self.root).total - self.reserve_bytes:
+                raise ScratchSpaceFull(errno.ENOSPC, f"{expected_bytes} bytes will never fit in {self.root}")
+            while expected_bytes and not self._fits(expected_bytes):
+                now = time.monotonic()
+                # With no jobs of ours to wait for, only other processes could free the space
+                if not self._jobs or (deadline is not None and now >= deadline):
+                    raise ScratchSpaceFull(errno.ENOSPC, f"Not enough free space in {self.root} "
+                                                         f"for {expected_bytes} bytes")
+                self._condition.wait(ADMIT_POLL_SECONDS if deadline is None
+                                     else min(ADMIT_POLL_SECONDS, deadline - now))
+                area = self._area()
+            path = os.path.join(area, f'job-{next(self._counter)}')
+            os.mkdir(path)
+            job = ScratchJob(self, path, expected_bytes)
+            self._jobs.add(job)
+        return job
+
+    def _remove(self, job):
+        shutil.rmtree(job.path, ignore_errors=True)
+        logging.debug(f"Scratch job {job.path}: {job.bytes_written} bytes written, {job.bytes_read} read")
+        with self._condition:
+            self._jobs.discard(job)
+            self._condition.notify_all()
+
+    def clean_stale(self):
+        """Remove what processes that are gone left under the root. Returns the number of directories removed."""
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return 0
+        now = time.time()
+        removed = 0
+        for entry in entries:
+            try:
+                if now - entry.stat(follow_symlinks=False).st_mtime < GRACE_SECONDS:
+                    continue
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if entry.name.endswith('.lock'):
+                if not os.path.isdir(entry.path[:-len('.lock')]):
+                    _claim(entry.path)
+            elif is_dir and entry.path != self._path and _claim(entry.path + '.lock'):
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        if removed:
+            logging.info(f"Removed {removed} scratch director{'y' if removed == 1 else 'ies'} left in {self.root}")
+        return removed
+
+    def stop(self):
+        """Stop admitting jobs: those waiting for space fail, and so does every later `job` call."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def close(self):
+        """Stop admitting jobs (those still waiting fail) and remove this process's scratch files."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            self._jobs.clear()
+            path, self._path = self._path, None
+            owner, self._owner = self._owner, None
+        if path:
+            shutil.rmtree(path, ignore_errors=True)
+        if owner:
+            owner.close()
+            try:
+                os.remove(path + '.lock')
+            except OSError:
+                pass
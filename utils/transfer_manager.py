@@ -0,0 +1,153 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from utils.progress import CancelToken, ProgressReporter
+
+
+class TransferManager:
+    """
+    Runs Google Drive downloads and uploads in background thread pools.
+
+    Each worker thread gets its own authenticated client (see GoogleDriveIntegration.clone)
+    and keeps reusing it, so connections are not rebuilt for every file. Downloads are
+    prefetched ahead of the conversions that consume them and uploads start as soon as an
+    output is ready, so network I/O overlaps with conversion work. How long each transfer
+    took is kept in `download_seconds` and `upload_seconds` (by local path) for job metrics.
+    `cancel_downloads` and `cancel_uploads` stop what is left when a batch ends early.
+    """
+
+    def __init__(self, gdrive, max_downloads=4, max_uploads=4, prefetch=None):
+        self.gdrive = gdrive
+        if not gdrive.service:
+            gdrive.authenticate()
+        self.prefetch = prefetch or max_downloads * 2
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._downloads = ThreadPoolExecutor(max_workers=max_downloads, thread_name_prefix='drive-download')
+        self._uploads = ThreadPoolExecutor(max_workers=max_uploads, thread_name_prefix='drive-upload')
+        self._upload_futures = []
+        self._cancel = CancelToken()  # Checked by running downloads after every chunk
+        self.uploaded = 0
+        self.upload_errors = 0
+        self.download_seconds = {}
+        self.upload_seconds = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(wait=exc_type is None)
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.gdrive.clone()
+        return client
+
+    def _download(self, file_id, file_path, revision=None):
+        started = time.monotonic()
+        progress = ProgressReporter(cancel_token=self._cancel)
+        if self._client().download_file(file_id, file_path, progress=progress, revision=revision) is None:
+            raise IOError(f"Download of Drive file {file_id} failed")
+        with self._lock:
+            self.download_seconds[file_path] = time.monotonic() - started
+        return file_path
+
+    def _download_to(self, file, path_for):
+        from utils.cloud_integration import file_revision
+
+        self._cancel.raise_if_cancelled()  # Before `path_for`, which may wait for scratch space
+        return self._download(file['id'], path_for(file), file_revision(file))
+
+    def _upload(self, file_path, folder_id, after=None):
+        started = time.monotonic()
+        try:
+            file_id = self._client().upload_file(file_path, folder_id)
+            error = None if file_id else f"Upload of {file_path} failed"
+        except Exception as e:
+            file_id, error = None, f"Upload of {file_path} failed: {e}"
+        with self._lock:
+            self.upload_seconds[file_path] = time.monotonic() - started
+            if error:
+                self.upload_errors += 1
+            else:
+                self.uploaded += 1
+        if after:
+            try:
+                after(error)
+            except Exception as e:
+                logging.error(f"Error after uploading {file_path}: {e}")
+        if error:
+            raise IOError(error)
+        return file_id
+
+    def download(self, file_id, file_path, revision=None):
+        """Start downloading `file_id` to `file_path`. Returns a Future resolving to the path."""
+        return self._downloads.submit(self._download, file_id, file_path, revision)
+
+    def upload(self, file_path, folder_id=None, after=None):
+        """
+        Start uploading `file_path` into `folder_id`. Returns a Future resolving to the new file
+        ID. `after(error)` is called on the upload thread once the upload is over (`error` is
+        None if it succeeded), before the Future resolves, so wait_for_uploads waits for it too.
+        """
+        future = self._uploads.submit(self._upload, file_path, folder_id, after)
+        with self._lock:
+            self._upload_futures = [f for f in self._upload_futures if not f.done()]
+            self._upload_futures.append(future)
+        return future
+
+    def iter_downloads(self, files, path_for, idle_timeout=None):
+        """
+        Download Drive `files` (dicts with 'id' and 'name') to `path_for(file)`, keeping up to
+        `prefetch` transfers in flight. Yields (file, local_path, error) as each one finishes,
+        so callers can start converting while the rest are still downloading. `path_for` is
+        called on the download thread, so it may block (e.g. waiting for scratch space).
+        With `idle_timeout`, yields None whenever no download finished within that many seconds.
+        """
+        files = iter(files)
+        pending = {}
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < self.prefetch:
+                file = next(files, None)
+                if file is None:
+                    exhausted = True
+                    break
+                pending[self._downloads.submit(self._download_to, file, path_for)] = file
+            if not pending:
+                return
+            done, _ = wait(pending, timeout=idle_timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                yield None
+            for future in done:
+                file = pending.pop(future)
+                error = future.exception()
+                yield file, None if error else future.result(), error
+
+    def wait_for_uploads(self):
+        """Block until every upload started so far has finished. Returns (uploaded, failed)."""
+        with self._lock:
+            futures = list(self._upload_futures)
+        wait(futures)
+        return self.uploaded, self.upload_errors
+
+    def cancel_downloads(self):
+        """
+        Stop downloading: queued downloads never start and running ones fail with
+        ConversionCancelled after their current chunk, leaving their '.part' file behind.
+        """
+        self._cancel.cancel()
+        self._downloads.shutdown(wait=False, cancel_futures=True)
+
+    def cancel_uploads(self):
+        """Drop the uploads that have not started yet (their `after` is never called). Returns how many."""
+        with self._lock:
+            futures = list(self._upload_futures)
+        return sum(future.cancel() for future in futures)
+
+    def shutdown(self, wait=True):
+        self._downloads.shutdown(wait=wait, cancel_futures=not wait)
+        self._uploads.shutdown(wait=wait)
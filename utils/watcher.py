@@ -0,0 +1,231 @@
+import os
+import sys
+import time
+import errno
+import struct
+import select
+import logging
+import ctypes
+import ctypes.util
+from utils.batch_processor import BatchJob
+from utils.conversions import accepts, output_path_for
+
+SETTLE_SECONDS = 0.25  # A file must be quiet this long before it is converted
+OPEN_TIMEOUT = 30.0  # ...or this long if its writer never closed it
+POLL_INTERVAL = 1.0  # Directory scans without inotify
+RESCAN_INTERVAL = 60.0  # Safety-net scans with inotify (e.g. changes made by another host on a network share)
+
+# inotify(7)
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+              | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def _inotify_watch(directory):
+    """A non-blocking inotify descriptor watching `directory`, or None where inotify is unavailable."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        logging.warning(f"inotify unavailable: {os.strerror(ctypes.get_errno())}")
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+        # e.g. ENOSPC when fs.inotify.max_user_watches is used up
+        logging.warning(f"Cannot watch {directory} with inotify: {os.strerror(ctypes.get_errno())}")
+        os.close(fd)
+        return None
+    return fd
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class FolderWatcher:
+    """
+    Watches a directory for files that are new or modified, with inotify where available and
+    by scanning it with FileHandler.list_files_in_directory otherwise.
+
+    A changed file is only handed out once it has settled: its size and modification time
+    have stayed the same for `settle` seconds and, with inotify, its writer has closed it (or
+    been quiet for OPEN_TIMEOUT). Files whose size and mtime are the same as when they were
+    last handed out are not handed out again. Hidden files (e.g. the converters' own partial
+    outputs) are ignored.
+
+    State is kept per file currently in the directory and dropped when a file goes away, so
+    memory stays flat however long the watcher runs.
+    """
+
+    def __init__(self, directory, settle=SETTLE_SECONDS, poll_interval=POLL_INTERVAL, include_existing=False,
+                 use_inotify=True):
+        if not os.path.isdir(directory):
+            raise NotADirectoryError(f"Not a directory: {directory}")
+        self.directory = directory
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self._known = {}  # path -> signature when last handed out
+        self._pending = {}  # path -> [signature, last change (monotonic), closed by its writer]
+        # Watch before listing, so nothing created in between is missed
+        self._fd = _inotify_watch(directory) if use_inotify else None
+        if self._fd is None:
+            logging.info(f"Polling {directory} every {poll_interval:g}s")
+        self._scan(initial=not include_existing)
+
+    @property
+    def using_inotify(self):
+        return self._fd is not None
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def changes(self, timeout=None):
+        """
+        Paths of the files that have settled since the last call, waiting up to `timeout`
+        seconds (forever if None) for at least one. Returns an empty list on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            ready = self._ready()
+            now = time.monotonic()
+            if ready or (deadline is not None and now >= deadline):
+                return ready
+            wait = self._next_scan - now
+            for signature, changed, closed in self._pending.values():
+                wait = min(wait, changed + (self.settle if closed else OPEN_TIMEOUT) - now)
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            self._wait(max(0.01, wait))
+
+    def _wait(self, seconds):
+        if self._fd is not None:
+            readable, _, _ = select.select([self._fd], [], [], seconds)
+            if readable:
+                self._read_events()
+        else:
+            time.sleep(seconds)
+        if time.monotonic() >= self._next_scan:
+            self._scan()
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return
+            raise
+        now = time.monotonic()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0'))
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped: find out what changed by looking
+                self._scan()
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                logging.warning(f"{self.directory} was removed or moved, polling for it instead")
+                self.close()
+                self._next_scan = now
+                return
+            if mask & IN_ISDIR or not name or name.startswith('.'):
+                continue
+            path = os.path.join(self.directory, name)
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self._known.pop(path, None)
+                self._pending.pop(path, None)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._pending[path] = [_signature(path), now, True]
+            else:
+                self._pending[path] = [_signature(path), now, False]
+
+    def _scan(self, initial=False):
+        from utils.file_handler import FileHandler
+
+        now = time.monotonic()
+        self._next_scan = now + (RESCAN_INTERVAL if self._fd is not None else self.poll_interval)
+        try:
+            paths = [path for path in FileHandler.list_files_in_directory(self.directory)
+                     if not os.path.basename(path).startswith('.')]
+        except OSError as e:
+            logging.warning(f"Cannot list {self.directory}: {e}")
+            return
+        present = set(paths)
+        for table in (self._known, self._pending):
+            for path in [path for path in table if path not in present]:
+                del table[path]
+        for path in paths:
+            signature = _signature(path)
+            if initial:
+                self._known[path] = signature
+            elif signature != self._known.get(path):
+                entry = self._pending.get(path)
+                if entry is None or entry[0] != signature:
+                    # A scan cannot tell whether the writer is done; settling is all there is
+                    self._pending[path] = [signature, now, True]
+
+    def _ready(self):
+        now = time.monotonic()
+        ready = []
+        for path, entry in list(self._pending.items()):
+            signature, changed, closed = entry
+            if now - changed < (self.settle if closed else OPEN_TIMEOUT):
+                continue
+            current = _signature(path)
+            if current is None:
+                del self._pending[path]
+            elif current != signature:
+                # Still growing
+                entry[0], entry[1] = current, now
+            else:
+                del self._pending[path]
+                if self._known.get(path) != current:
+                    self._known[path] = current
+                    ready.append(path)
+        return sorted(ready)
+
+
+def watch_jobs(watcher, conversion_type, output_dir, options=None, idle_timeout=0.2):
+    """
+    BatchJobs converting each file the watcher hands out, for BatchProcessor.run. Never ends;
+    yields None while nothing is ready so the processor can report finished jobs (stop it with
+    BatchProcessor.cancel).
+    """
+    while True:
+        queued = False
+        for path in watcher.changes(idle_timeout):
+            if accepts(conversion_type, path):
+                queued = True
+                yield BatchJob(conversion_type, path, output_path_for(conversion_type, path, output_dir, options),
+                               options)
+        if not queued:
+            yield None